@@ -0,0 +1,60 @@
+import asyncio
+import atexit
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+# The same default as the event loop's own executor, but shared by every pack so the total is bounded
+DEFAULT_MAX_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+
+_lock = threading.Lock()
+_max_workers = DEFAULT_MAX_WORKERS
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """The thread pool that packs use for blocking work in their async code paths."""
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=_max_workers, thread_name_prefix="autopack-blocking")
+        return _executor
+
+
+def configure_executor(max_workers: int = DEFAULT_MAX_WORKERS):
+    """Change how many blocking calls can run at once. Calls already running on the old pool are allowed to finish."""
+    global _executor, _max_workers
+    if max_workers < 1:
+        raise ValueError("max_workers must be at least 1")
+
+    with _lock:
+        _max_workers = max_workers
+        previous, _executor = _executor, None
+
+    if previous:
+        previous.shutdown(wait=False)
+
+
+def shutdown_executor():
+    global _executor
+    with _lock:
+        previous, _executor = _executor, None
+
+    if previous:
+        previous.shutdown(wait=False, cancel_futures=True)
+
+
+async def run_blocking(func: Callable[..., T], *args, **kwargs) -> T:
+    """Run a blocking function on the shared thread pool without blocking the event loop. Like `asyncio.to_thread`,
+    context variables are carried over to the worker thread."""
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, func, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(get_executor(), call)
+
+
+atexit.register(shutdown_executor)
@@ -0,0 +1,304 @@
+"""
+Latency, throughput and memory benchmarks for every official pack, run against the local stand-ins in
+benchmarks/stand_ins.py instead of live services. Run with `python -m benchmarks.bench_packs`.
+
+Each pack is timed through `run` and `arun` (p50 and p99 over --rounds calls), then `arun` is called --concurrency at a
+time to measure throughput. --phases also prints where each pack's time went. Pass --save-baseline to record the
+results in benchmarks/baselines.json, and --check to exit with an error if any pack got slower than its baseline by
+more than --tolerance.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from contextlib import ExitStack
+from dataclasses import asdict, dataclass
+from functools import partial
+from pathlib import Path
+from typing import Callable, Optional
+from unittest.mock import patch
+
+import wikipedia.wikipedia
+from autopack import Pack
+from autopack.pack_config import PackConfig
+
+from benchmarks.harness import (
+    BASELINES_PATH,
+    DEFAULT_TOLERANCE,
+    BenchmarkResult,
+    ameasure,
+    athroughput,
+    find_regressions,
+    load_baselines,
+    measure,
+    peak_rss_mb,
+    save_baselines,
+)
+from benchmarks.stand_ins import StandInServer, fake_allm, fake_llm
+from browser_pool import close_browser_pool, configure_browser_pool, get_browser_pool
+from disk_usage import DiskUsage
+from extract_information_from_webpage.extract_information_from_webpage import ExtractInformationFromWebpage
+from filesystem.delete_file import DeleteFile
+from filesystem.list_files import ListFiles
+from filesystem.read_file import ReadFile
+from filesystem.write_file import WriteFile
+from get_webpage_html_content.get_webpage_html_content import GetWebpageHtmlContent
+from google_search import GoogleSearch
+from http_client import aclose_http_clients, close_http_clients
+from http_request.http_request import HttpRequest
+from instrumentation import InMemorySink, add_sink, remove_sink
+from os_info.os_info import OSInfo
+from rate_limiting import HostLimits, configure_scheduler
+from wikipedia_summarize import WikipediaPack
+from wolframalpha_query import WolframAlphaQuery
+from write_python_code.write_python_file import WritePythonCode
+
+DEFAULT_ROUNDS = 30
+DEFAULT_CONCURRENCY = 16
+# Seconds every stand-in service, and the fake LLM, takes to respond
+DEFAULT_LATENCY = 0.02
+# Throughput is measured over this many batches of --concurrency calls
+THROUGHPUT_BATCHES = 4
+
+PYTHON_SOURCE = "\n\n".join(
+    f"def function_{i}(values):\n    total = 0\n    for value in values:\n        total += value * {i}\n    return total"
+    for i in range(100)
+)
+
+
+@dataclass
+class Case:
+    name: str
+    # Builds the pack to benchmark, given the stand-in server and the simulated latency
+    make_pack: Callable[[StandInServer, float], Pack]
+    # The keyword arguments for call number i. Every call gets different arguments so caches don't hide the work.
+    arguments: Callable[[StandInServer, int], dict]
+    needs_browser: bool = False
+
+
+def _write_workspace_file(name: str, content: str) -> str:
+    with open(os.path.join(PackConfig.global_config().workspace_path, name), "w") as f:
+        f.write(content)
+    return name
+
+
+def _llm_kwargs(latency: float) -> dict:
+    return {"llm": partial(fake_llm, latency=latency), "allm": partial(fake_allm, latency=latency)}
+
+
+CASES = [
+    Case("os_info", lambda server, latency: OSInfo(), lambda server, i: {}),
+    Case("disk_usage", lambda server, latency: DiskUsage(), lambda server, i: {}),
+    Case(
+        "http_request",
+        lambda server, latency: HttpRequest(),
+        lambda server, i: {"url": f"{server.base_url}/json?q={i}"},
+    ),
+    Case(
+        "get_webpage_html_content",
+        lambda server, latency: GetWebpageHtmlContent(),
+        lambda server, i: {"url": f"{server.base_url}/page?i={i}"},
+    ),
+    Case(
+        "get_webpage_html_content_text_only",
+        lambda server, latency: GetWebpageHtmlContent(text_only=True),
+        lambda server, i: {"url": f"{server.base_url}/page?i={i}"},
+    ),
+    Case(
+        "google_search",
+        lambda server, latency: GoogleSearch(),
+        lambda server, i: {"query": f"benchmark query {i}"},
+    ),
+    Case(
+        "wolfram_alpha_query",
+        lambda server, latency: WolframAlphaQuery(),
+        lambda server, i: {"query": f"population of country {i}"},
+    ),
+    Case(
+        "wikipedia",
+        lambda server, latency: WikipediaPack(**_llm_kwargs(latency)),
+        lambda server, i: {"query": f"benchmark topic {i}"},
+    ),
+    Case(
+        "extract_information_from_webpage",
+        lambda server, latency: ExtractInformationFromWebpage(**_llm_kwargs(latency)),
+        lambda server, i: {"url": f"{server.base_url}/page?i={i}", "information": f"question {i}"},
+    ),
+    Case(
+        "write_python_code",
+        lambda server, latency: WritePythonCode(),
+        lambda server, i: {"file_name": f"module_{i}.py", "code": PYTHON_SOURCE},
+    ),
+    Case(
+        "write_file",
+        lambda server, latency: WriteFile(),
+        lambda server, i: {"filename": f"written_{i}.txt", "text_content": "benchmark text\n" * 1000},
+    ),
+    Case(
+        "read_file",
+        lambda server, latency: ReadFile(),
+        lambda server, i: {"filename": _write_workspace_file("read.txt", "benchmark text\n" * 1000)},
+    ),
+    Case("list_files", lambda server, latency: ListFiles(), lambda server, i: {"path": "."}),
+    Case(
+        # Creating the file is part of the timing, but costs far less than deleting it
+        "delete_file",
+        lambda server, latency: DeleteFile(),
+        lambda server, i: {"filename": _write_workspace_file(f"delete_{i}.txt", "x")},
+    ),
+]
+
+
+def stand_in_environment(stack: ExitStack, server: StandInServer):
+    """Point every pack at the stand-ins for the rest of `stack`."""
+    environment = {
+        "SERPER_API_KEY": "benchmark",
+        "SERPER_API_URL": f"{server.base_url}/serper",
+        "WOLFRAM_ALPHA_APPID": "benchmark",
+        "WOLFRAM_ALPHA_API_URL": f"{server.base_url}/wolfram/v2/query",
+    }
+    stack.enter_context(patch.dict(os.environ, environment))
+    stack.enter_context(patch.object(wikipedia.wikipedia, "API_URL", f"{server.base_url}/wikipedia/w/api.php"))
+
+    workspace = stack.enter_context(tempfile.TemporaryDirectory(prefix="autopack-bench-"))
+    stack.enter_context(patch.object(PackConfig.global_config(), "workspace_path", workspace))
+
+
+def browser_unavailable(server: StandInServer) -> str:
+    """Why pages can't be rendered here, or an empty string if they can."""
+    try:
+        get_browser_pool().fetch_html(f"{server.base_url}/page")
+        return ""
+    except Exception as e:
+        return f"browser unavailable: {str(e).splitlines()[0]}"
+
+
+def run_case(
+    case: Case,
+    server: StandInServer,
+    loop: asyncio.AbstractEventLoop,
+    rounds: int,
+    concurrency: int,
+    latency: float,
+    skip_reason: str = "",
+) -> BenchmarkResult:
+    if skip_reason:
+        return BenchmarkResult(case.name, skipped=skip_reason)
+
+    pack = case.make_pack(server, latency)
+    # Timing a pack that only returns errors would be meaningless
+    output = pack.run(**case.arguments(server, -100))
+    if isinstance(output, str) and output.startswith(("Error", "error")) or "not supported" in str(output):
+        return BenchmarkResult(case.name, skipped=f"failed: {str(output)[:200]}")
+
+    # Sync, async and throughput calls use separate ranges of arguments, so none of them see another's cached results
+    sync = measure(lambda i: pack.run(**case.arguments(server, i)), rounds)
+
+    async def acall(offset: int, i: int):
+        await pack.arun(**case.arguments(server, offset + i))
+
+    async_ = loop.run_until_complete(ameasure(partial(acall, 100_000), rounds))
+    total = concurrency * THROUGHPUT_BATCHES
+    throughput = loop.run_until_complete(athroughput(partial(acall, 200_000), concurrency, total))
+
+    return BenchmarkResult(
+        case.name,
+        sync=sync,
+        async_=async_,
+        throughput=throughput,
+        concurrency=concurrency,
+        peak_rss_mb=peak_rss_mb(),
+    )
+
+
+def run_benchmarks(
+    rounds: int = DEFAULT_ROUNDS,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    latency: float = DEFAULT_LATENCY,
+    only: Optional[list[str]] = None,
+) -> list[BenchmarkResult]:
+    cases = [case for case in CASES if not only or case.name in only]
+    loop = asyncio.new_event_loop()
+    results = []
+    # Every stand-in is on one host, which the default limits would throttle long before the packs themselves
+    configure_scheduler(max_concurrency=0, default_limits=HostLimits())
+    try:
+        with StandInServer(latency=latency) as server, ExitStack() as stack:
+            stand_in_environment(stack, server)
+
+            skip_browser = ""
+            if any(case.needs_browser for case in cases):
+                # Benchmarks shouldn't download a browser, so only an already installed one is used
+                configure_browser_pool(install=False)
+                skip_browser = browser_unavailable(server)
+
+            for case in cases:
+                skip_reason = skip_browser if case.needs_browser else ""
+                results.append(run_case(case, server, loop, rounds, concurrency, latency, skip_reason))
+
+            loop.run_until_complete(aclose_http_clients())
+    finally:
+        close_http_clients()
+        close_browser_pool()
+        configure_scheduler()
+        loop.close()
+
+    return results
+
+
+def print_results(results: list[BenchmarkResult]):
+    print(f"{'pack':<36}{'sync p50':>10}{'sync p99':>10}{'async p50':>11}{'async p99':>11}{'calls/s':>10}{'RSS MB':>9}")
+    for result in results:
+        if result.skipped:
+            print(f"{result.name:<36}skipped, {result.skipped}")
+            continue
+        print(
+            f"{result.name:<36}{result.sync.p50_ms:>10.2f}{result.sync.p99_ms:>10.2f}{result.async_.p50_ms:>11.2f}"
+            f"{result.async_.p99_ms:>11.2f}{result.throughput:>10.1f}{result.peak_rss_mb:>9.1f}"
+        )
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=DEFAULT_ROUNDS, help="Timed calls per pack and code path")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Parallel arun calls")
+    parser.add_argument("--latency-ms", type=float, default=DEFAULT_LATENCY * 1000, help="Simulated network latency")
+    parser.add_argument("--only", nargs="+", choices=[case.name for case in CASES], help="Packs to benchmark")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON instead of a table")
+    parser.add_argument("--phases", action="store_true", help="Also print where each pack's time went")
+    parser.add_argument("--baselines", type=str, default=str(BASELINES_PATH), help="Baselines file")
+    parser.add_argument("--save-baseline", action="store_true", help="Record these results as the new baselines")
+    parser.add_argument("--check", action="store_true", help="Fail if any pack regressed against its baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Allowed slowdown, e.g. 0.25")
+    args = parser.parse_args(argv)
+
+    sink = add_sink(InMemorySink()) if args.phases else None
+    try:
+        results = run_benchmarks(args.rounds, args.concurrency, args.latency_ms / 1000, args.only)
+    finally:
+        if sink:
+            remove_sink(sink)
+
+    if args.json:
+        print(json.dumps([asdict(result) for result in results], indent=2))
+    else:
+        print_results(results)
+    if sink:
+        print(f"\nTime per phase, all calls:\n{sink.summary()}")
+
+    baselines_path = Path(args.baselines)
+    if args.check:
+        regressions = find_regressions(results, load_baselines(baselines_path), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+    if args.save_baseline:
+        save_baselines(results, baselines_path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
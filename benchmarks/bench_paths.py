@@ -0,0 +1,59 @@
+"""
+Compares workspace path resolutions per second: the lexical abspath/relpath check restrict_path used before, an
+uncached realpath check, and WorkspacePaths with its memo. Run with `python -m benchmarks.bench_paths`.
+"""
+import os
+import tempfile
+import time
+
+from filesystem_utils import WorkspacePaths
+
+PATHS = [f"src/package_{i % 20}/module_{i}.py" for i in range(200)]
+DURATION = 1.0
+
+
+def legacy_restrict_path(file_path: str, workspace_dir: str):
+    absolute_path = os.path.abspath(file_path)
+    relative_path = os.path.relpath(absolute_path, workspace_dir)
+    if relative_path.startswith("..") or "/../" in relative_path:
+        return None
+    return absolute_path
+
+
+def realpath_restrict_path(file_path: str, root: str):
+    # What WorkspacePaths.resolve does on a miss
+    resolved = os.path.realpath(os.path.join(root, file_path))
+    return resolved if resolved.startswith(root + os.sep) else None
+
+
+def resolutions_per_second(resolve) -> float:
+    resolutions = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < DURATION:
+        for path in PATHS:
+            resolve(path)
+        resolutions += len(PATHS)
+    return resolutions / (time.perf_counter() - start)
+
+
+def main():
+    with tempfile.TemporaryDirectory(prefix="autopack-bench-") as workspace_dir:
+        for path in PATHS:
+            os.makedirs(os.path.join(workspace_dir, os.path.dirname(path)), exist_ok=True)
+            open(os.path.join(workspace_dir, path), "w").close()
+
+        cached = WorkspacePaths(workspace_dir)
+        candidates = {
+            "legacy abspath/relpath": lambda path: legacy_restrict_path(
+                os.path.join(workspace_dir, path), workspace_dir
+            ),
+            "realpath, no memo": lambda path: realpath_restrict_path(path, cached.root),
+            "WorkspacePaths.resolve": cached.resolve,
+        }
+        print(f"{'resolver':<26}{'resolutions/s':>16}")
+        for name, resolve in candidates.items():
+            print(f"{name:<26}{resolutions_per_second(resolve):>16,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Compares the browser pool's render profiles on a local fixture site: a news article with images, a web font, a
+stylesheet, a script that adds content and an analytics tag, every resource served with some latency. Reports the
+time to render the page and the bytes the site served for it. Needs an installed Chromium. Run with
+`python -m benchmarks.bench_rendering`.
+"""
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from browser_pool import FAST_PROFILE, FULL_PROFILE, BrowserPool
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+ROUNDS = 10
+IMAGES = 12
+IMAGE_BYTES = 200_000
+# Seconds each resource takes to be served
+LATENCY = 0.05
+# Seconds the analytics endpoint takes, like a slow third party holding up the load event
+TRACKER_LATENCY = 0.5
+
+SCRIPT = b"document.body.insertAdjacentHTML('beforeend', '<p id=added>Added by JavaScript</p>');"
+
+
+def fixture_page() -> bytes:
+    article = (FIXTURES_DIR / "news_article.html").read_text(encoding="iso-8859-1")
+    resources = (
+        '<link rel="stylesheet" href="/style.css">'
+        "<style>@font-face { font-family: Body; src: url(/font.woff2); } body { font-family: Body; }</style>"
+        '<script src="http://www.google-analytics.com/analytics.js"></script>'
+        + "".join(f'<img src="/image_{i}.jpg">' for i in range(IMAGES))
+        + '<script src="/app.js"></script>'
+    )
+    return article.replace("</body>", resources + "</body>").encode("iso-8859-1")
+
+
+class FixtureSite:
+    """Serves the fixture page and its resources, counting the bytes it sends."""
+
+    def __init__(self):
+        page = fixture_page()
+        self.bytes_served = 0
+        self._lock = threading.Lock()
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split("?", 1)[0]
+                if self.headers.get("Host", "").endswith("google-analytics.com"):
+                    time.sleep(TRACKER_LATENCY)
+                    body, content_type = b"/* analytics */", "application/javascript"
+                elif path.startswith("/image_"):
+                    body, content_type = b"\xff" * IMAGE_BYTES, "image/jpeg"
+                elif path == "/font.woff2":
+                    body, content_type = b"\x00" * 50_000, "font/woff2"
+                elif path == "/style.css":
+                    body, content_type = b"p { line-height: 1.5; }" * 1000, "text/css"
+                elif path == "/app.js":
+                    body, content_type = SCRIPT, "application/javascript"
+                else:
+                    body, content_type = page, "text/html; charset=iso-8859-1"
+
+                time.sleep(LATENCY)
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("Cache-Control", "no-store")
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except ConnectionError:
+                    return
+                with site._lock:
+                    site.bytes_served += len(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.port = self.server.server_port
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def measure(pool: BrowserPool, site: FixtureSite, profile) -> tuple[float, float, bool]:
+    """Median render time in ms, mean bytes served per render, and whether the script's content made it in."""
+    timings, served, rendered_script = [], [], True
+    for i in range(ROUNDS):
+        before = site.bytes_served
+        start = time.perf_counter()
+        html = pool.fetch_html(f"http://127.0.0.1:{site.port}/article?round={i}", profile)
+        timings.append((time.perf_counter() - start) * 1000)
+        # Blocked requests never reach the server, those let through are counted as they finish
+        time.sleep(TRACKER_LATENCY + LATENCY)
+        served.append(site.bytes_served - before)
+        rendered_script = rendered_script and 'id="added"' in html
+    return statistics.median(timings), statistics.mean(served), rendered_script
+
+
+def main():
+    site = FixtureSite()
+    # Every host, including the analytics one, resolves to the fixture site
+    pool = BrowserPool(install=False, launch_options={"args": [f"--host-resolver-rules=MAP * 127.0.0.1:{site.port}"]})
+    try:
+        print(f"{'profile':<10}{'render ms':>12}{'KB served':>12}{'script ran':>12}")
+        for name, profile in [("full", FULL_PROFILE), ("fast", FAST_PROFILE)]:
+            median_ms, mean_bytes, rendered_script = measure(pool, site, profile)
+            print(f"{name:<10}{median_ms:>12.1f}{mean_bytes / 1024:>12.1f}{str(rendered_script):>12}")
+    finally:
+        pool.close()
+        site.close()
+
+
+if __name__ == "__main__":
+    main()
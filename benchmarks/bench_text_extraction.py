@@ -0,0 +1,52 @@
+"""
+Compares text_extraction.extract_text against the slicing approach the web packs used before, over the saved pages in
+benchmarks/fixtures plus a large synthetic page. Run with `python -m benchmarks.bench_text_extraction`.
+"""
+import statistics
+import time
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+from text_extraction import DEFAULT_MAX_TOKENS, PARSER, estimate_tokens, extract_text
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+ROUNDS = 20
+
+
+def legacy_extract(html: str) -> str:
+    body = BeautifulSoup(html, "html.parser").find("body")
+    return body.get_text(separator="\n")[:8000] if body else ""
+
+
+def load_corpus() -> dict[str, str]:
+    corpus = {path.stem: path.read_text(encoding="iso-8859-1") for path in sorted(FIXTURES_DIR.glob("*.html"))}
+
+    # Large pages are where the parser and the budget matter, so repeat the article body into a ~1MB page
+    article = corpus["news_article"]
+    body_start, body_end = article.index("<body>") + len("<body>"), article.index("</body>")
+    corpus["large_synthetic"] = article[:body_start] + article[body_start:body_end] * 100 + article[body_end:]
+    return corpus
+
+
+def time_ms(func, html: str) -> float:
+    timings = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        func(html)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    print(f"Parser: {PARSER}, token budget: {DEFAULT_MAX_TOKENS}, rounds: {ROUNDS}")
+    print(f"{'page':<18}{'size':>10}{'legacy ms':>12}{'new ms':>10}{'legacy tok':>12}{'new tok':>10}")
+    for name, html in load_corpus().items():
+        legacy_ms, new_ms = time_ms(legacy_extract, html), time_ms(extract_text, html)
+        legacy_tokens = estimate_tokens(legacy_extract(html))
+        new_tokens = estimate_tokens(extract_text(html))
+        print(f"{name:<18}{len(html):>10}{legacy_ms:>12.2f}{new_ms:>10.2f}{legacy_tokens:>12}{new_tokens:>10}")
+
+
+if __name__ == "__main__":
+    main()
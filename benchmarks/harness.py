@@ -0,0 +1,149 @@
+"""
+Timing, throughput and memory measurements for the pack benchmarks, and the baselines they're compared against.
+"""
+import asyncio
+import json
+import math
+import resource
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+
+BASELINES_PATH = Path(__file__).parent / "baselines.json"
+# How much slower than its baseline a measurement can be before it's reported as a regression
+DEFAULT_TOLERANCE = 0.25
+
+
+@dataclass
+class LatencyStats:
+    p50_ms: float
+    p99_ms: float
+    mean_ms: float
+    rounds: int
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    sync: Optional[LatencyStats] = None
+    async_: Optional[LatencyStats] = None
+    # Completed `arun` calls per second with `concurrency` calls in flight at once
+    throughput: Optional[float] = None
+    concurrency: int = 0
+    peak_rss_mb: float = 0.0
+    skipped: str = ""
+
+    def metrics(self) -> dict[str, float]:
+        """The numbers that are stored as baselines. Lower is better for all of them except throughput."""
+        metrics = {}
+        if self.sync:
+            metrics["sync_p50_ms"] = self.sync.p50_ms
+            metrics["sync_p99_ms"] = self.sync.p99_ms
+        if self.async_:
+            metrics["async_p50_ms"] = self.async_.p50_ms
+            metrics["async_p99_ms"] = self.async_.p99_ms
+        if self.throughput is not None:
+            metrics["throughput"] = self.throughput
+        metrics["peak_rss_mb"] = self.peak_rss_mb
+        return metrics
+
+
+def percentile(values: list[float], percent: float) -> float:
+    """The nearest-rank percentile of `values`."""
+    if not values:
+        raise ValueError("No values")
+    ordered = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def latency_stats(timings: list[float]) -> LatencyStats:
+    return LatencyStats(
+        p50_ms=percentile(timings, 50) * 1000,
+        p99_ms=percentile(timings, 99) * 1000,
+        mean_ms=sum(timings) / len(timings) * 1000,
+        rounds=len(timings),
+    )
+
+
+def measure(func: Callable[[int], object], rounds: int, warmup: int = 1) -> LatencyStats:
+    """Time `func(i)` for `rounds` calls, after `warmup` untimed ones. `i` lets each call use different inputs."""
+    for i in range(warmup):
+        func(-1 - i)
+
+    timings = []
+    for i in range(rounds):
+        start = time.perf_counter()
+        func(i)
+        timings.append(time.perf_counter() - start)
+    return latency_stats(timings)
+
+
+async def ameasure(afunc: Callable[[int], Awaitable], rounds: int, warmup: int = 1) -> LatencyStats:
+    for i in range(warmup):
+        await afunc(-1 - i)
+
+    timings = []
+    for i in range(rounds):
+        start = time.perf_counter()
+        await afunc(i)
+        timings.append(time.perf_counter() - start)
+    return latency_stats(timings)
+
+
+async def athroughput(afunc: Callable[[int], Awaitable], concurrency: int, total: int) -> float:
+    """Calls per second for `total` calls of `afunc`, with up to `concurrency` running at once."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call(i: int):
+        async with semaphore:
+            await afunc(i)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(call(i) for i in range(total)))
+    return total / (time.perf_counter() - start)
+
+
+def peak_rss_mb() -> float:
+    """The most memory this process has used so far."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def load_baselines(path: Path = BASELINES_PATH) -> dict[str, dict[str, float]]:
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())
+
+
+def save_baselines(results: list[BenchmarkResult], path: Path = BASELINES_PATH):
+    baselines = load_baselines(path)
+    baselines.update({result.name: result.metrics() for result in results if not result.skipped})
+    path.write_text(json.dumps(baselines, indent=2, sort_keys=True) + "\n")
+
+
+def find_regressions(
+    results: list[BenchmarkResult], baselines: dict[str, dict[str, float]], tolerance: float = DEFAULT_TOLERANCE
+) -> list[str]:
+    """Describe every metric that is worse than its baseline by more than `tolerance`. Tail latencies are too noisy
+    to gate on, so only medians, throughput and memory are compared."""
+    regressions = []
+    for result in results:
+        baseline = baselines.get(result.name)
+        if not baseline or result.skipped:
+            continue
+
+        for metric, value in result.metrics().items():
+            expected = baseline.get(metric)
+            if expected is None or metric.endswith("_p99_ms"):
+                continue
+            if metric == "throughput":
+                regressed = value < expected / (1 + tolerance)
+            else:
+                regressed = value > expected * (1 + tolerance)
+            if regressed:
+                regressions.append(f"{result.name} {metric}: {value:.2f} (baseline {expected:.2f})")
+    return regressions
@@ -0,0 +1,128 @@
+"""
+Local stand-ins for the services the packs talk to, so benchmarks measure the packs rather than the internet: an aiohttp
+server with a web page, a JSON API and fake Serper, Wolfram|Alpha and Wikipedia endpoints, plus a deterministic fake
+LLM. Every response is delayed by `latency` seconds to stand in for the network.
+"""
+import asyncio
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from aiohttp import web
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+
+WOLFRAM_RESPONSE = """<?xml version="1.0" encoding="UTF-8"?>
+<queryresult success="true" error="false" numpods="2" datatypes="" timedout="" timing="0.1" version="2.6">
+  <pod title="Input interpretation" scanner="Identity" id="Input" position="100" error="false" numsubpods="1">
+    <subpod title=""><plaintext>{query}</plaintext></subpod>
+  </pod>
+  <pod title="Result" scanner="Data" id="Result" position="200" error="false" numsubpods="1" primary="true">
+    <subpod title=""><plaintext>331.9 million people (2021 estimate)</plaintext></subpod>
+  </pod>
+</queryresult>
+"""
+
+
+def _words(text: str, count: int) -> str:
+    return " ".join(text.split()[:count])
+
+
+def fake_llm(prompt: str, latency: float = 0.0) -> str:
+    """Answers instantly (after `latency`) and always the same way for the same prompt."""
+    if latency:
+        time.sleep(latency)
+    return f"Summary of {len(prompt)} characters: {_words(prompt[-2000:], 40)}"
+
+
+async def fake_allm(prompt: str, latency: float = 0.0) -> str:
+    if latency:
+        await asyncio.sleep(latency)
+    return f"Summary of {len(prompt)} characters: {_words(prompt[-2000:], 40)}"
+
+
+class StandInServer:
+    """Serves the stand-in endpoints from a background thread. Use as a context manager."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.page = (FIXTURES_DIR / "news_article.html").read_bytes()
+        self.base_url: Optional[str] = None
+        self._loop = asyncio.new_event_loop()
+        self._runner: Optional[web.AppRunner] = None
+        self._thread = threading.Thread(target=self._loop.run_forever, name="stand-in-server", daemon=True)
+
+    def __enter__(self) -> "StandInServer":
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+        return self
+
+    def __exit__(self, *exc_info):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    async def _start(self):
+        app = web.Application()
+        app.router.add_get("/page", self.page_handler)
+        app.router.add_get("/json", self.json_handler)
+        app.router.add_post("/serper/search", self.serper_handler)
+        app.router.add_get("/wolfram/v2/query", self.wolfram_handler)
+        app.router.add_get("/wikipedia/w/api.php", self.wikipedia_handler)
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}"
+
+    async def _delay(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def page_handler(self, request: web.Request) -> web.Response:
+        await self._delay()
+        return web.Response(body=self.page, content_type="text/html", charset="utf-8")
+
+    async def json_handler(self, request: web.Request) -> web.Response:
+        await self._delay()
+        items = [{"id": i, "name": f"item {i}", "tags": ["a", "b"], "price": i * 1.5} for i in range(50)]
+        return web.json_response({"query": request.query.get("q", ""), "items": items})
+
+    async def serper_handler(self, request: web.Request) -> web.Response:
+        await self._delay()
+        query = request.query.get("q", "")
+        organic = [
+            {
+                "title": f"Result {i} for {query}",
+                "link": f"https://example.com/{i}",
+                "snippet": f"Snippet {i} about {query}. " * 3,
+                "position": i + 1,
+            }
+            for i in range(10)
+        ]
+        return web.json_response({"searchParameters": {"q": query}, "organic": organic})
+
+    async def wolfram_handler(self, request: web.Request) -> web.Response:
+        await self._delay()
+        body = WOLFRAM_RESPONSE.format(query=request.query.get("input", ""))
+        return web.Response(text=body, content_type="text/xml")
+
+    async def wikipedia_handler(self, request: web.Request) -> web.Response:
+        await self._delay()
+        params = request.query
+        if params.get("list") == "search":
+            query = params["srsearch"]
+            limit = int(params.get("srlimit", 10))
+            return web.json_response({"query": {"search": [{"title": f"{query} {i}"} for i in range(limit)]}})
+
+        title = params.get("titles", "")
+        page = {"pageid": 1, "ns": 0, "title": title}
+        if params.get("prop") == "extracts":
+            page["extract"] = f"{title} is a subject of the stand-in encyclopedia. " * 20
+        else:
+            page["fullurl"] = f"https://en.wikipedia.org/wiki/{title.replace(' ', '_')}"
+        return web.json_response({"query": {"pages": {"1": page}}})
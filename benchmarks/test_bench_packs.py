@@ -0,0 +1,72 @@
+from pathlib import Path
+
+import pytest
+
+from benchmarks.bench_packs import main, run_benchmarks
+from benchmarks.harness import (
+    BenchmarkResult,
+    LatencyStats,
+    find_regressions,
+    load_baselines,
+    percentile,
+    save_baselines,
+)
+
+
+def result(name: str, p50_ms: float, throughput: float) -> BenchmarkResult:
+    latency = LatencyStats(p50_ms=p50_ms, p99_ms=p50_ms * 10, mean_ms=p50_ms, rounds=10)
+    return BenchmarkResult(name, sync=latency, async_=latency, throughput=throughput, peak_rss_mb=100)
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([3.0], 99) == 3.0
+    with pytest.raises(ValueError):
+        percentile([], 50)
+
+
+def test_find_regressions():
+    baselines = {"pack": result("pack", 10, 100).metrics()}
+
+    assert find_regressions([result("pack", 11, 90)], baselines, tolerance=0.25) == []
+    assert find_regressions([result("new_pack", 1000, 1)], baselines) == []
+
+    regressions = find_regressions([result("pack", 20, 50)], baselines, tolerance=0.25)
+    assert any("sync_p50_ms" in regression for regression in regressions)
+    assert any("throughput" in regression for regression in regressions)
+    # Tail latencies are too noisy to gate on
+    assert not any("p99" in regression for regression in regressions)
+
+
+def test_baselines_round_trip(tmpdir):
+    path = Path(tmpdir.join("baselines.json"))
+    save_baselines([result("a", 1, 10), BenchmarkResult("b", skipped="no browser")], path)
+    save_baselines([result("c", 2, 20)], path)
+
+    baselines = load_baselines(path)
+    assert set(baselines) == {"a", "c"}
+    assert baselines["a"]["sync_p50_ms"] == 1
+
+
+def test_run_benchmarks_against_stand_ins():
+    packs = ["http_request", "google_search", "wolfram_alpha_query", "wikipedia", "write_python_code"]
+    results = run_benchmarks(rounds=2, concurrency=2, latency=0, only=packs)
+
+    assert [result.name for result in results] == packs
+    for result in results:
+        assert not result.skipped, result.skipped
+        assert result.sync.rounds == 2
+        assert result.throughput > 0
+
+
+def test_main_check_fails_on_regression(tmpdir, capsys):
+    path = tmpdir.join("baselines.json")
+    arguments = ["--rounds", "2", "--concurrency", "2", "--latency-ms", "0", "--only", "os_info"]
+    assert main(arguments + ["--baselines", str(path), "--save-baseline"]) == 0
+
+    # A baseline no real run can match
+    path.write('{"os_info": {"throughput": 1000000000000.0}}')
+    assert main(arguments + ["--baselines", str(path), "--check"]) == 1
+    assert "REGRESSION os_info throughput" in capsys.readouterr().err
@@ -0,0 +1,374 @@
+import asyncio
+import atexit
+import concurrent.futures
+import logging
+import os
+import threading
+from contextlib import suppress
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+from urllib.parse import urlsplit
+
+from autopack.pack_config import PackConfig
+from playwright.async_api import Browser, BrowserContext, Page, Playwright, Route, async_playwright
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+from async_execution import run_blocking
+from instrumentation import count
+from playwright_setup import install_browsers
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+DEFAULT_BROWSERS = 1
+DEFAULT_CONTEXTS_PER_BROWSER = 4
+# Pages (and their contexts) are thrown away after this many uses to keep Chromium's memory from creeping up
+DEFAULT_MAX_PAGE_USES = 50
+
+# Resources that don't change a page's DOM, and so are wasted downloads when only its HTML or text is wanted
+NON_DOCUMENT_RESOURCE_TYPES = frozenset({"image", "media", "font", "stylesheet", "manifest", "texttrack"})
+# Ad, analytics and tracking hosts, blocked together with their subdomains
+TRACKER_HOSTS = frozenset(
+    {
+        "doubleclick.net",
+        "googlesyndication.com",
+        "googleadservices.com",
+        "google-analytics.com",
+        "googletagmanager.com",
+        "googletagservices.com",
+        "adservice.google.com",
+        "amazon-adsystem.com",
+        "facebook.net",
+        "connect.facebook.net",
+        "scorecardresearch.com",
+        "quantserve.com",
+        "hotjar.com",
+        "segment.com",
+        "segment.io",
+        "mixpanel.com",
+        "newrelic.com",
+        "nr-data.net",
+        "taboola.com",
+        "outbrain.com",
+        "criteo.com",
+        "criteo.net",
+        "adnxs.com",
+        "chartbeat.com",
+        "optimizely.com",
+    }
+)
+
+
+@dataclass(frozen=True)
+class RenderProfile:
+    """
+    How a page is loaded. `wait_until` is the navigation event `goto` waits for. Afterwards the page is given up to
+    `network_idle_timeout` seconds to finish the requests its scripts make. The whole navigation is capped at
+    `navigation_timeout` seconds; a page still loading by then is returned as far as it got.
+    """
+
+    blocked_resource_types: frozenset = frozenset()
+    blocked_hosts: frozenset = frozenset()
+    wait_until: str = "load"
+    network_idle_timeout: float = 0
+    navigation_timeout: float = 30
+
+    def blocks(self, resource_type: str, url: str) -> bool:
+        if resource_type in self.blocked_resource_types:
+            return True
+        if not self.blocked_hosts:
+            return False
+        host = (urlsplit(url).hostname or "").lower()
+        return any(host == blocked or host.endswith("." + blocked) for blocked in self.blocked_hosts)
+
+
+# Loads everything and waits for the `load` event, like a browser would
+FULL_PROFILE = RenderProfile()
+# Only what's needed to build the DOM: scripts still run, so pages that need JavaScript render, but images, fonts,
+# styles and trackers are never downloaded, and rendering stops soon after the network goes quiet
+FAST_PROFILE = RenderProfile(
+    blocked_resource_types=NON_DOCUMENT_RESOURCE_TYPES,
+    blocked_hosts=TRACKER_HOSTS,
+    wait_until="domcontentloaded",
+    network_idle_timeout=2,
+    navigation_timeout=15,
+)
+DEFAULT_PROFILE = FAST_PROFILE
+
+
+@dataclass
+class _Slot:
+    browser_index: int
+    context: Optional[BrowserContext] = None
+    page: Optional[Page] = None
+    uses: int = 0
+
+
+class BrowserPool:
+    """
+    A pool of long-lived Chromium browsers shared by every caller in the process.
+
+    Playwright objects are bound to the event loop that created them, so the pool owns a private event loop running
+    in a daemon thread. Both the sync and async entry points schedule their work onto that loop, which lets them share
+    the same browsers. Each browser hosts `contexts_per_browser` contexts and every context serves one page at a time,
+    so the pool renders at most `browsers * contexts_per_browser` pages concurrently.
+
+    If `install` is True (by default, when AutoPack installs dependencies automatically) a missing Chromium is
+    installed the first time a browser is launched, rather than whenever a Pack is constructed.
+    """
+
+    def __init__(
+        self,
+        browsers: int = DEFAULT_BROWSERS,
+        contexts_per_browser: int = DEFAULT_CONTEXTS_PER_BROWSER,
+        max_page_uses: int = DEFAULT_MAX_PAGE_USES,
+        launch_options: Optional[dict[str, Any]] = None,
+        install: Optional[bool] = None,
+    ):
+        if browsers < 1 or contexts_per_browser < 1:
+            raise ValueError("A browser pool needs at least one browser and one context")
+
+        self.browsers = browsers
+        self.contexts_per_browser = contexts_per_browser
+        self.max_page_uses = max_page_uses
+        self.launch_options = launch_options or {}
+        if install is None:
+            install = PackConfig.global_config().automatically_install_dependencies
+        self.install = install
+
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._closed = False
+
+        # Everything below is only touched from inside the pool's event loop
+        self._playwright: Optional[Playwright] = None
+        self._browsers: list[Optional[Browser]] = [None] * browsers
+        self._browser_locks: list[asyncio.Lock] = []
+        self._start_lock: Optional[asyncio.Lock] = None
+        self._idle: Optional[asyncio.Queue] = None
+
+    def run(self, func: Callable[[Page], Awaitable[T]]) -> T:
+        """Lease a page, call `await func(page)` on the pool's event loop, and block until it returns."""
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("BrowserPool.run cannot be called from inside the pool's own event loop")
+        return self._submit(self._use_page(func)).result()
+
+    async def arun(self, func: Callable[[Page], Awaitable[T]]) -> T:
+        """Lease a page and await `func(page)` on the pool's event loop without blocking the caller's loop."""
+        if threading.current_thread() is self._thread:
+            return await self._use_page(func)
+        return await asyncio.wrap_future(self._submit(self._use_page(func)))
+
+    def fetch_html(self, url: str, profile: RenderProfile = DEFAULT_PROFILE) -> str:
+        return self.run(lambda page: _page_content(page, url, profile))
+
+    async def afetch_html(self, url: str, profile: RenderProfile = DEFAULT_PROFILE) -> str:
+        return await self.arun(lambda page: _page_content(page, url, profile))
+
+    def close(self):
+        """Close every browser and stop the pool's event loop. The pool cannot be used afterwards."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            loop, thread = self._loop, self._thread
+
+        if not loop or self._pid != os.getpid():
+            return
+
+        try:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), loop).result(timeout=30)
+        except Exception as e:
+            logger.warning(f"Error while shutting down browser pool: {e}")
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(timeout=5)
+
+    def _submit(self, coro: Awaitable[T]) -> concurrent.futures.Future:
+        loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(coro, loop)
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Browser pool has been closed")
+
+            # A forked child inherits the parent's pool object but not its thread, so start from scratch
+            if self._loop is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._loop = asyncio.new_event_loop()
+                self._playwright = None
+                self._browsers = [None] * self.browsers
+                self._idle = None
+                self._thread = threading.Thread(target=self._loop.run_forever, name="browser-pool", daemon=True)
+                self._thread.start()
+
+            return self._loop
+
+    async def _use_page(self, func: Callable[[Page], Awaitable[T]]) -> T:
+        slot = await self._lease()
+        try:
+            return await func(slot.page)
+        except Exception:
+            # The page may have crashed or been left mid-navigation, don't hand it to the next caller
+            await self._discard(slot)
+            raise
+        finally:
+            self._release(slot)
+
+    async def _lease(self) -> _Slot:
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+            self._browser_locks = [asyncio.Lock() for _ in range(self.browsers)]
+            self._start_lock = asyncio.Lock()
+            for index in range(self.browsers):
+                for _ in range(self.contexts_per_browser):
+                    self._idle.put_nowait(_Slot(browser_index=index))
+
+        slot = await self._idle.get()
+        try:
+            await self._prepare(slot)
+        except BaseException:
+            self._idle.put_nowait(slot)
+            raise
+
+        slot.uses += 1
+        return slot
+
+    def _release(self, slot: _Slot):
+        self._idle.put_nowait(slot)
+
+    async def _prepare(self, slot: _Slot):
+        browser = await self._healthy_browser(slot.browser_index)
+
+        if slot.context is not None:
+            stale = slot.context.browser is not browser or slot.page is None or slot.page.is_closed()
+            if stale or slot.uses >= self.max_page_uses:
+                await self._discard(slot)
+
+        if slot.context is None:
+            slot.context = await browser.new_context()
+            slot.page = await slot.context.new_page()
+            slot.uses = 0
+
+    async def _healthy_browser(self, index: int) -> Browser:
+        async with self._browser_locks[index]:
+            browser = self._browsers[index]
+            if browser is not None and browser.is_connected():
+                return browser
+
+            if browser is not None:
+                logger.warning(f"Browser {index} in the pool disconnected, relaunching it")
+
+            async with self._start_lock:
+                if self._playwright is None:
+                    if self.install:
+                        await run_blocking(install_browsers)
+                    self._playwright = await async_playwright().start()
+
+            try:
+                browser = await self._playwright.chromium.launch(**self.launch_options)
+            except Exception as e:
+                # The install marker can outlive the browsers themselves, e.g. after the cache directory was wiped
+                if not self.install or "Executable doesn't exist" not in str(e):
+                    raise
+                await run_blocking(install_browsers, force=True)
+                browser = await self._playwright.chromium.launch(**self.launch_options)
+
+            self._browsers[index] = browser
+            return browser
+
+    @staticmethod
+    async def _discard(slot: _Slot):
+        with suppress(Exception):
+            await slot.context.close()
+        slot.context = None
+        slot.page = None
+        slot.uses = 0
+
+    async def _shutdown(self):
+        for browser in self._browsers:
+            if browser is not None:
+                with suppress(Exception):
+                    await browser.close()
+        self._browsers = [None] * self.browsers
+
+        if self._playwright is not None:
+            with suppress(Exception):
+                await self._playwright.stop()
+            self._playwright = None
+
+
+async def _page_content(page: Page, url: str, profile: RenderProfile = DEFAULT_PROFILE) -> str:
+    async def route(route: Route):
+        request = route.request
+        # The page itself is never blocked, even when it's served from a blocked host
+        is_page = request.is_navigation_request() and request.frame.parent_frame is None
+        if not is_page and profile.blocks(request.resource_type, request.url):
+            count("requests_blocked")
+            await route.abort("blockedbyclient")
+        else:
+            await route.continue_()
+
+    blocking = bool(profile.blocked_resource_types or profile.blocked_hosts)
+    if blocking:
+        await page.route("**/*", route)
+    previous_url = page.url
+    try:
+        try:
+            await page.goto(url, wait_until=profile.wait_until, timeout=profile.navigation_timeout * 1000)
+        except PlaywrightTimeoutError:
+            # Pages are reused, so unless the new document has replaced the last one there is nothing to return
+            if page.url == previous_url:
+                raise
+            logger.warning(f"Loading {url} took over {profile.navigation_timeout:g} seconds, using what has loaded")
+        else:
+            if profile.network_idle_timeout:
+                with suppress(PlaywrightTimeoutError):
+                    await page.wait_for_load_state("networkidle", timeout=profile.network_idle_timeout * 1000)
+        return await page.content()
+    finally:
+        if blocking:
+            # The page may have crashed, in which case the pool throws it away anyway
+            with suppress(Exception):
+                await page.unroute("**/*", route)
+
+
+_pool: Optional[BrowserPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_browser_pool() -> BrowserPool:
+    """Return the process-wide browser pool, creating it with the default settings on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = BrowserPool()
+        return _pool
+
+
+def configure_browser_pool(**kwargs) -> BrowserPool:
+    """Replace the process-wide browser pool with one built from `kwargs`, closing the previous one."""
+    global _pool
+    with _pool_lock:
+        previous, _pool = _pool, BrowserPool(**kwargs)
+
+    if previous:
+        previous.close()
+    return _pool
+
+
+def close_browser_pool():
+    """Shut down the process-wide browser pool. A new one will be created on next use."""
+    global _pool
+    with _pool_lock:
+        previous, _pool = _pool, None
+
+    if previous:
+        previous.close()
+
+
+atexit.register(close_browser_pool)
@@ -0,0 +1,308 @@
+import asyncio
+import concurrent.futures
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+from async_execution import run_blocking
+from instrumentation import count
+
+T = TypeVar("T")
+
+_MISSING = object()
+
+
+def cache_key(*parts: Any) -> str:
+    """A stable hash of `parts`, suitable as a key for any of the caches below."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(json.dumps(part, sort_keys=True, default=str).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _sizeof(value: Any) -> int:
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    return len(json.dumps(value, default=str))
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    # Calls that waited on an identical call already in flight, instead of making their own
+    coalesced: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class TTLCache:
+    """
+    A thread-safe in-memory LRU cache. Entries expire `ttl` seconds after being set, and the least recently used
+    entries are evicted once there are more than `max_entries` of them or their combined size exceeds `max_bytes`.
+    A `ttl`, `max_entries` or `max_bytes` of 0 disables that limit.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 0, ttl: float = 0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stats = CacheStats()
+
+        self._lock = threading.Lock()
+        # key -> (expires_at, size, value)
+        self._entries: OrderedDict[str, tuple[float, int, Any]] = OrderedDict()
+        self._bytes = 0
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] and entry[0] < time.monotonic():
+                self._remove(key)
+                entry = None
+
+            if entry is None:
+                self.stats.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            return entry[2]
+
+    def set(self, key: str, value: Any):
+        size = _sizeof(value) if self.max_bytes else 0
+        expires_at = time.monotonic() + self.ttl if self.ttl else 0
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (expires_at, size, value)
+            self._bytes += size
+
+            while self._entries and (
+                (self.max_entries and len(self._entries) > self.max_entries)
+                or (self.max_bytes and self._bytes > self.max_bytes)
+            ):
+                self._remove(next(iter(self._entries)))
+                self.stats.evictions += 1
+
+    async def aget(self, key: str, default: Any = None) -> Any:
+        # Only an in-memory lookup, quick enough to do on the loop
+        return self.get(key, default)
+
+    async def aset(self, key: str, value: Any):
+        self.set(key, value)
+
+    def delete(self, key: str):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+
+class SQLiteCache:
+    """
+    A persistent cache with the same interface as TTLCache, for values that can be JSON encoded. The database is opened
+    in WAL mode so several worker processes can share one file.
+    """
+
+    def __init__(self, path: str, max_entries: int = 100_000, max_bytes: int = 0, ttl: float = 0):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stats = CacheStats()
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS cache "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, expires_at REAL, accessed_at REAL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)")
+
+    def get(self, key: str, default: Any = None) -> Any:
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[1] and row[1] < now:
+                self._connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+                row = None
+
+            if row is None:
+                self.stats.misses += 1
+                return default
+
+            self._connection.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self.stats.hits += 1
+            return json.loads(row[0])
+
+    def set(self, key: str, value: Any):
+        encoded = json.dumps(value, default=str)
+        now = time.time()
+        expires_at = now + self.ttl if self.ttl else None
+
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, encoded, len(encoded), expires_at, now),
+            )
+            self._evict()
+
+    async def aget(self, key: str, default: Any = None) -> Any:
+        """`get` for async code. The database can be locked by another process, so it's never read on the loop."""
+        return await run_blocking(self.get, key, default)
+
+    async def aset(self, key: str, value: Any):
+        await run_blocking(self.set, key, value)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute("DELETE FROM cache")
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def _evict(self):
+        count, total = self._connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+        while count and (
+            (self.max_entries and count > self.max_entries) or (self.max_bytes and total > self.max_bytes)
+        ):
+            key, size = self._connection.execute("SELECT key, size FROM cache ORDER BY accessed_at LIMIT 1").fetchone()
+            self._connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+            count -= 1
+            total -= size
+            self.stats.evictions += 1
+
+
+class InflightRequests:
+    """
+    Collapses concurrent calls for the same key into one. The first caller does the work and everyone who asks for the
+    same key before it finishes gets its result (or exception). Works across threads and event loops, since waiters
+    share a concurrent.futures.Future.
+    """
+
+    def __init__(self, stats: Optional[CacheStats] = None):
+        self.stats = stats or CacheStats()
+        self._lock = threading.Lock()
+        self._inflight: dict[str, concurrent.futures.Future] = {}
+
+    def call(self, key: str, func: Callable[[], T]) -> T:
+        future, leader = self._join(key)
+        if not leader:
+            return future.result()
+
+        try:
+            result = func()
+        except BaseException as e:
+            self._finish(key, future, exception=e)
+            raise
+        self._finish(key, future, result=result)
+        return result
+
+    async def acall(self, key: str, func: Callable[[], Awaitable[T]]) -> T:
+        future, leader = self._join(key)
+        if not leader:
+            return await asyncio.wrap_future(future)
+
+        try:
+            result = await func()
+        except BaseException as e:
+            self._finish(key, future, exception=e)
+            raise
+        self._finish(key, future, result=result)
+        return result
+
+    def _join(self, key: str) -> tuple[concurrent.futures.Future, bool]:
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.stats.coalesced += 1
+                return future, False
+
+            future = self._inflight[key] = concurrent.futures.Future()
+            return future, True
+
+    def _finish(self, key: str, future: concurrent.futures.Future, result: Any = None, exception=None):
+        with self._lock:
+            self._inflight.pop(key, None)
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+
+class CachedCalls:
+    """
+    A cache plus in-flight coalescing: the result of `func` is stored under `key` and shared by concurrent callers.
+    Hits and misses are counted by the instrumentation as `<name>_cache_hits` and `<name>_cache_misses`.
+    """
+
+    def __init__(self, cache: Optional[TTLCache] = None, name: str = "cache"):
+        self.cache = cache if cache is not None else TTLCache()
+        self.inflight = InflightRequests(self.cache.stats)
+        self.hit_counter = f"{name}_cache_hits"
+        self.miss_counter = f"{name}_cache_misses"
+
+    @property
+    def stats(self) -> CacheStats:
+        return self.cache.stats
+
+    def call(self, key: str, func: Callable[[], T]) -> T:
+        value = self.cache.get(key, _MISSING)
+        if value is not _MISSING:
+            count(self.hit_counter)
+            return value
+
+        def compute() -> T:
+            count(self.miss_counter)
+            result = func()
+            self.cache.set(key, result)
+            return result
+
+        return self.inflight.call(key, compute)
+
+    async def acall(self, key: str, func: Callable[[], Awaitable[T]]) -> T:
+        value = await self.cache.aget(key, _MISSING)
+        if value is not _MISSING:
+            count(self.hit_counter)
+            return value
+
+        async def compute() -> T:
+            count(self.miss_counter)
+            result = await func()
+            await self.cache.aset(key, result)
+            return result
+
+        return await self.inflight.acall(key, compute)
@@ -1,10 +1,15 @@
-import psutil
 from autopack import Pack
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+from async_execution import run_blocking
+from instrumentation import instrumented
+from system_info import DiskInfo, gigabytes, mount_point, snapshot
 
 
 class DiskUsageArgsSchema(BaseModel):
-    pass
+    all_partitions: bool = Field(
+        default=False, description="List every mounted partition instead of only the one holding the workspace"
+    )
 
 
 class DiskUsage(Pack):
@@ -14,14 +19,20 @@ class DiskUsage(Pack):
     args_schema = DiskUsageArgsSchema
     categories = ["System Info"]
 
-    def _run(self):
-        # Currently we will only support root directory
-        usage = psutil.disk_usage("/")
-        used = round(usage.used / 1024 / 1024 / 1024, 2)
-        total = round(usage.total / 1024 / 1024 / 1024, 2)
-        free = round(usage.free / 1024 / 1024 / 1024, 2)
+    @instrumented
+    def _run(self, all_partitions: bool = False) -> str:
+        workspace_mount = mount_point(self.config.workspace_path)
+        disks = snapshot(None if all_partitions else [workspace_mount]).disks
+        return "\n".join(format_disk(disk, disk.mountpoint == workspace_mount) for disk in disks)
+
+    @instrumented
+    async def _arun(self, all_partitions: bool = False) -> str:
+        return await run_blocking(self._run, all_partitions)
 
-        return f"""Total: {total} GB. Used: {used} GB. Available: {free} GB". Percent Used: {usage.percent * 100}%"""
 
-    async def _arun(self):
-        return self.run()
+def format_disk(disk: DiskInfo, holds_workspace: bool = False) -> str:
+    name = f"{disk.mountpoint} (workspace)" if holds_workspace else disk.mountpoint
+    return (
+        f"{name}: Total: {gigabytes(disk.total)}. Used: {gigabytes(disk.used)}. Available: {gigabytes(disk.free)}. "
+        f"Percent Used: {disk.percent:.1f}%"
+    )
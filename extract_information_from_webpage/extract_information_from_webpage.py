@@ -1,12 +1,18 @@
-import subprocess
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional
 
 from autopack import Pack
-from autopack.utils import call_llm, acall_llm
-from bs4 import BeautifulSoup
-from playwright.async_api import async_playwright
-from playwright.sync_api import PlaywrightContextManager
 from pydantic import BaseModel, Field
 
+from async_execution import run_blocking
+from browser_pool import DEFAULT_CONTEXTS_PER_BROWSER
+from instrumentation import instrumented, phase
+from llm_cache import cached_acall_llm, cached_call_llm
+from page_fetching import afetch_page, fetch_page
+from text_extraction import DEFAULT_MAX_TOKENS, extract_text
+
 PACK_DESCRIPTION = "Extracts specific information from a webpage's content."
 
 PROMPT_TEMPLATE = """Please provide a summary of the following content, which was gathered from the website {url}:
@@ -23,13 +29,34 @@ Content:
 Answer:
 """
 
+COMBINE_PROMPT_TEMPLATE = """You are given answers that were extracted separately from several webpages. Combine them into a single answer, keeping the important details and noting which website each one came from.
+
+{task}
+
+Answers:
+{answers}
+
+Combined answer:
+"""
+
+
+NO_URL_ERROR = "Error: No webpage given, pass a url or a list of urls."
+
 
 class ExtractInformationFromWebpageArgs(BaseModel):
-    url: str = Field(..., description="The URL of the webpage to analyze.")
+    url: str = Field(default="", description="The URL of the webpage to analyze.")
     information: str = Field(
         description="The type of information to extract.",
         default="",
     )
+    urls: list[str] = Field(
+        default_factory=list,
+        description="Several webpages to extract the same information from at once, instead of a single url",
+    )
+    combine: bool = Field(
+        default=False,
+        description="Merge the answers from several webpages into a single answer",
+    )
 
 
 class ExtractInformationFromWebpage(Pack):
@@ -37,62 +64,137 @@ class ExtractInformationFromWebpage(Pack):
     description = PACK_DESCRIPTION
     args_schema = ExtractInformationFromWebpageArgs
     categories = ["Web"]
-    dependencies = ["playwright", "beautifulsoup4"]
-
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        # FIXME: Create an installer type system
-        subprocess.run(["playwright", "install"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-    def _run(self, url: str, information: str = "") -> str:
-        playwright = PlaywrightContextManager().start()
-        browser = playwright.chromium.launch()
-        try:
-            page = browser.new_page()
-
-            page.goto(url)
-            html = page.content()
-        finally:
-            browser.close()
-            playwright.stop()
-
-        soup = BeautifulSoup(html, "html.parser")
-        body_element = soup.find("body")
-
-        if body_element:
-            text = body_element.get_text(separator="\n")[:8000]
-        else:
-            return "Error: Could not summarize URL."
-
-        if information:
-            prompt = QUESTION_PROMPT_TEMPLATE.format(content=text, question=information, url=url)
-        else:
-            prompt = PROMPT_TEMPLATE.format(content=text, url=url)
+    dependencies = ["playwright", "beautifulsoup4", "requests", "aiohttp"]
 
-        response = call_llm(prompt, self.llm)
-        return response
+    max_tokens: int = Field(
+        default=DEFAULT_MAX_TOKENS,
+        description="How many tokens of the page's text to include in the prompt",
+    )
+    max_concurrency: int = Field(
+        default=DEFAULT_CONTEXTS_PER_BROWSER,
+        description="How many webpages of a batch are rendered and analyzed at the same time",
+    )
 
-    async def _arun(self, url: str, information: str = "") -> str:
-        async with async_playwright() as playwright:
-            browser = await playwright.chromium.launch()
-            page = await browser.new_page()
+    def _prompt(self, url: str, information: str, html: str) -> Optional[str]:
+        with phase("parse"):
+            text = extract_text(html, max_tokens=self.max_tokens)
+        if not text:
+            return None
 
-            await page.goto(url)
-            html = await page.content()
+        if information:
+            return QUESTION_PROMPT_TEMPLATE.format(content=text, question=information, url=url)
+        return PROMPT_TEMPLATE.format(content=text, url=url)
 
-        soup = BeautifulSoup(html, "html.parser")
-        body_element = soup.find("body")
+    def extract(self, url: str, information: str = "") -> str:
+        # Static pages are fetched with plain HTTP, only pages that need JavaScript are rendered in the browser
+        html = fetch_page(url).html
 
-        if body_element:
-            text = body_element.get_text(separator="\n")[:8000]
-        else:
+        prompt = self._prompt(url, information, html)
+        if not prompt:
             return "Error: Could not summarize URL."
 
-        if information:
-            prompt = QUESTION_PROMPT_TEMPLATE.format(content=text, question=information, url=url)
-        else:
-            prompt = PROMPT_TEMPLATE.format(content=text, url=url)
+        return cached_call_llm(prompt, self.llm)
 
-        response = await acall_llm(prompt, self.allm)
+    async def aextract(self, url: str, information: str = "") -> str:
+        html = (await afetch_page(url)).html
+
+        # Parsing a large page takes long enough to stall other tool calls
+        prompt = await run_blocking(self._prompt, url, information, html)
+        if not prompt:
+            return "Error: Could not summarize URL."
 
-        return response
+        return await cached_acall_llm(prompt, self.allm)
+
+    def extract_many(self, urls: list[str], information: str = "") -> dict[str, Any]:
+        """Extract from every page, `max_concurrency` at a time. Maps each URL to its answer, or to the exception
+        raised while rendering or analyzing it."""
+        with ThreadPoolExecutor(max_workers=max(self.max_concurrency, 1)) as executor:
+            futures = {
+                url: executor.submit(contextvars.copy_context().run, self.extract, url, information)
+                for url in _unique(urls)
+            }
+        return {url: future.exception() or future.result() for url, future in futures.items()}
+
+    async def aextract_many(self, urls: list[str], information: str = "") -> dict[str, Any]:
+        semaphore = asyncio.Semaphore(max(self.max_concurrency, 1))
+
+        async def extract(url: str) -> str:
+            async with semaphore:
+                return await self.aextract(url, information)
+
+        urls = _unique(urls)
+        answers = await asyncio.gather(*(extract(url) for url in urls), return_exceptions=True)
+        return dict(zip(urls, answers))
+
+    @instrumented
+    def _run(
+        self, url: str = "", information: str = "", urls: Optional[list[str]] = None, combine: bool = False
+    ) -> str:
+        if not url.strip() and not _unique(urls or []):
+            return NO_URL_ERROR
+        if not urls:
+            return self.extract(url, information)
+
+        answers = self.extract_many(_with_url(urls, url), information)
+        prompt = combine_prompt(answers, information) if combine else None
+        if not prompt:
+            return format_batch_answers(answers)
+        return with_failures(cached_call_llm(prompt, self.llm), answers)
+
+    @instrumented
+    async def _arun(
+        self, url: str = "", information: str = "", urls: Optional[list[str]] = None, combine: bool = False
+    ) -> str:
+        if not url.strip() and not _unique(urls or []):
+            return NO_URL_ERROR
+        if not urls:
+            return await self.aextract(url, information)
+
+        answers = await self.aextract_many(_with_url(urls, url), information)
+        prompt = combine_prompt(answers, information) if combine else None
+        if not prompt:
+            return format_batch_answers(answers)
+        return with_failures(await cached_acall_llm(prompt, self.allm), answers)
+
+
+def _unique(urls: list[str]) -> list[str]:
+    return [url for url in dict.fromkeys(url.strip() for url in urls) if url]
+
+
+def _with_url(urls: list[str], url: str) -> list[str]:
+    return [url, *urls] if url else list(urls)
+
+
+def _failed(answer: Any) -> bool:
+    return isinstance(answer, Exception) or str(answer).startswith("Error:")
+
+
+def format_batch_answers(answers: dict[str, Any]) -> str:
+    """Formats the answers from several pages, one section per URL. A page that failed gets its error instead of
+    failing the whole batch."""
+    sections = []
+    for url, answer in answers.items():
+        if isinstance(answer, Exception):
+            answer = f"Error: {answer}"
+        sections.append(f"Answer from {url}:\n{answer}")
+    return "\n\n".join(sections)
+
+
+def with_failures(combined: str, answers: dict[str, Any]) -> str:
+    """The combined answer, followed by the pages that couldn't be included in it."""
+    failures = {url: answer for url, answer in answers.items() if _failed(answer)}
+    if not failures:
+        return combined
+    return f"{combined}\n\n{format_batch_answers(failures)}"
+
+
+def combine_prompt(answers: dict[str, Any], information: str = "") -> Optional[str]:
+    """A prompt merging the answers from several pages into one, or None if fewer than two pages succeeded, in which
+    case there is nothing to merge."""
+    succeeded = {url: answer for url, answer in answers.items() if not _failed(answer)}
+    if len(succeeded) < 2:
+        return None
+
+    task = f"Question: {information}" if information else "Summarize what the websites say."
+    formatted_answers = "\n\n".join(f"From {url}:\n{answer}" for url, answer in succeeded.items())
+    return COMBINE_PROMPT_TEMPLATE.format(task=task, answers=formatted_answers)
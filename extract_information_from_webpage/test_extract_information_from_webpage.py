@@ -1,6 +1,10 @@
+import sys
+from unittest.mock import patch
+
 import pytest
 
 from extract_information_from_webpage.extract_information_from_webpage import ExtractInformationFromWebpage
+from page_fetching import FetchedPage
 
 
 def mock_llm(text_in: str):
@@ -41,3 +45,75 @@ async def test_analyze_webpage_content_async_question():
     results = await pack.arun(url="https://www.bbc.com/news", question="What are the top headlines?")
     assert "SPECIFIC QUESTION" in results
     assert "BBC" in results
+
+
+def test_construction_does_not_install_browsers():
+    with patch("subprocess.run") as mock_run:
+        ExtractInformationFromWebpage(llm=mock_llm)
+        mock_run.assert_not_called()
+
+
+@pytest.fixture
+def fake_pages(monkeypatch):
+    rendered = []
+
+    def fetch_page(url):
+        rendered.append(url)
+        if "broken" in url:
+            raise RuntimeError(f"net::ERR_NAME_NOT_RESOLVED at {url}")
+        return FetchedPage(url, f"<html><body><p>The page at {url} talks about batch extraction</p></body></html>")
+
+    async def afetch_page(url):
+        return fetch_page(url)
+
+    module = sys.modules[ExtractInformationFromWebpage.__module__]
+    monkeypatch.setattr(module, "fetch_page", fetch_page)
+    monkeypatch.setattr(module, "afetch_page", afetch_page)
+    return rendered
+
+
+URLS = ["https://a.example", "https://broken.example", "https://b.example", "https://a.example"]
+
+
+def test_extract_many_sync(fake_pages):
+    pack = ExtractInformationFromWebpage(llm=mock_llm, max_concurrency=2)
+    results = pack.run(urls=URLS, information="What is it about?")
+
+    assert sorted(fake_pages) == ["https://a.example", "https://b.example", "https://broken.example"]
+    assert results.startswith("Answer from https://a.example:\nYOU ARE A LANGUAGE MODEL")
+    assert "HTTPS://A.EXAMPLE TALKS ABOUT BATCH EXTRACTION" in results
+    assert results.count("Answer from https://a.example:") == 1
+    broken = "Answer from https://broken.example:\nError: net::ERR_NAME_NOT_RESOLVED at https://broken.example"
+    assert results.index(broken) < results.index("Answer from https://b.example:\nYOU ARE A LANGUAGE MODEL")
+
+
+@pytest.mark.asyncio
+async def test_extract_many_async_matches_sync(fake_pages):
+    pack = ExtractInformationFromWebpage(llm=mock_llm, allm=mock_allm)
+    expected = pack.run(url=URLS[0], urls=URLS[1:], information="What is it about?")
+    assert await pack.arun(url=URLS[0], urls=URLS[1:], information="What is it about?") == expected
+
+
+@pytest.mark.asyncio
+async def test_extract_many_combined(fake_pages):
+    prompts = []
+
+    async def allm(prompt):
+        prompts.append(prompt)
+        return f"answer {len(prompts)}"
+
+    pack = ExtractInformationFromWebpage(allm=allm)
+    results = await pack.arun(urls=URLS, information="What is it about?", combine=True)
+
+    assert len(prompts) == 3
+    assert "From https://a.example:\nanswer" in prompts[-1]
+    assert "Question: What is it about?" in prompts[-1]
+    assert results.startswith("answer 3\n\nAnswer from https://broken.example:\nError:")
+
+
+@pytest.mark.asyncio
+async def test_extract_without_url(fake_pages):
+    pack = ExtractInformationFromWebpage(llm=mock_llm, allm=mock_allm)
+    assert pack.run(information="What is it about?").startswith("Error: No webpage given")
+    assert (await pack.arun(urls=[" "], information="What is it about?")).startswith("Error: No webpage given")
+    assert fake_pages == []
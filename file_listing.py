@@ -0,0 +1,233 @@
+"""
+Lazily walks directory trees for listings, with gitignore-style filtering, depth limits and cursor based pagination.
+
+Each directory's entries are kept in an index that is validated against the directory's mtime, which changes whenever
+an entry is added, removed or renamed. Listing an unchanged tree again therefore costs one `stat` per directory
+instead of a `scandir` of every directory plus a `stat` of every file, and only the entries of the returned page are
+stat'ed for their size and modification time.
+"""
+import fnmatch
+import os
+import re
+import time
+from dataclasses import dataclass
+from typing import Iterator, Optional
+
+from caching import TTLCache
+from instrumentation import count
+
+# Directories modified this recently aren't indexed: another change within the filesystem's timestamp granularity
+# wouldn't change their mtime again, and the index would go stale
+RACY_WINDOW_NS = 1_000_000_000
+
+
+@dataclass(frozen=True)
+class _Rule:
+    regex: re.Pattern
+    # Path of the directory holding the .gitignore, relative to the listing root, "" for the root itself
+    base: str
+    negate: bool
+    dir_only: bool
+    # Whether the pattern is matched against the whole path below `base` rather than just the name
+    anchored: bool
+
+
+def _parse_rule(line: str, base: str) -> Optional[_Rule]:
+    line = line.rstrip("\n").rstrip()
+    if not line or line.startswith("#"):
+        return None
+
+    negate = line.startswith("!")
+    if negate:
+        line = line[1:]
+    dir_only = line.endswith("/")
+    line = line.strip("/") if dir_only else line
+    if line.startswith("**/"):
+        line = line[3:]
+    anchored = "/" in line
+    line = line.lstrip("/")
+    if not line:
+        return None
+
+    return _Rule(re.compile(fnmatch.translate(line)), base, negate, dir_only, anchored)
+
+
+class IgnoreRules:
+    """An ordered set of gitignore-style patterns. As in git, the last matching pattern decides, and `!` patterns
+    re-include paths that earlier patterns excluded."""
+
+    def __init__(self, rules: tuple[_Rule, ...] = ()):
+        self.rules = rules
+
+    @classmethod
+    def parse(cls, lines: list[str], base: str = "") -> "IgnoreRules":
+        return cls(tuple(rule for rule in (_parse_rule(line, base) for line in lines) if rule))
+
+    def __add__(self, other: "IgnoreRules") -> "IgnoreRules":
+        return IgnoreRules(self.rules + other.rules) if other.rules else self
+
+    def ignored(self, path: str, is_dir: bool) -> bool:
+        """Whether `path`, relative to the listing root, is ignored."""
+        name = path.rsplit("/", 1)[-1]
+        ignored = False
+        for rule in self.rules:
+            if rule.dir_only and not is_dir:
+                continue
+            if rule.base:
+                if not path.startswith(rule.base + "/"):
+                    continue
+                relative = path[len(rule.base) + 1 :]
+            else:
+                relative = path
+            if rule.regex.match(relative if rule.anchored else name):
+                ignored = not rule.negate
+        return ignored
+
+
+@dataclass(frozen=True)
+class ListedEntry:
+    # Relative to the listing root, with "/" separators
+    path: str
+    is_dir: bool
+    size: int = 0
+    mtime: float = 0.0
+
+
+class DirectoryIndex:
+    """Caches the sorted entries of each directory, and the parsed .gitignore files, until they change on disk."""
+
+    def __init__(self, max_directories: int = 50_000):
+        # absolute path -> (mtime_ns, ((name, is_dir), ...))
+        self._directories = TTLCache(max_entries=max_directories)
+        # absolute path -> ((mtime_ns, size), lines)
+        self._gitignores = TTLCache(max_entries=max_directories)
+
+    def entries(self, directory: str) -> tuple[tuple[str, bool], ...]:
+        """The (name, is_dir) entries of `directory`, sorted by name. Symlinks to directories aren't followed."""
+        mtime_ns = os.stat(directory).st_mtime_ns
+        cached = self._directories.get(directory)
+        if cached is not None and cached[0] == mtime_ns:
+            count("directory_index_hits")
+            return cached[1]
+
+        count("directory_index_misses")
+        with os.scandir(directory) as scanned:
+            entries = tuple(sorted((entry.name, entry.is_dir(follow_symlinks=False)) for entry in scanned))
+        if time.time_ns() - mtime_ns > RACY_WINDOW_NS:
+            self._directories.set(directory, (mtime_ns, entries))
+        return entries
+
+    def gitignore(self, directory: str, base: str) -> IgnoreRules:
+        path = os.path.join(directory, ".gitignore")
+        try:
+            stat = os.stat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            return IgnoreRules()
+
+        version = (stat.st_mtime_ns, stat.st_size)
+        cached = self._gitignores.get(path)
+        if cached is None or cached[0] != version:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                cached = (version, f.readlines())
+            if time.time_ns() - stat.st_mtime_ns > RACY_WINDOW_NS:
+                self._gitignores.set(path, cached)
+        return IgnoreRules.parse(cached[1], base)
+
+    def clear(self):
+        self._directories.clear()
+        self._gitignores.clear()
+
+    def walk(
+        self,
+        root: str,
+        start: str = "",
+        ignore: IgnoreRules = IgnoreRules(),
+        max_depth: int = 0,
+        after: str = "",
+    ) -> Iterator[tuple[str, bool]]:
+        """
+        Yield the (path, is_dir) of every entry below `root/start` that isn't ignored, depth first and sorted by name,
+        with paths relative to `root`. `max_depth` limits how many levels are descended (0 for no limit), and `after`
+        resumes the walk after that path; whole subtrees before it are skipped without being read. .gitignore files
+        found on the way apply to their directory's subtree, on top of `ignore`.
+        """
+        after_parts = tuple(after.split("/")) if after else ()
+        start = start.strip("/")
+        prefix = tuple(start.split("/")) if start else ()
+
+        # .gitignore files between the root and the start apply too
+        for depth in range(len(prefix) + 1):
+            directory = "/".join(prefix[:depth])
+            ignore = ignore + self.gitignore(os.path.join(root, directory), directory)
+
+        yield from self._walk(root, prefix, ignore, max_depth, after_parts, 1)
+
+    def _walk(self, root, parts, ignore, max_depth, after_parts, depth) -> Iterator[tuple[str, bool]]:
+        directory = os.path.join(root, *parts)
+        for name, is_dir in self.entries(directory):
+            entry_parts = parts + (name,)
+            # Entries are visited in the order of their path components, so everything up to the cursor is skipped
+            cursor_prefix = after_parts[: len(entry_parts)]
+            if entry_parts < cursor_prefix:
+                continue
+            resumed = entry_parts > cursor_prefix
+
+            path = "/".join(entry_parts)
+            if ignore.ignored(path, is_dir):
+                continue
+            if resumed:
+                yield path, is_dir
+            if is_dir and (not max_depth or depth < max_depth):
+                yield from self._walk(
+                    root,
+                    entry_parts,
+                    ignore + self.gitignore(os.path.join(root, path), path),
+                    max_depth,
+                    after_parts if not resumed else (),
+                    depth + 1,
+                )
+
+
+_index = DirectoryIndex()
+
+
+def describe(root: str, path: str, is_dir: bool) -> Optional[ListedEntry]:
+    """The entry with its size and modification time, or None if it has been removed since it was listed."""
+    try:
+        stat = os.stat(os.path.join(root, path), follow_symlinks=False)
+    except FileNotFoundError:
+        return None
+    return ListedEntry(path, is_dir, 0 if is_dir else stat.st_size, stat.st_mtime)
+
+
+def list_page(
+    root: str,
+    start: str = "",
+    ignore: IgnoreRules = IgnoreRules(),
+    pattern: str = "",
+    max_depth: int = 0,
+    limit: int = 0,
+    cursor: str = "",
+    index: Optional[DirectoryIndex] = None,
+) -> tuple[list[ListedEntry], str]:
+    """
+    One page of up to `limit` entries (0 for all of them) below `root/start`, and the cursor to pass to get the next
+    page, which is empty on the last one. `pattern` is a glob matched against the names of entries, or against their
+    path relative to `start` if it contains a "/"; directories are descended into whether they match or not.
+    """
+    index = index or _index
+    regex = re.compile(fnmatch.translate(pattern)) if pattern else None
+    start = start.strip("/")
+
+    page = []
+    for path, is_dir in index.walk(root, start, ignore, max_depth, after=cursor):
+        if regex:
+            subject = path[len(start) + 1 :] if start else path
+            if not regex.match(subject if "/" in pattern else subject.rsplit("/", 1)[-1]):
+                continue
+        if limit and len(page) == limit:
+            return page, page[-1].path
+        entry = describe(root, path, is_dir)
+        if entry:
+            page.append(entry)
+    return page, ""
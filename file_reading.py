@@ -0,0 +1,146 @@
+"""
+Reads slices of text files without loading them whole: files are memory mapped, so reading a byte range, a range of
+lines or the last lines of a multi-gigabyte log only touches the pages holding them (plus, for line ranges, the pages
+scanned for line breaks before them).
+"""
+import mmap
+import os
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterator, Union
+
+# How much of the start of a file is looked at to tell binary files from text
+BINARY_SAMPLE_BYTES = 8192
+_TEXT_CONTROL_BYTES = {7, 8, 9, 10, 12, 13, 27}
+
+
+@dataclass
+class FileSlice:
+    text: str
+    # Byte offsets of the slice, and the size of the whole file
+    start: int
+    end: int
+    size: int
+    # Whether the slice was cut short by `max_bytes`
+    truncated: bool = False
+
+
+class BinaryFileError(ValueError):
+    pass
+
+
+@contextmanager
+def mapped(path: Union[str, os.PathLike, int]) -> Iterator[Union[mmap.mmap, bytes]]:
+    """The contents of `path`, memory mapped. Empty files can't be mapped, and are empty bytes instead. `path` can
+    also be a file descriptor, which is then closed."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b""
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield data
+
+
+def is_binary(sample: bytes) -> bool:
+    if b"\0" in sample:
+        return True
+    try:
+        sample.decode("utf-8")
+        return False
+    except UnicodeDecodeError as e:
+        # The sample can end in the middle of a character
+        if e.start >= len(sample) - 3 and e.reason == "unexpected end of data":
+            return False
+    # Text in another encoding still has few control characters
+    control = sum(1 for byte in sample if byte < 32 and byte not in _TEXT_CONTROL_BYTES)
+    return control > len(sample) * 0.1
+
+
+def line_range(data: Union[mmap.mmap, bytes], start_line: int, end_line: int = 0) -> tuple[int, int]:
+    """Byte offsets of lines `start_line` to `end_line`, counted from 1 and inclusive. An `end_line` of 0 reads to the
+    end of the file."""
+    start = 0
+    for _ in range(max(start_line, 1) - 1):
+        newline = data.find(b"\n", start)
+        if newline == -1:
+            return len(data), len(data)
+        start = newline + 1
+
+    if not end_line:
+        return start, len(data)
+    end = start
+    for _ in range(end_line - max(start_line, 1) + 1):
+        newline = data.find(b"\n", end)
+        if newline == -1:
+            return start, len(data)
+        end = newline + 1
+    return start, end
+
+
+def line_count(data: Union[mmap.mmap, bytes]) -> int:
+    """The number of lines in `data`, counting a last line without a trailing newline."""
+    lines, start = 0, 0
+    while (newline := data.find(b"\n", start)) != -1:
+        lines += 1
+        start = newline + 1
+    return lines + (start < len(data))
+
+
+def tail_start(data: Union[mmap.mmap, bytes], lines: int) -> int:
+    """Byte offset of the last `lines` lines."""
+    position = len(data) - 1 if data[-1:] == b"\n" else len(data)
+    for _ in range(lines):
+        newline = data.rfind(b"\n", 0, position)
+        if newline == -1:
+            return 0
+        position = newline
+    return position + 1
+
+
+def _char_boundary(data: Union[mmap.mmap, bytes], offset: int, forward: bool) -> int:
+    # Moves off UTF-8 continuation bytes, so slices don't start or end in the middle of a character
+    for _ in range(3):
+        if 0 < offset < len(data) and data[offset] & 0xC0 == 0x80:
+            offset += 1 if forward else -1
+    return offset
+
+
+def read_slice(
+    path: Union[str, os.PathLike, int],
+    offset: int = 0,
+    length: int = 0,
+    start_line: int = 0,
+    end_line: int = 0,
+    head: int = 0,
+    tail: int = 0,
+    max_bytes: int = 0,
+    encoding: str = "utf-8",
+) -> FileSlice:
+    """
+    Read part of a text file: the last `tail` lines, the first `head` lines, lines `start_line` to `end_line`, or
+    `length` bytes from `offset`, in that order of precedence, and the whole file if none of them are given. At most
+    `max_bytes` are read (0 for no limit). Raises BinaryFileError for files that don't look like text.
+    """
+    with mapped(path) as data:
+        size = len(data)
+        if is_binary(data[:BINARY_SAMPLE_BYTES]):
+            raise BinaryFileError(f"Binary file of {size} bytes")
+
+        if tail:
+            start, end = tail_start(data, tail), size
+        elif head:
+            start, end = line_range(data, 1, head)
+        elif start_line or end_line:
+            start, end = line_range(data, start_line, end_line)
+        else:
+            start = min(max(offset, 0), size)
+            end = min(start + length, size) if length else size
+            start = _char_boundary(data, start, forward=True)
+
+        truncated = bool(max_bytes) and end - start > max_bytes
+        if truncated:
+            end = _char_boundary(data, start + max_bytes, forward=False)
+        else:
+            end = _char_boundary(data, end, forward=True)
+
+        return FileSlice(data[start:end].decode(encoding, errors="replace"), start, end, size, truncated)
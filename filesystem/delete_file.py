@@ -1,6 +1,13 @@
+import os
+from typing import Optional
+
 from autopack import Pack
+from autopack.filesystem_emulation.workspace_file_manager import WorkspaceFileManager
 from pydantic import BaseModel, Field
 
+from filesystem_utils import workspace_paths
+from instrumentation import instrumented
+
 
 class DeleteFileArgs(BaseModel):
     filename: str = Field(..., description="The basename of the file to be deleted")
@@ -12,8 +19,20 @@ class DeleteFile(Pack):
     args_schema = DeleteFileArgs
     categories = ["Files"]
 
+    def _check(self, filename: str) -> Optional[str]:
+        if not isinstance(self.filesystem_manager, WorkspaceFileManager):
+            return None
+        # The directory must be inside the workspace. The file itself may be a symlink pointing elsewhere, which is
+        # fine: deleting it removes the link, not its target.
+        workspace = workspace_paths(str(self.filesystem_manager.workspace_dir))
+        if not workspace.resolve(os.path.dirname(filename) or ".", fresh=True) or not os.path.basename(filename):
+            return f"Error: File not found '{filename}'"
+        return None
+
+    @instrumented
     def _run(self, filename: str) -> str:
-        return self.filesystem_manager.delete_file(filename)
+        return self._check(filename) or self.filesystem_manager.delete_file(filename)
 
+    @instrumented
     async def _arun(self, filename: str) -> str:
-        return self.filesystem_manager.adelete_file(filename)
+        return self._check(filename) or await self.filesystem_manager.adelete_file(filename)
@@ -1,22 +1,101 @@
+import os
+from datetime import datetime
+from typing import Optional
+
 from autopack import Pack
+from autopack.filesystem_emulation.workspace_file_manager import WorkspaceFileManager
 from pydantic import BaseModel, Field
 
+from async_execution import run_blocking
+from file_listing import IgnoreRules, ListedEntry, list_page
+from filesystem_utils import workspace_paths
+from instrumentation import instrumented
+
 # A few Packs will use poetry inside of the workspace, and the AI gets hella confused when these files are present.
 IGNORE_FILES = ["pyproject.toml", "poetry.lock"]
+# Never useful to list, and large enough to drown out everything else. .gitignore files are applied on top of these.
+IGNORE_PATTERNS = IGNORE_FILES + [".git/"]
+_ignore_rules = IgnoreRules.parse(IGNORE_PATTERNS)
+
+PAGE_SIZE = 200
 
 
 class ListFilesArgs(BaseModel):
-    path: str = Field(description="The directory to list the files of")
+    path: str = Field(default=".", description="The directory to list the files of")
+    pattern: str = Field(
+        default="",
+        description="Only list entries whose name matches this glob, e.g. '*.py', or whose path below `path` does if "
+        "it contains a '/', e.g. 'src/*/test_*.py'",
+    )
+    max_depth: int = Field(default=1, description="How many levels of subdirectories to list, 0 for all of them")
+    cursor: str = Field(default="", description="The cursor returned by a previous call, to get the next page")
 
 
 class ListFiles(Pack):
     name = "list_files"
-    description = "Provides a list of all accessible files in a given path."
+    description = (
+        "Provides a list of the accessible files in a given path, with their sizes and modification times. Files "
+        "ignored by .gitignore are left out, and long listings are split into pages."
+    )
     args_schema = ListFilesArgs
     categories = ["Files"]
 
-    def _run(self, path: str):
-        return self.filesystem_manager.list_files(path)
+    page_size: int = Field(default=PAGE_SIZE, description="The most entries listed per call")
+
+    def _root(self) -> Optional[str]:
+        """The canonical workspace directory, or None if the files aren't in a workspace on the local disk, in which
+        case the listing is left to the filesystem manager."""
+        if isinstance(self.filesystem_manager, WorkspaceFileManager):
+            return workspace_paths(str(self.filesystem_manager.workspace_dir)).root
+        return None
+
+    def _list(self, root: str, path: str, pattern: str, max_depth: int, cursor: str) -> str:
+        directory = workspace_paths(root).resolve(path)
+        if not directory or not os.path.isdir(directory):
+            return f"Error: No such directory {path}."
+
+        start = os.path.relpath(directory, root).replace(os.sep, "/")
+        entries, next_cursor = list_page(
+            root,
+            "" if start == "." else start,
+            ignore=_ignore_rules,
+            pattern=pattern,
+            max_depth=max_depth,
+            limit=self.page_size,
+            cursor=cursor,
+        )
+        if not entries:
+            return f"No files found in {path}."
+
+        listing = "\n".join(format_entry(entry) for entry in entries)
+        if next_cursor:
+            listing += f"\n(More files are available, call again with cursor={next_cursor!r})"
+        return listing
+
+    @instrumented
+    def _run(self, path: str = ".", pattern: str = "", max_depth: int = 1, cursor: str = "") -> str:
+        root = self._root()
+        if root is None:
+            return self.filesystem_manager.list_files(path)
+        return self._list(root, path, pattern, max_depth, cursor)
+
+    @instrumented
+    async def _arun(self, path: str = ".", pattern: str = "", max_depth: int = 1, cursor: str = "") -> str:
+        root = self._root()
+        if root is None:
+            return await self.filesystem_manager.alist_files(path)
+        return await run_blocking(self._list, root, path, pattern, max_depth, cursor)
+
+
+def format_entry(entry: ListedEntry) -> str:
+    if entry.is_dir:
+        return f"{entry.path}/"
+    modified = datetime.fromtimestamp(entry.mtime).strftime("%Y-%m-%d %H:%M")
+    return f"{entry.path} ({format_size(entry.size)}, modified {modified})"
+
 
-    async def _arun(self, path: str) -> str:
-        return await self.filesystem_manager.alist_files(path)
+def format_size(size: int) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
@@ -1,22 +1,121 @@
+import os
+import stat
+from typing import Optional
+
 from autopack import Pack
+from autopack.filesystem_emulation.workspace_file_manager import WorkspaceFileManager
 from pydantic import BaseModel, Field
 
+from async_execution import run_blocking
+from file_reading import BinaryFileError, read_slice
+from filesystem_utils import WorkspacePaths, workspace_paths
+from instrumentation import count, instrumented, phase
+
+# Enough for most source files, while keeping a huge log or CSV from filling the whole prompt
+DEFAULT_MAX_BYTES = 100_000
+
 
 class ReadFileArgs(BaseModel):
     filename: str = Field(
         ...,
         description="The name of the file to be read.",
     )
+    start_line: int = Field(default=0, description="The first line to read, counting from 1")
+    end_line: int = Field(default=0, description="The last line to read, 0 to read to the end of the file")
+    head: int = Field(default=0, description="Read only this many lines from the start of the file")
+    tail: int = Field(default=0, description="Read only this many lines from the end of the file")
+    offset: int = Field(default=0, description="The byte offset to start reading at")
+    length: int = Field(default=0, description="How many bytes to read from `offset`, 0 to read to the end")
 
 
 class ReadFile(Pack):
     name = "read_file"
-    description = "Reads and returns the content of a specified file from the disk."
+    description = (
+        "Reads and returns the content of a specified file from the disk. Large files can be read in parts, by line "
+        "range, first or last lines, or byte range."
+    )
     args_schema = ReadFileArgs
     categories = ["Files"]
 
-    def _run(self, filename: str) -> str:
-        return self.filesystem_manager.read_file(filename)
+    max_bytes: int = Field(default=DEFAULT_MAX_BYTES, description="The most bytes returned by one read, 0 for no limit")
+
+    def _workspace(self) -> Optional[WorkspacePaths]:
+        """The workspace on the local disk, or None if the files aren't in one, in which case the read is left to the
+        filesystem manager."""
+        if not isinstance(self.filesystem_manager, WorkspaceFileManager):
+            return None
+        return workspace_paths(str(self.filesystem_manager.workspace_dir))
+
+    def _read(self, workspace: WorkspacePaths, filename: str, **ranges: int) -> str:
+        try:
+            fd = workspace.open(filename)
+        except OSError:
+            return "Error: File not found"
+        if not stat.S_ISREG(os.fstat(fd).st_mode):
+            os.close(fd)
+            return "Error: File not found"
+
+        try:
+            with phase("read"):
+                file_slice = read_slice(fd, max_bytes=self.max_bytes, **ranges)
+        except BinaryFileError:
+            return f"Error: {filename} is a binary file and can't be read as text"
+        count("bytes_read", file_slice.end - file_slice.start)
+
+        if file_slice.truncated:
+            return (
+                f"{file_slice.text}\n[Truncated: showing bytes {file_slice.start}-{file_slice.end} of "
+                f"{file_slice.size} in {filename}. Read on with offset={file_slice.end}, or ask for specific lines.]"
+            )
+        return file_slice.text
+
+    @instrumented
+    def _run(
+        self,
+        filename: str,
+        start_line: int = 0,
+        end_line: int = 0,
+        head: int = 0,
+        tail: int = 0,
+        offset: int = 0,
+        length: int = 0,
+    ) -> str:
+        workspace = self._workspace()
+        if workspace is None:
+            return self.filesystem_manager.read_file(filename)
+        return self._read(
+            workspace,
+            filename,
+            start_line=start_line,
+            end_line=end_line,
+            head=head,
+            tail=tail,
+            offset=offset,
+            length=length,
+        )
 
-    async def _arun(self, filename: str) -> str:
-        return await self.filesystem_manager.aread_file(filename)
+    @instrumented
+    async def _arun(
+        self,
+        filename: str,
+        start_line: int = 0,
+        end_line: int = 0,
+        head: int = 0,
+        tail: int = 0,
+        offset: int = 0,
+        length: int = 0,
+    ) -> str:
+        workspace = self._workspace()
+        if workspace is None:
+            return await self.filesystem_manager.aread_file(filename)
+        return await run_blocking(
+            self._read,
+            workspace,
+            filename,
+            start_line=start_line,
+            end_line=end_line,
+            head=head,
+            tail=tail,
+            offset=offset,
+            length=length,
+        )
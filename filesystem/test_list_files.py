@@ -13,3 +13,49 @@ def test_list_files():
 
     for path in paths:
         assert path in file_list
+
+
+def make_files(*paths: str):
+    for path in paths:
+        full_path = os.path.join("workspace", path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "w+") as f:
+            f.write("some string")
+
+
+def test_list_files_ignores_files():
+    make_files("main.py", "pyproject.toml", "build/out.o", "src/module.py", "src/cache.pyc", ".git/HEAD")
+    with open(os.path.join("workspace", ".gitignore"), "w+") as f:
+        f.write("build/\n*.pyc\n")
+
+    file_list = ListFiles().run(path=".", max_depth=0)
+
+    assert "main.py (11 B, modified " in file_list
+    assert "src/\nsrc/module.py" in file_list
+    for ignored in ["pyproject.toml", "build", "cache.pyc", ".git/"]:
+        assert ignored not in file_list
+
+
+def test_list_files_depth_and_pattern():
+    make_files("a.py", "a.txt", "src/b.py", "src/deeper/c.py")
+
+    assert ListFiles().run(path=".").split("\n")[-1] == "src/"
+    file_list = ListFiles().run(path="src", pattern="*.py", max_depth=0)
+    assert [line.split(" ")[0] for line in file_list.split("\n")] == ["src/b.py", "src/deeper/c.py"]
+
+
+def test_list_files_pages():
+    make_files(*(f"dir_{i}/file.txt" for i in range(5)))
+    pack = ListFiles(page_size=4)
+
+    first_page = pack.run(path=".", max_depth=0)
+    assert "cursor='dir_1/file.txt'" in first_page
+    second_page = pack.run(path=".", max_depth=0, cursor="dir_1/file.txt")
+    assert "cursor='dir_3/file.txt'" in second_page
+    last_page = pack.run(path=".", max_depth=0, cursor="dir_3/file.txt")
+    assert last_page.split("\n")[0] == "dir_4/"
+    assert "cursor" not in last_page
+
+
+def test_list_files_outside_workspace():
+    assert "Error" in ListFiles().run(path="..")
@@ -8,3 +8,36 @@ def test_read_file():
         f.write("some string")
 
     assert ReadFile().run(filename="some_file.txt") == "some string"
+
+
+def write_lines(count: int) -> str:
+    with open(os.path.join("workspace", "log.txt"), "w+") as f:
+        f.write("".join(f"line {i}\n" for i in range(1, count + 1)))
+    return "log.txt"
+
+
+def test_read_file_parts():
+    filename = write_lines(100)
+    pack = ReadFile()
+
+    assert pack.run(filename=filename, start_line=3, end_line=4) == "line 3\nline 4\n"
+    assert pack.run(filename=filename, head=2) == "line 1\nline 2\n"
+    assert pack.run(filename=filename, tail=2) == "line 99\nline 100\n"
+    assert pack.run(filename=filename, offset=7, length=7) == "line 2\n"
+
+
+def test_read_file_max_bytes():
+    filename = write_lines(100)
+    response = ReadFile(max_bytes=14).run(filename=filename)
+
+    assert response.startswith("line 1\nline 2\n\n[Truncated: showing bytes 0-14 of 792 in log.txt.")
+    assert "offset=14" in response
+
+
+def test_read_file_errors():
+    with open(os.path.join("workspace", "image.png"), "wb+") as f:
+        f.write(b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR")
+
+    assert ReadFile().run(filename="image.png") == "Error: image.png is a binary file and can't be read as text"
+    assert ReadFile().run(filename="missing.txt") == "Error: File not found"
+    assert ReadFile().run(filename="../outside.txt") == "Error: File not found"
@@ -8,3 +8,73 @@ def test_write_file():
 
     with open(os.path.join("workspace", "some_file_to_write.txt"), "r") as f:
         assert f.read() == "some string"
+
+
+def read(filename: str) -> str:
+    with open(os.path.join("workspace", filename), "r") as f:
+        return f.read()
+
+
+def test_append_and_patch():
+    pack = WriteFile()
+    pack.run(filename="notes.txt", text_content="line 1\nline 2\n")
+    assert pack.run(filename="notes.txt", text_content="line 3\n", mode="append") == (
+        "Successfully appended 7 bytes to notes.txt"
+    )
+    assert read("notes.txt") == "line 1\nline 2\nline 3\n"
+
+    pack.run(filename="notes.txt", text_content="second line", mode="patch", start_line=2)
+    assert read("notes.txt") == "line 1\nsecond line\nline 3\n"
+    pack.run(filename="notes.txt", text_content="line 0\n", mode="patch", start_line=1, end_line=0)
+    assert read("notes.txt") == "line 0\nline 1\nsecond line\nline 3\n"
+    pack.run(filename="notes.txt", text_content="", mode="patch", start_line=2, end_line=3)
+    assert read("notes.txt") == "line 0\nline 3\n"
+
+
+def test_patch_past_the_end():
+    pack = WriteFile()
+    pack.run(filename="notes.txt", text_content="line 1\nline 2")
+    assert pack.run(filename="notes.txt", text_content="line 4", mode="patch", start_line=4) == (
+        "Error: start_line 4 is past the end of notes.txt (2 lines)."
+    )
+    assert pack.run(filename="notes.txt", text_content="x", mode="patch", start_line=3, end_line=3).startswith("Error")
+    assert read("notes.txt") == "line 1\nline 2"
+
+    # Inserting before the line after the last one adds to the end
+    pack.run(filename="notes.txt", text_content="line 3", mode="patch", start_line=3, end_line=2)
+    assert read("notes.txt") == "line 1\nline 2\nline 3"
+
+
+def test_write_several_files():
+    response = WriteFile().run(files={"a.txt": "a", "dir/b.txt": "b"})
+
+    assert response == "Successfully wrote 1 bytes to a.txt\nSuccessfully wrote 1 bytes to dir/b.txt"
+    assert read("a.txt") == "a"
+    assert read("dir/b.txt") == "b"
+
+
+def test_write_filename_and_files():
+    response = WriteFile().run(filename="single.txt", text_content="single", files={"batch.txt": "batch"})
+
+    assert response == "Successfully wrote 5 bytes to batch.txt\nSuccessfully wrote 6 bytes to single.txt"
+    assert read("single.txt") == "single"
+    assert read("batch.txt") == "batch"
+
+
+def test_write_errors():
+    pack = WriteFile()
+    assert "inside the workspace" in pack.run(files={"c.txt": "c", "../outside.txt": "d"})
+    # Nothing in the batch is written when one of its paths is rejected
+    assert not os.path.exists(os.path.join("workspace", "c.txt"))
+    assert "Unknown mode" in pack.run(filename="a.txt", text_content="a", mode="prepend")
+    assert "File not found" in pack.run(filename="missing.txt", text_content="a", mode="patch", start_line=1)
+
+
+def test_write_rejects_a_symlink_swapped_in(tmpdir):
+    pack = WriteFile()
+    pack.run(filename="dir/a.txt", text_content="a")
+    os.rename(os.path.join("workspace", "dir"), os.path.join("workspace", "moved"))
+    os.symlink(str(tmpdir.mkdir("outside")), os.path.join("workspace", "dir"))
+
+    assert "inside the workspace" in pack.run(filename="dir/a.txt", text_content="b")
+    assert not os.path.exists(tmpdir.join("outside", "a.txt"))
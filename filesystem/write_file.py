@@ -1,25 +1,54 @@
 import logging
+import os
+from itertools import chain
+from typing import Iterator, Optional
 
 from autopack import Pack
+from autopack.filesystem_emulation.workspace_file_manager import WorkspaceFileManager
 from pydantic import BaseModel, Field
 
+from async_execution import run_blocking
+from file_reading import line_count, line_range, mapped
+from filesystem_utils import atomic_write, workspace_paths
+from instrumentation import count, instrumented, phase
+
 PACK_DESCRIPTION = (
     "Allows you to write specified text content to a file, creating a new file or overwriting an existing one as "
-    "necessary."
+    "necessary. Can also append to a file, replace a range of its lines, or write several files at once."
 )
 
+WRITE_MODES = ("overwrite", "append", "patch")
+# Patched files are copied over in chunks of this many bytes, so a large file isn't read into memory whole
+COPY_CHUNK_BYTES = 1024 * 1024
+
 logger = logging.getLogger(__name__)
 
 
 class WriteFileArgs(BaseModel):
     filename: str = Field(
-        ...,
+        default="",
         description="Specifies the name of the file to which the content will be written.",
     )
     text_content: str = Field(
-        ...,
+        default="",
         description="The content that will be written to the specified file.",
     )
+    mode: str = Field(
+        default="overwrite",
+        description="'overwrite' to replace the whole file, 'append' to add the content to its end, or 'patch' to "
+        "replace lines start_line to end_line with the content",
+    )
+    start_line: int = Field(default=0, description="For 'patch': the first line to replace, counting from 1")
+    end_line: Optional[int] = Field(
+        default=None,
+        description="For 'patch': the last line to replace. Defaults to start_line, use start_line - 1 to insert the "
+        "content before start_line without replacing anything",
+    )
+    files: dict[str, str] = Field(
+        default_factory=dict,
+        description="Several files to overwrite at once, mapping each file name to its content, instead of "
+        "filename and text_content",
+    )
 
 
 class WriteFile(Pack):
@@ -31,8 +60,136 @@ class WriteFile(Pack):
     # TODO: This can be reversible for some, but not all, file manager types
     reversible = False
 
-    def _run(self, filename: str, text_content: str):
-        return self.filesystem_manager.write_file(filename, text_content)
+    def _workspace(self) -> Optional[str]:
+        """The workspace directory, or None if the files aren't in a workspace on the local disk, in which case only
+        whole files can be written, through the filesystem manager."""
+        if isinstance(self.filesystem_manager, WorkspaceFileManager):
+            return str(self.filesystem_manager.workspace_dir)
+        return None
+
+    def _write(
+        self, workspace: str, files: dict[str, str], mode: str, start_line: int = 0, end_line: Optional[int] = None
+    ) -> str:
+        # Every path is checked before anything is written, so a bad path doesn't leave a batch half done
+        resolver = workspace_paths(workspace)
+        paths = {}
+        for filename in files:
+            path = resolver.resolve(filename, fresh=True)
+            if not path or not filename:
+                return f"Error: Can't write to {filename!r}, files must be inside the workspace."
+            paths[filename] = path
+
+        results = []
+        with phase("write"):
+            for filename, content in files.items():
+                results.append(write_file(paths[filename], filename, content, mode, start_line, end_line))
+                count("bytes_written", len(content.encode("utf-8")))
+        return "\n".join(results)
+
+    @staticmethod
+    def _files(filename: str, text_content: str, files: Optional[dict[str, str]]) -> dict[str, str]:
+        files = dict(files or {})
+        if filename:
+            files[filename] = text_content
+        return files
+
+    def _check(self, filename: str, mode: str, start_line: int, files: Optional[dict[str, str]]) -> Optional[str]:
+        if mode not in WRITE_MODES:
+            return f"Error: Unknown mode {mode!r}, use one of {', '.join(WRITE_MODES)}."
+        if files and mode != "overwrite":
+            return "Error: Several files can only be written in 'overwrite' mode."
+        if not files and not filename:
+            return "Error: No filename given."
+        if mode == "patch" and start_line < 1:
+            return "Error: 'patch' mode needs a start_line, counting from 1."
+        return None
+
+    @instrumented
+    def _run(
+        self,
+        filename: str = "",
+        text_content: str = "",
+        mode: str = "overwrite",
+        start_line: int = 0,
+        end_line: Optional[int] = None,
+        files: Optional[dict[str, str]] = None,
+    ) -> str:
+        error = self._check(filename, mode, start_line, files)
+        if error:
+            return error
+
+        files = self._files(filename, text_content, files)
+        workspace = self._workspace()
+        if workspace is None:
+            if mode != "overwrite":
+                return f"Error: '{mode}' mode is only supported for files in a workspace on the local disk."
+            return "\n".join(self.filesystem_manager.write_file(name, content) for name, content in files.items())
+        return self._write(workspace, files, mode, start_line, end_line)
+
+    @instrumented
+    async def _arun(
+        self,
+        filename: str = "",
+        text_content: str = "",
+        mode: str = "overwrite",
+        start_line: int = 0,
+        end_line: Optional[int] = None,
+        files: Optional[dict[str, str]] = None,
+    ) -> str:
+        error = self._check(filename, mode, start_line, files)
+        if error:
+            return error
+
+        files = self._files(filename, text_content, files)
+        workspace = self._workspace()
+        if workspace is None:
+            if mode != "overwrite":
+                return f"Error: '{mode}' mode is only supported for files in a workspace on the local disk."
+            return "\n".join(
+                [await self.filesystem_manager.awrite_file(name, content) for name, content in files.items()]
+            )
+        return await run_blocking(self._write, workspace, files, mode, start_line, end_line)
+
+
+def write_file(
+    path: str, filename: str, content: str, mode: str, start_line: int = 0, end_line: Optional[int] = None
+) -> str:
+    """Write `content` to the file at `path` in `mode`, returning a message for the agent."""
+    data = content.encode("utf-8")
+
+    if mode == "append":
+        # A single write to a file opened for appending lands whole at its end, without rewriting what's there
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "ab") as f:
+            f.write(data)
+        return f"Successfully appended {len(data)} bytes to {filename}"
+
+    if mode == "patch":
+        if not os.path.isfile(path):
+            return f"Error: File not found {filename}"
+        end_line = start_line if end_line is None else end_line
+        with mapped(path) as existing:
+            if end_line >= start_line:
+                start, end = line_range(existing, start_line, end_line)
+            else:
+                start = end = line_range(existing, start_line)[0]
+            if start == len(existing):
+                # Only inserting right after the last line is allowed at the end, anything else is a miscounted line
+                lines = line_count(existing)
+                if start_line > lines + (end_line < start_line):
+                    return f"Error: start_line {start_line} is past the end of {filename} ({lines} lines)."
+                if existing[-1:] not in (b"", b"\n"):
+                    data = b"\n" + data
+            if data and not data.endswith(b"\n") and end < len(existing):
+                data += b"\n"
+            atomic_write(path, chain(_chunks(existing, 0, start), [data], _chunks(existing, end, len(existing))))
+        replaced = f"lines {start_line}-{end_line}" if end_line >= start_line else f"nothing before line {start_line}"
+        return f"Successfully replaced {replaced} of {filename} with {len(content.splitlines())} lines"
+
+    atomic_write(path, content)
+    return f"Successfully wrote {len(data)} bytes to {filename}"
+
 
-    async def _arun(self, filename: str, text_content: str) -> str:
-        return await self.config.filesystem_manager.awrite_file(filename, text_content)
+def _chunks(data: bytes, start: int, end: int) -> Iterator[bytes]:
+    for offset in range(start, end, COPY_CHUNK_BYTES):
+        yield data[offset : min(offset + COPY_CHUNK_BYTES, end)]
@@ -1,11 +1,139 @@
+import errno
 import os
+import tempfile
+from typing import Iterable, Optional, Union
 
+from caching import TTLCache
 
-def restrict_path(file_path: str, workspace_dir: str):
-    absolute_path = os.path.abspath(file_path)
-    relative_path = os.path.relpath(absolute_path, workspace_dir)
+# How long a resolved path is trusted before it is resolved again. The packs never create symlinks, so only changes
+# made outside of them can make a memoized resolution stale. Writes resolve their paths afresh, and WorkspacePaths.open
+# doesn't rely on the memo at all, so a stale resolution can only ever be read from.
+RESOLUTION_TTL = 2.0
+_MISSING = object()
 
-    if relative_path.startswith("..") or "/../" in relative_path:
-        return None
 
-    return absolute_path
+def _default_file_mode() -> int:
+    # The umask can only be read by setting it, so this is done once at import rather than on every write
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+DEFAULT_FILE_MODE = _default_file_mode()
+
+
+class WorkspacePaths:
+    """
+    Resolves paths inside a workspace directory. Paths are canonicalized with `realpath` against the workspace's own
+    canonical path, so neither `..` nor a symlink can lead outside of it, and resolutions are memoized for
+    RESOLUTION_TTL seconds.
+    """
+
+    def __init__(self, workspace_dir: str, ttl: float = RESOLUTION_TTL, max_entries: int = 4096):
+        self.root = os.path.realpath(workspace_dir)
+        self._root_prefix = self.root if self.root.endswith(os.sep) else self.root + os.sep
+        self._resolved = TTLCache(max_entries=max_entries, ttl=ttl)
+
+    def _inside(self, path: str) -> bool:
+        return path == self.root or path.startswith(self._root_prefix)
+
+    def resolve(self, path: str, fresh: bool = False) -> Optional[str]:
+        """The canonical absolute path of `path`, which is either absolute or relative to the workspace, or None if it
+        is outside of the workspace. The path doesn't have to exist. Paths that are about to be written to or deleted
+        are resolved `fresh`, as a symlink swapped in since the memoized resolution could lead outside."""
+        resolved = _MISSING if fresh else self._resolved.get(path, _MISSING)
+        if resolved is _MISSING:
+            resolved = os.path.realpath(os.path.join(self.root, path))
+            if not self._inside(resolved):
+                resolved = None
+            self._resolved.set(path, resolved)
+        return resolved
+
+    def invalidate(self):
+        """Forget every memoized resolution, e.g. after symlinks in the workspace were changed."""
+        self._resolved.clear()
+
+    def open(self, path: str, flags: int = os.O_RDONLY, mode: int = 0o666) -> int:
+        """
+        Open `path` like `os.open`, walking down from the workspace one directory file descriptor at a time without
+        following symlinks, so the file opened is the one that was checked even if the tree changes meanwhile. Paths
+        through symlinks are resolved and checked instead. Raises PermissionError for paths outside of the workspace.
+        """
+        normalized = os.path.normpath(os.path.join(self.root, path))
+        if not self._inside(normalized):
+            raise PermissionError(errno.EACCES, "Path is outside of the workspace", path)
+        if os.open not in os.supports_dir_fd or not hasattr(os, "O_NOFOLLOW"):
+            return self._open_resolved(path, flags, mode)
+
+        parts = [part for part in os.path.relpath(normalized, self.root).split(os.sep) if part != "."]
+        directory_flags = os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW
+        fd = os.open(self.root, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            for part in parts[:-1]:
+                next_fd = os.open(part, directory_flags, dir_fd=fd)
+                os.close(fd)
+                fd = next_fd
+            if not parts:
+                return os.dup(fd)
+            return os.open(parts[-1], flags | os.O_NOFOLLOW, mode, dir_fd=fd)
+        except OSError as e:
+            # Hitting a symlink fails with ELOOP, or ENOTDIR for directories
+            if e.errno not in (errno.ELOOP, errno.ENOTDIR):
+                raise
+        finally:
+            os.close(fd)
+        return self._open_resolved(path, flags, mode)
+
+    def _open_resolved(self, path: str, flags: int, mode: int) -> int:
+        resolved = os.path.realpath(os.path.join(self.root, path))
+        if not self._inside(resolved):
+            raise PermissionError(errno.EACCES, "Path is outside of the workspace", path)
+        return os.open(resolved, flags, mode)
+
+
+_workspaces = TTLCache(max_entries=64)
+
+
+def workspace_paths(workspace_dir: str) -> WorkspacePaths:
+    """The resolver for `workspace_dir`, created once and then reused, along with its memoized resolutions."""
+    # Keyed on where the directory leads now, so a workspace path that was pointed elsewhere gets a new resolver
+    root = os.path.realpath(workspace_dir)
+    paths = _workspaces.get(root)
+    if paths is None:
+        paths = WorkspacePaths(root)
+        _workspaces.set(root, paths)
+    return paths
+
+
+def restrict_path(file_path: str, workspace_dir: str) -> Optional[str]:
+    """The canonical path of `file_path` if it is inside `workspace_dir`, symlinks included, and None otherwise."""
+    return workspace_paths(workspace_dir).resolve(file_path)
+
+
+def atomic_write(path: str, content: Union[str, Iterable[bytes]], encoding: str = "utf-8"):
+    """
+    Write `content` to `path` so that readers see either the old file or the new one, never a partial write. The
+    content goes to a temporary file in the same directory, which is then renamed over `path`. `content` can also be
+    chunks of bytes, e.g. slices of the old file around a change, so large files don't have to be built in memory.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+
+    try:
+        mode = os.stat(path).st_mode & 0o777
+    except FileNotFoundError:
+        mode = DEFAULT_FILE_MODE
+
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            if isinstance(content, str):
+                f.write(content.encode(encoding))
+            else:
+                for chunk in content:
+                    f.write(chunk)
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
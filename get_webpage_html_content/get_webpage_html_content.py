@@ -1,8 +1,12 @@
-import aiohttp
-import requests
 from autopack import Pack
 from pydantic import BaseModel, Field
 
+from async_execution import run_blocking
+from http_streaming import DEFAULT_MAX_BYTES, DEFAULT_TIMEOUT, UnsupportedContentType
+from instrumentation import instrumented, phase
+from page_fetching import afetch_page, fetch_page
+from text_extraction import extract_text
+
 PACK_DESCRIPTION = (
     "Retrieves the raw HTML content of a specified webpage. It is useful when you specifically require access to the "
     "raw HTML of a webpage, and are not interested in its text contents."
@@ -21,23 +25,63 @@ class GetWebpageHtmlContent(Pack):
     description = PACK_DESCRIPTION
     args_schema = GetHtmlContentArgs
     categories = ["Web"]
-    dependencies = ["requests", "aiohttp"]
+    dependencies = ["requests", "aiohttp", "playwright"]
 
     filter_threshold: int = Field(
         default=0,
         description="If given a non-zero value will return only the first N characters",
     )
+    max_bytes: int = Field(
+        default=DEFAULT_MAX_BYTES,
+        description="Stop downloading the page after this many bytes. 0 for no limit",
+    )
+    timeout: float = Field(
+        default=DEFAULT_TIMEOUT,
+        description="Seconds to spend fetching the page before returning whatever has been read so far",
+    )
+    text_only: bool = Field(
+        default=False,
+        description="Return the readable text of the page, without markup or boilerplate, instead of its HTML",
+    )
+    render_javascript: bool = Field(
+        default=True,
+        description="Render pages that need JavaScript to show their content in a headless browser. Pages that don't "
+        "are still fetched with a plain HTTP request",
+    )
 
-    def _run(self, url: str) -> str:
-        response = requests.get(url)
+    def _max_chars(self) -> int:
+        # Markup is thrown away when extracting text, so then the threshold can only be applied afterwards
+        if self.text_only:
+            return 0
+        return self.filter_threshold
+
+    def _finish(self, html: str) -> str:
+        if not self.text_only:
+            return html[: self.filter_threshold] if self.filter_threshold else html
+
+        with phase("parse"):
+            text = extract_text(html, max_tokens=None)
         if self.filter_threshold:
-            return response.text[: self.filter_threshold]
-        return response.text
+            return text[: self.filter_threshold]
+        return text
+
+    @instrumented
+    def _run(self, url: str) -> str:
+        try:
+            page = fetch_page(url, self.max_bytes, self.timeout, self._max_chars(), self.render_javascript)
+        except UnsupportedContentType as e:
+            return f"Error: {e}"
+
+        return self._finish(page.html)
 
+    @instrumented
     async def _arun(self, url: str) -> str:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                text = await response.text()
-                if self.filter_threshold:
-                    return text[: self.filter_threshold]
-                return text
+        try:
+            page = await afetch_page(url, self.max_bytes, self.timeout, self._max_chars(), self.render_javascript)
+        except UnsupportedContentType as e:
+            return f"Error: {e}"
+
+        if self.text_only:
+            # Extracting the text of a large page takes long enough to stall other tool calls
+            return await run_blocking(self._finish, page.html)
+        return self._finish(page.html)
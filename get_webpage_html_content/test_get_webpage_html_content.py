@@ -1,5 +1,9 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
 import pytest
 
+import page_fetching
 from get_webpage_html_content.get_webpage_html_content import GetWebpageHtmlContent
 
 
@@ -35,3 +39,87 @@ async def test_aget_webpage_html_content_without_filter():
     pack = GetWebpageHtmlContent()
     response = await pack.arun(url=url)
     assert len(response) > 2000
+
+
+@pytest.fixture
+def local_server():
+    paragraphs = "".join(f"<p>Lorem ipsum dolor sit amet {i}</p>" for i in range(100_000))
+    page = f"<html><head><script src='/app.js'></script></head><body>{paragraphs}</body></html>".encode()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/binary":
+                body, content_type = b"\x00" * 1024, "application/octet-stream"
+            else:
+                body, content_type = page, "text/html; charset=utf-8"
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            try:
+                self.wfile.write(body)
+            except ConnectionError:
+                pass
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_webpage_html_content_max_bytes(local_server):
+    pack = GetWebpageHtmlContent(max_bytes=10_000)
+    response = pack.run(url=local_server)
+    assert response.startswith("<html><head><script")
+    assert len(response) == 10_000
+
+
+def test_webpage_html_content_threshold_stops_reading_early(local_server, monkeypatch):
+    pages, rendered = [], []
+
+    def fetch_page(*args):
+        pages.append(page_fetching.fetch_page(*args))
+        return pages[-1]
+
+    monkeypatch.setattr("get_webpage_html_content.get_webpage_html_content.fetch_page", fetch_page)
+    monkeypatch.setattr("browser_pool.BrowserPool.fetch_html", lambda self, url: rendered.append(url))
+    # The default configuration, which renders pages that need JavaScript
+    response = GetWebpageHtmlContent(filter_threshold=2000).run(url=local_server)
+
+    assert len(response) == 2000
+    assert pages[0].bytes_read < 100_000
+    assert rendered == []
+
+
+def test_webpage_html_content_text_only(local_server):
+    pack = GetWebpageHtmlContent(max_bytes=10_000, filter_threshold=100, text_only=True)
+    response = pack.run(url=local_server)
+    assert response.startswith("Lorem ipsum dolor sit amet 0\nLorem ipsum dolor sit amet 1\n")
+    assert "<p>" not in response
+    assert len(response) == 100
+
+
+def test_webpage_html_content_rejects_binary(local_server):
+    pack = GetWebpageHtmlContent()
+    response = pack.run(url=f"{local_server}/binary")
+    assert response.startswith("Error:")
+    assert "application/octet-stream" in response
+
+
+@pytest.mark.asyncio
+async def test_aget_webpage_html_content_local_with_filter(local_server):
+    pack = GetWebpageHtmlContent(filter_threshold=2000)
+    response = await pack.arun(url=local_server)
+    assert len(response) == 2000
+
+
+@pytest.mark.asyncio
+async def test_aget_webpage_html_content_rejects_binary(local_server):
+    pack = GetWebpageHtmlContent()
+    response = await pack.arun(url=f"{local_server}/binary")
+    assert response.startswith("Error:")
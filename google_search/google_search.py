@@ -1,17 +1,95 @@
+import asyncio
+import contextvars
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional
 
 from autopack import Pack
 from langchain import GoogleSerperAPIWrapper
 from pydantic import BaseModel, Field
 
+from caching import CachedCalls, TTLCache, cache_key
+from http_client import get_async_session, get_session
+from instrumentation import instrumented, phase
+from rate_limiting import DEFAULT_HOST_CONCURRENCY, HostLimits, RequestScheduler, get_scheduler
+
 PACK_DESCRIPTION = (
     "Search Google for websites matching a given query. Useful for when you need to answer questions "
     "about current events."
 )
 
+DEFAULT_SERPER_URL = "https://google.serper.dev"
+CACHE_TTL = 15 * 60
+MAX_CONCURRENT_QUERIES = 4
+# Serper's rate limit, which the request scheduler applies to the Serper API unless it was configured otherwise
+QUERIES_PER_SECOND = 5
+QUERY_BURST = 5
+SERPER_LIMITS = HostLimits(rate=QUERIES_PER_SECOND, burst=QUERY_BURST, max_concurrency=DEFAULT_HOST_CONCURRENCY)
+
+_results_cache = CachedCalls(TTLCache(max_entries=512, ttl=CACHE_TTL), name="google_search")
+_clients: dict[tuple[str, str], "SerperClient"] = {}
+_clients_lock = threading.Lock()
+
 
 class GoogleSearchArgs(BaseModel):
-    query: str = Field(..., description="The query string")
+    query: str = Field(default="", description="The query string")
+    queries: list[str] = Field(
+        default_factory=list,
+        description="Several related query strings to search for at once, instead of a single query",
+    )
+
+
+def _scheduler(base_url: str) -> RequestScheduler:
+    scheduler = get_scheduler()
+    # Declared on every call, so the limits also hold on a scheduler configured after the first search
+    scheduler.set_limits(base_url, SERPER_LIMITS, overwrite=False)
+    return scheduler
+
+
+class SerperClient(GoogleSerperAPIWrapper):
+    """langchain's Serper wrapper, sending its requests to `base_url` over the shared, connection pooling sessions."""
+
+    base_url: str = DEFAULT_SERPER_URL
+
+    def _request_arguments(self, search_term: str, search_type: str, **kwargs: Any) -> dict[str, Any]:
+        return {
+            "url": f"{self.base_url}/{search_type}",
+            "headers": {"X-API-KEY": self.serper_api_key or "", "Content-Type": "application/json"},
+            "params": {"q": search_term, **{key: value for key, value in kwargs.items() if value is not None}},
+        }
+
+    def _google_serper_api_results(self, search_term: str, search_type: str = "search", **kwargs: Any) -> dict:
+        scheduler = _scheduler(self.base_url)
+        with scheduler.slot(self.base_url):
+            response = get_session().post(**self._request_arguments(search_term, search_type, **kwargs))
+        scheduler.note_response(self.base_url, response.status_code, response.headers.get("Retry-After"))
+        response.raise_for_status()
+        return response.json()
+
+    async def _async_google_serper_search_results(
+        self, search_term: str, search_type: str = "search", **kwargs: Any
+    ) -> dict:
+        arguments = self._request_arguments(search_term, search_type, **kwargs)
+        scheduler = _scheduler(self.base_url)
+        async with scheduler.aslot(self.base_url), get_async_session().post(**arguments) as response:
+            scheduler.note_response(self.base_url, response.status, response.headers.get("Retry-After"))
+            response.raise_for_status()
+            return await response.json()
+
+
+def get_client(base_url: str = DEFAULT_SERPER_URL) -> SerperClient:
+    """The client for `base_url` and the current SERPER_API_KEY, created once and then reused."""
+    key = (os.environ.get("SERPER_API_KEY", ""), base_url)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = SerperClient(base_url=base_url)
+        return client
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
 
 
 class GoogleSearch(Pack):
@@ -20,29 +98,126 @@ class GoogleSearch(Pack):
     args_schema = GoogleSearchArgs
     categories = ["Web"]
 
-    def _run(self, query: str) -> str:
+    base_url: str = Field(
+        default_factory=lambda: os.environ.get("SERPER_API_URL", DEFAULT_SERPER_URL),
+        description="The Serper API to send searches to, e.g. a local fake in tests",
+    )
+    max_concurrency: int = Field(
+        default=MAX_CONCURRENT_QUERIES,
+        description="How many queries of a batch are searched at the same time",
+    )
+
+    def _cache_key(self, query: str) -> str:
+        return cache_key(self.base_url, normalize_query(query))
+
+    def search(self, query: str) -> list[dict[str, str]]:
+        """The organic results for `query`. Results are cached, and identical searches in flight are shared."""
+
+        def fetch() -> list[dict[str, str]]:
+            with phase("fetch"):
+                return get_client(self.base_url).results(query).get("organic", [])
+
+        return _results_cache.call(self._cache_key(query), fetch)
+
+    async def asearch(self, query: str) -> list[dict[str, str]]:
+        async def fetch() -> list[dict[str, str]]:
+            with phase("fetch"):
+                query_results = await get_client(self.base_url).aresults(query)
+            return query_results.get("organic", [])
+
+        return await _results_cache.acall(self._cache_key(query), fetch)
+
+    def search_many(self, queries: list[str]) -> dict[str, Any]:
+        """Search for every query, `max_concurrency` at a time. Maps each query to its results, or to the exception
+        its search raised."""
+        with ThreadPoolExecutor(max_workers=max(self.max_concurrency, 1)) as executor:
+            futures = {
+                query: executor.submit(contextvars.copy_context().run, self.search, query) for query in _unique(queries)
+            }
+        return {query: future.exception() or future.result() for query, future in futures.items()}
+
+    async def asearch_many(self, queries: list[str]) -> dict[str, Any]:
+        semaphore = asyncio.Semaphore(max(self.max_concurrency, 1))
+
+        async def search(query: str) -> list[dict[str, str]]:
+            async with semaphore:
+                return await self.asearch(query)
+
+        queries = _unique(queries)
+        results = await asyncio.gather(*(search(query) for query in queries), return_exceptions=True)
+        return dict(zip(queries, results))
+
+    @instrumented
+    def _run(self, query: str = "", queries: Optional[list[str]] = None) -> str:
         if not os.environ.get("SERPER_API_KEY"):
             return f"Google Search is not supported as the SERPER_API_KEY environment variable is not set"
+        if queries:
+            return format_batch_results(self.search_many(_with_query(queries, query)))
         try:
-            return format_results(GoogleSerperAPIWrapper().results(query).get("organic", []))
+            return format_results(self.search(query))
 
         except Exception as e:
             return f"Error: {e}"
 
-    async def _arun(self, query: str) -> str:
+    @instrumented
+    async def _arun(self, query: str = "", queries: Optional[list[str]] = None) -> str:
         if not os.environ.get("SERPER_API_KEY"):
             return f"Google Search is not supported as the SERPER_API_KEY environment variable is not set"
+        if queries:
+            return format_batch_results(await self.asearch_many(_with_query(queries, query)))
         try:
-            query_results = await GoogleSerperAPIWrapper().aresults(query)
-            return format_results(query_results.get("organic", []))
+            return format_results(await self.asearch(query))
 
         except Exception as e:
             return f"Error: {e}"
 
 
-def format_results(results: list[dict[str, str]]) -> str:
-    formatted_results = []
+def _unique(queries: list[str]) -> list[str]:
+    unique = {}
+    for query in queries:
+        unique.setdefault(normalize_query(query), query)
+    return [query for query in unique.values() if query.strip()]
+
+
+def _with_query(queries: list[str], query: str) -> list[str]:
+    return [query, *queries] if query else list(queries)
+
+
+def _link_key(link: Optional[str]) -> str:
+    # The same page is often returned with and without a trailing slash or fragment
+    return (link or "").split("#", 1)[0].rstrip("/")
+
+
+def _format_entries(results: list[dict[str, str]], seen: set[str]) -> list[str]:
+    entries = []
     for result in results:
-        formatted_results.append(f"{result.get('link')}: {result.get('snippet')}")
+        # Results without a link, such as an answer box, can't be told apart, so they're always kept
+        key = _link_key(result.get("link"))
+        if key:
+            if key in seen:
+                continue
+            seen.add(key)
+        entries.append(
+            f"{result['link']}: {result.get('snippet')}" if result.get("link") else str(result.get("snippet"))
+        )
+    return entries
 
+
+def format_results(results: list[dict[str, str]], seen: Optional[set[str]] = None) -> str:
+    """Formats the results of one search. Links already in `seen` are left out, and the rest are added to it."""
+    formatted_results = _format_entries(results, seen if seen is not None else set())
     return f"Your search results are: {' | '.join(formatted_results)}"
+
+
+def format_batch_results(results_by_query: dict[str, Any]) -> str:
+    """Formats the results of several searches, listing each link only under the first query that found it."""
+    seen = set()
+    sections = []
+    for query, results in results_by_query.items():
+        if isinstance(results, BaseException):
+            sections.append(f"{query}: Error: {results}")
+            continue
+        entries = _format_entries(results, seen)
+        sections.append(f"{query}: {' | '.join(entries) if entries else 'No new results'}")
+
+    return "Your search results are:\n" + "\n".join(sections)
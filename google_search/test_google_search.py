@@ -1,9 +1,15 @@
+import json
 import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest.mock import patch
+from urllib.parse import parse_qs, urlsplit
 
 import pytest
 
 from google_search import GoogleSearch
+from google_search.google_search import SERPER_LIMITS, format_results
+from rate_limiting import HostLimits, configure_scheduler, get_scheduler
 
 
 def test_search_no_api_key():
@@ -50,3 +56,91 @@ async def test_search_async():
 
     assert "https://www.bbc.com/news" in results
     assert "breaking news" in results
+
+
+@pytest.fixture
+def serper_server(monkeypatch):
+    queries = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            query = parse_qs(urlsplit(self.path).query)["q"][0]
+            queries.append(query)
+            organic = [
+                {"link": "https://example.com/shared/", "snippet": "Found by every query"},
+                {"link": f"https://example.com/{query.replace(' ', '-')}", "snippet": f"Only about {query}"},
+            ]
+            body = json.dumps({"organic": organic}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    monkeypatch.setenv("SERPER_API_KEY", "1234")
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}", queries
+    server.shutdown()
+    server.server_close()
+    # Searches declare Serper's rate limit for the fake's host, which other tests' local servers share
+    configure_scheduler()
+
+
+def test_search_batch(serper_server):
+    base_url, queries = serper_server
+    results = GoogleSearch(base_url=base_url).run(queries=["batch alpha", "batch beta", "Batch  ALPHA"])
+
+    assert sorted(queries) == ["batch alpha", "batch beta"]
+    assert results.startswith("Your search results are:\n")
+    assert "https://example.com/batch-alpha: Only about batch alpha" in results
+    assert "https://example.com/batch-beta: Only about batch beta" in results
+    # Links found by several queries are only listed once
+    assert results.count("https://example.com/shared") == 1
+
+
+def test_search_results_are_cached(serper_server):
+    base_url, queries = serper_server
+    pack = GoogleSearch(base_url=base_url)
+    first = pack.run(query="cached query")
+    second = pack.run(query="  Cached QUERY ")
+
+    assert queries == ["cached query"]
+    assert first == second
+
+
+@pytest.mark.asyncio
+async def test_search_batch_async(serper_server):
+    base_url, queries = serper_server
+    results = await GoogleSearch(base_url=base_url, max_concurrency=2).arun(
+        query="async one", queries=["async two", "async three"]
+    )
+
+    assert sorted(queries) == ["async one", "async three", "async two"]
+    assert results.index("async one:") < results.index("async two:") < results.index("async three:")
+
+
+def test_search_uses_serper_rate_limit(serper_server):
+    base_url, _ = serper_server
+    GoogleSearch(base_url=base_url).run(query="rate limited query")
+    assert get_scheduler().limits(base_url) == SERPER_LIMITS
+
+    # Limits the user configured for the host are kept
+    scheduler = configure_scheduler(host_limits={"127.0.0.1": HostLimits(rate=100, burst=10)})
+    GoogleSearch(base_url=base_url).run(query="another rate limited query")
+    assert scheduler.limits(base_url) == HostLimits(rate=100, burst=10)
+
+
+def test_format_results_keeps_results_without_links():
+    results = [
+        {"snippet": "An answer box"},
+        {"snippet": "A knowledge graph entry"},
+        {"link": "https://example.com/", "snippet": "A page"},
+        {"link": "https://example.com", "snippet": "The same page"},
+    ]
+    assert format_results(results) == (
+        "Your search results are: An answer box | A knowledge graph entry | https://example.com/: A page"
+    )
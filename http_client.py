@@ -0,0 +1,147 @@
+import asyncio
+import atexit
+import logging
+import threading
+from contextlib import suppress
+from dataclasses import dataclass, replace
+from typing import Optional
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class HttpClientSettings:
+    # Seconds allowed for a whole request, and for establishing the connection
+    timeout: float = 30.0
+    connect_timeout: float = 10.0
+    # Open connections across all hosts, and to any one host
+    limit: int = 100
+    limit_per_host: int = 10
+    # Seconds to remember DNS lookups (async client only, the sync client relies on the system resolver)
+    dns_cache_ttl: int = 300
+    # Seconds an idle keep-alive connection is held open
+    keepalive_timeout: float = 30.0
+
+
+class _Session(requests.Session):
+    """A requests Session that applies the client's default timeout to requests that don't specify one."""
+
+    def __init__(self, settings: HttpClientSettings):
+        super().__init__()
+        self.default_timeout = (settings.connect_timeout, settings.timeout)
+        adapter = HTTPAdapter(pool_connections=settings.limit, pool_maxsize=settings.limit_per_host)
+        self.mount("http://", adapter)
+        self.mount("https://", adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.default_timeout)
+        return super().request(method, url, **kwargs)
+
+
+_settings = HttpClientSettings()
+_lock = threading.Lock()
+_session: Optional[_Session] = None
+# aiohttp sessions can only be used on the event loop they were created in, so there is one per loop
+_async_sessions: dict[asyncio.AbstractEventLoop, aiohttp.ClientSession] = {}
+
+
+def http_client_settings() -> HttpClientSettings:
+    return _settings
+
+
+def configure_http_client(**kwargs) -> HttpClientSettings:
+    """Change the settings used for new connections, e.g. `configure_http_client(limit_per_host=4)`. Existing sync
+    sessions are closed so the change takes effect immediately; async sessions are replaced the next time they're
+    requested."""
+    global _settings, _session
+    with _lock:
+        _settings = replace(_settings, **kwargs)
+        previous, _session = _session, None
+        stale = list(_async_sessions.items())
+        _async_sessions.clear()
+
+    if previous:
+        previous.close()
+    for loop, session in stale:
+        _close_async_session(loop, session)
+    return _settings
+
+
+def get_session() -> requests.Session:
+    """The process-wide, connection pooling requests Session used by the sync code paths."""
+    global _session
+    with _lock:
+        if _session is None:
+            _session = _Session(_settings)
+        return _session
+
+
+def get_async_session() -> aiohttp.ClientSession:
+    """The connection pooling aiohttp ClientSession for the running event loop."""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        for stale_loop in [stale_loop for stale_loop in _async_sessions if stale_loop.is_closed()]:
+            _close_async_session(stale_loop, _async_sessions.pop(stale_loop))
+
+        session = _async_sessions.get(loop)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=_settings.limit,
+                limit_per_host=_settings.limit_per_host,
+                ttl_dns_cache=_settings.dns_cache_ttl,
+                keepalive_timeout=_settings.keepalive_timeout,
+            )
+            timeout = aiohttp.ClientTimeout(total=_settings.timeout, sock_connect=_settings.connect_timeout)
+            session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+            _async_sessions[loop] = session
+        return session
+
+
+async def aclose_http_clients():
+    """Close the async session belonging to the running event loop. Call this before shutting the loop down."""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        session = _async_sessions.pop(loop, None)
+    if session and not session.closed:
+        await session.close()
+
+
+def close_http_clients():
+    """Close the sync session, and any async sessions whose event loops are still able to run the shutdown."""
+    global _session
+    with _lock:
+        previous, _session = _session, None
+        remaining = list(_async_sessions.items())
+        _async_sessions.clear()
+
+    if previous:
+        previous.close()
+    for loop, session in remaining:
+        _close_async_session(loop, session)
+
+
+def _close_async_session(loop: asyncio.AbstractEventLoop, session: aiohttp.ClientSession):
+    if session.closed:
+        return
+    if loop.is_closed():
+        # Nothing can be awaited on a closed loop, so drop the connections using the connector's synchronous half of
+        # close(), which every aiohttp version has
+        connector = session.connector
+        session.detach()
+        with suppress(Exception):
+            connector._close()
+        return
+    try:
+        if loop.is_running():
+            asyncio.run_coroutine_threadsafe(session.close(), loop)
+        else:
+            loop.run_until_complete(session.close())
+    except Exception as e:
+        logger.debug(f"Could not close aiohttp session: {e}")
+
+
+atexit.register(close_http_clients)
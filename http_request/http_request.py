@@ -1,15 +1,50 @@
+import asyncio
 import json
+import time
+from dataclasses import dataclass
+from typing import Optional
 
 import aiohttp
 import requests
 from autopack import Pack
 from pydantic import BaseModel, Field
 
+from http_client import get_async_session, get_session
+from http_streaming import (
+    DEFAULT_CHUNK_SIZE,
+    DEFAULT_TIMEOUT,
+    TextReader,
+    aread_text,
+    is_text_content_type,
+    mime_type,
+    read_text,
+)
+from instrumentation import count, instrumented, phase
+from json_selection import JsonPathError, select
+from rate_limiting import get_scheduler
+from response_cache import (
+    CachedResponse,
+    ResponseCache,
+    arecording,
+    get_response_cache,
+    note_hit,
+    note_revalidated,
+    recording,
+)
+
 PACK_DESCRIPTION = (
     "Makes an HTTP request and returns the raw response. This function should be used for basic GET or "
     "POST requests and is not intended for fetching web pages or performing complex operations."
 )
 
+# Enough for typical API responses, while keeping a large download from filling the whole prompt
+DEFAULT_MAX_BYTES = 100_000
+# Only requests that can safely be sent twice are retried
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+RETRY_STATUSES = {429, 502, 503, 504}
+# The longest a Retry-After header is allowed to make a retry wait, in seconds
+MAX_RETRY_AFTER = 30.0
+
 
 class HttpRequestArgs(BaseModel):
     url: str = Field(..., description="URL of the resource to request.")
@@ -22,6 +57,25 @@ class HttpRequestArgs(BaseModel):
         description="JSON Encoded headers to include in the request.",
         default_factory=dict,
     )
+    json_path: str = Field(
+        default="",
+        description="Only return this part of a JSON response, e.g. '$.items[0].name', 'items[*].id' or '$..url'",
+    )
+
+
+@dataclass
+class _Response:
+    status: int
+    content_type: Optional[str]
+    text: str = ""
+    bytes_read: int = 0
+    truncated: bool = False
+    # Whether the body was left unread, as it isn't text or the request is about to be retried
+    skipped: bool = False
+    content_length: Optional[str] = None
+    retry_after: Optional[str] = None
+    # Whether the body came from the response cache rather than over the network
+    from_cache: bool = False
 
 
 class HttpRequest(Pack):
@@ -30,19 +84,216 @@ class HttpRequest(Pack):
     args_schema = HttpRequestArgs
     categories = ["Web"]
 
-    def _run(self, url: str, method: str = "GET", data: str = None, headers: str = None) -> str:
+    max_bytes: int = Field(
+        default=DEFAULT_MAX_BYTES, description="Stop reading the response after this many bytes. 0 for no limit"
+    )
+    timeout: float = Field(
+        default=DEFAULT_TIMEOUT,
+        description="Seconds to spend on each attempt before returning whatever has been read so far",
+    )
+    retries: int = Field(
+        default=2,
+        description="How many times idempotent requests are retried after connection errors, timeouts or a 429, 502, "
+        "503 or 504 response",
+    )
+    backoff: float = Field(default=0.5, description="Seconds before the first retry, doubling for each one after it")
+    compact_json: bool = Field(default=True, description="Strip the whitespace out of JSON responses")
+
+    def _reader(self, content_type: Optional[str]) -> TextReader:
+        return TextReader(content_type, max_bytes=self.max_bytes, timeout=self.timeout)
+
+    def _skip_body(self, status: int, content_type: Optional[str], may_retry: bool) -> bool:
+        return not is_text_content_type(content_type) or (may_retry and status in RETRY_STATUSES)
+
+    def _retry_delay(
+        self, method: str, attempt: int, response: Optional[_Response], error: Optional[Exception]
+    ) -> Optional[float]:
+        """Seconds to wait before retrying, or None if the request is done."""
+        if attempt >= self.retries or method.upper() not in IDEMPOTENT_METHODS:
+            return None
+        if error is None and response.status not in RETRY_STATUSES:
+            return None
+
+        delay = self.backoff * 2**attempt
+        if response and response.retry_after:
+            try:
+                delay = max(delay, min(float(response.retry_after), MAX_RETRY_AFTER))
+            except ValueError:
+                # An HTTP date rather than a number of seconds
+                pass
+        return delay
+
+    @staticmethod
+    def _cache(method: str, data: Optional[str]) -> Optional[ResponseCache]:
+        # Only plain GETs are cached
+        return get_response_cache() if method.upper() == "GET" and not data else None
+
+    def _cached_response(self, cached: CachedResponse) -> _Response:
+        result = _Response(cached.status, cached.content_type, from_cache=True)
+        reader = self._reader(result.content_type)
+        result.text = read_text([cached.body], reader)
+        result.bytes_read, result.truncated = reader.bytes_read, reader.truncated
+        return result
+
+    def _fetch(self, method: str, url: str, headers: dict, data: Optional[str], may_retry: bool) -> _Response:
+        cache = self._cache(method, data)
+        cached = cache.lookup(url, headers) if cache is not None else None
+        if cached and cached.is_fresh():
+            note_hit(cached)
+            return self._cached_response(cached)
+
+        request_headers = {**headers, **cached.validators()} if cached else headers
+        parts = []
+        scheduler = get_scheduler()
+        with scheduler.slot(url), get_session().request(
+            method, url, headers=request_headers, data=data or None, stream=True, timeout=self.timeout
+        ) as response:
+            scheduler.note_response(url, response.status_code, response.headers.get("Retry-After"))
+            if cached and response.status_code == 304:
+                note_revalidated(cached)
+                return self._cached_response(cache.revalidated(url, headers, cached, response.headers))
+
+            result = _Response(
+                response.status_code,
+                response.headers.get("Content-Type"),
+                content_length=response.headers.get("Content-Length"),
+                retry_after=response.headers.get("Retry-After"),
+            )
+            if self._skip_body(result.status, result.content_type, may_retry):
+                result.skipped = True
+                return result
+
+            reader = self._reader(result.content_type)
+            result.text = read_text(recording(response.iter_content(DEFAULT_CHUNK_SIZE), parts), reader)
+        result.bytes_read, result.truncated = reader.bytes_read, reader.truncated
+        if cache is not None and not reader.truncated:
+            cache.store(url, headers, result.status, response.headers, b"".join(parts))
+        return result
+
+    async def _afetch(self, method: str, url: str, headers: dict, data: Optional[str], may_retry: bool) -> _Response:
+        cache = self._cache(method, data)
+        cached = await cache.alookup(url, headers) if cache is not None else None
+        if cached and cached.is_fresh():
+            note_hit(cached)
+            return self._cached_response(cached)
+
+        request_headers = {**headers, **cached.validators()} if cached else headers
+        parts = []
+        # The reader enforces the overall deadline, so only individual socket operations are bounded here
+        timeout = aiohttp.ClientTimeout(sock_connect=self.timeout, sock_read=self.timeout)
+        scheduler = get_scheduler()
+        async with scheduler.aslot(url), get_async_session().request(
+            method, url, headers=request_headers, data=data or None, timeout=timeout
+        ) as response:
+            scheduler.note_response(url, response.status, response.headers.get("Retry-After"))
+            if cached and response.status == 304:
+                note_revalidated(cached)
+                return self._cached_response(await cache.arevalidated(url, headers, cached, response.headers))
+
+            result = _Response(
+                response.status,
+                response.headers.get("Content-Type"),
+                content_length=response.headers.get("Content-Length"),
+                retry_after=response.headers.get("Retry-After"),
+            )
+            if self._skip_body(result.status, result.content_type, may_retry):
+                result.skipped = True
+                return result
+
+            reader = self._reader(result.content_type)
+            result.text = await aread_text(arecording(response.content.iter_chunked(DEFAULT_CHUNK_SIZE), parts), reader)
+        result.bytes_read, result.truncated = reader.bytes_read, reader.truncated
+        if cache is not None and not reader.truncated:
+            await cache.astore(url, headers, result.status, response.headers, b"".join(parts))
+        return result
+
+    def _format(self, response: _Response, json_path: str) -> str:
+        if not response.from_cache:
+            count("bytes_received", response.bytes_read)
+        if response.skipped:
+            size = f" of {response.content_length} bytes" if response.content_length else ""
+            return (
+                f"HTTP Response {response.status}: {mime_type(response.content_type)} content{size}, which isn't "
+                f"text and wasn't downloaded"
+            )
+
+        text = response.text
+        if json_path or mime_type(response.content_type).endswith(("/json", "+json")):
+            try:
+                text = self._process_json(text, json_path, response.truncated)
+            except (ValueError, JsonPathError) as e:
+                if json_path:
+                    return f"Error: {e}"
+        if response.truncated:
+            text += f"\n[Response cut off after {response.bytes_read} bytes]"
+        return f"HTTP Response {response.status}: {text}"
+
+    def _process_json(self, text: str, json_path: str, truncated: bool) -> str:
+        if truncated:
+            raise ValueError(f"The response is larger than {self.max_bytes} bytes, so json_path can't be applied to it")
+        document = json.loads(text)
+        if json_path:
+            document = select(document, json_path)
+        elif not self.compact_json:
+            return text
+        if self.compact_json:
+            return json.dumps(document, separators=(",", ":"), ensure_ascii=False)
+        return json.dumps(document, indent=2, ensure_ascii=False)
+
+    @instrumented
+    def _run(self, url: str, method: str = "GET", data: str = None, headers: str = None, json_path: str = "") -> str:
         headers_dict = {}
         if headers:
             headers_dict = json.loads(headers)
-        response = requests.request(method, url, headers=headers_dict, data=data)
-        return f"HTTP Response {response.status_code}: {response.content}"
 
-    async def _arun(self, url: str, method: str = "GET", data: str = None, headers: str = None) -> str:
+        attempt = 0
+        while True:
+            response, error = None, None
+            # A body is only worth skipping if the request will be sent again
+            may_retry = method.upper() in IDEMPOTENT_METHODS and attempt < self.retries
+            try:
+                with phase("fetch"):
+                    response = self._fetch(method, url, headers_dict, data, may_retry=may_retry)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+
+            delay = self._retry_delay(method, attempt, response, error)
+            if delay is None:
+                break
+            count("http_retries")
+            time.sleep(delay)
+            attempt += 1
+
+        if error:
+            return f"Error: {str(error) or error.__class__.__name__}"
+        return self._format(response, json_path)
+
+    @instrumented
+    async def _arun(
+        self, url: str, method: str = "GET", data: str = None, headers: str = None, json_path: str = ""
+    ) -> str:
         headers_dict = {}
         if headers:
             headers_dict = json.loads(headers)
 
-        async with aiohttp.ClientSession() as session:
-            async with session.request(method, url, data=data, headers=headers_dict) as response:
-                text = await response.text()
-                return f"HTTP Response {response.status}: {text}"
+        attempt = 0
+        while True:
+            response, error = None, None
+            # A body is only worth skipping if the request will be sent again
+            may_retry = method.upper() in IDEMPOTENT_METHODS and attempt < self.retries
+            try:
+                with phase("fetch"):
+                    response = await self._afetch(method, url, headers_dict, data, may_retry=may_retry)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                error = e
+
+            delay = self._retry_delay(method, attempt, response, error)
+            if delay is None:
+                break
+            count("http_retries")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+        if error:
+            return f"Error: {str(error) or error.__class__.__name__}"
+        return self._format(response, json_path)
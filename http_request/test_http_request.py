@@ -1,4 +1,11 @@
-from html_request.http_request import HttpRequest
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from http_request.http_request import HttpRequest
+from response_cache import configure_response_cache
 
 
 def test_http_request_get():
@@ -13,3 +20,149 @@ def test_http_request_get():
     pack = HttpRequest()
     response = pack.run(url=url)
     assert "Google Search" in response
+
+
+@pytest.fixture
+def local_server():
+    document = {"items": [{"id": i, "name": f"item {i}"} for i in range(3)], "total": 3}
+    requests_seen = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests_seen.append(self.path)
+            status, headers = 200, {}
+            if self.path == "/json":
+                body, content_type = json.dumps(document, indent=4).encode(), "application/json"
+            elif self.path == "/large":
+                body, content_type = b"x" * 1_000_000, "text/plain"
+            elif self.path == "/binary":
+                body, content_type = b"\x00" * 1024, "application/octet-stream"
+            elif self.path == "/cached":
+                body, content_type, headers = b'{"cached": true}', "application/json", {"Cache-Control": "max-age=60"}
+            elif self.path == "/flaky" and requests_seen.count("/flaky") == 1:
+                status, headers = 503, {"Retry-After": "0"}
+                body, content_type = b"Try again", "text/plain"
+            else:
+                body, content_type = b"Hello", "text/plain; charset=utf-8"
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            try:
+                self.wfile.write(body)
+            except ConnectionError:
+                pass
+
+        def do_POST(self):
+            requests_seen.append(self.path)
+            if self.path == "/limited":
+                body = b'{"error": "Too many requests, slow down"}'
+                self.send_response(429)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Retry-After", "0")
+            else:
+                body = b""
+                self.send_response(503)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.requests_seen = requests_seen
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.base_url = f"http://127.0.0.1:{server.server_port}"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_http_request_max_bytes(local_server):
+    pack = HttpRequest(max_bytes=10_000)
+    response = pack.run(url=f"{local_server.base_url}/large")
+    assert response.startswith("HTTP Response 200: xxx")
+    assert response.endswith("\n[Response cut off after 10000 bytes]")
+    assert response.count("x") == 10_000
+
+
+def test_http_request_compacts_json(local_server):
+    response = HttpRequest().run(url=f"{local_server.base_url}/json")
+    assert response.startswith('HTTP Response 200: {"items":[{"id":0,"name":"item 0"}')
+
+    response = HttpRequest(compact_json=False).run(url=f"{local_server.base_url}/json")
+    assert '    "items": [' in response
+
+
+def test_http_request_json_path(local_server):
+    pack = HttpRequest()
+    assert pack.run(url=f"{local_server.base_url}/json", json_path="$.items[*].id") == "HTTP Response 200: [0,1,2]"
+    assert pack.run(url=f"{local_server.base_url}/json", json_path="items[-1].name") == 'HTTP Response 200: "item 2"'
+    assert pack.run(url=f"{local_server.base_url}/json", json_path="$.missing").startswith("Error:")
+
+
+def test_http_request_retries(local_server):
+    pack = HttpRequest(backoff=0)
+    assert pack.run(url=f"{local_server.base_url}/flaky") == "HTTP Response 200: Hello"
+    assert local_server.requests_seen == ["/flaky", "/flaky"]
+
+
+def test_http_request_does_not_retry_post(local_server):
+    pack = HttpRequest(backoff=0)
+    assert pack.run(url=f"{local_server.base_url}/post", method="POST").startswith("HTTP Response 503")
+    assert local_server.requests_seen == ["/post"]
+
+
+@pytest.mark.asyncio
+async def test_http_request_post_keeps_error_body(local_server):
+    pack = HttpRequest(backoff=0)
+    expected = 'HTTP Response 429: {"error":"Too many requests, slow down"}'
+    assert pack.run(url=f"{local_server.base_url}/limited", method="POST") == expected
+    assert await pack.arun(url=f"{local_server.base_url}/limited", method="POST") == expected
+    assert local_server.requests_seen == ["/limited", "/limited"]
+
+
+def test_http_request_skips_binary(local_server):
+    response = HttpRequest().run(url=f"{local_server.base_url}/binary")
+    assert response == (
+        "HTTP Response 200: application/octet-stream content of 1024 bytes, which isn't text and wasn't downloaded"
+    )
+
+
+@pytest.mark.asyncio
+async def test_ahttp_request_matches_sync(local_server):
+    pack = HttpRequest(max_bytes=10_000, backoff=0)
+    for path, json_path in [("/json", ""), ("/json", "$..name"), ("/large", ""), ("/binary", ""), ("/flaky", "")]:
+        url = f"{local_server.base_url}{path}"
+        local_server.requests_seen.clear()
+        expected = pack.run(url=url, json_path=json_path)
+        local_server.requests_seen.clear()
+        assert await pack.arun(url=url, json_path=json_path) == expected
+
+
+@pytest.mark.asyncio
+async def test_ahttp_request_connection_error():
+    pack = HttpRequest(retries=0)
+    assert (await pack.arun(url="http://127.0.0.1:1/")).startswith("Error:")
+
+
+@pytest.mark.asyncio
+async def test_http_request_response_cache(local_server, tmpdir):
+    configure_response_cache(str(tmpdir / "responses.db"))
+    try:
+        pack = HttpRequest()
+        url = f"{local_server.base_url}/cached"
+        assert pack.run(url=url) == 'HTTP Response 200: {"cached":true}'
+        assert pack.run(url=url) == 'HTTP Response 200: {"cached":true}'
+        assert await pack.arun(url=url) == 'HTTP Response 200: {"cached":true}'
+        assert local_server.requests_seen == ["/cached"]
+
+        # Other request headers might get a different response
+        pack.run(url=url, headers='{"Accept": "application/json"}')
+        assert local_server.requests_seen == ["/cached", "/cached"]
+    finally:
+        configure_response_cache(None)
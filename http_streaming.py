@@ -0,0 +1,136 @@
+import codecs
+import re
+import time
+from typing import AsyncIterable, Iterable, Optional
+
+DEFAULT_CHUNK_SIZE = 16 * 1024
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024
+DEFAULT_TIMEOUT = 30.0
+
+TEXT_MIME_TYPES = {
+    "application/javascript",
+    "application/json",
+    "application/xhtml+xml",
+    "application/xml",
+}
+
+# Only the start of a document is searched for a <meta charset>, the same as browsers do
+META_SNIFF_BYTES = 1024
+META_CHARSET_RE = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([\w.:-]+)""", re.IGNORECASE)
+
+
+class UnsupportedContentType(ValueError):
+    pass
+
+
+def mime_type(content_type: Optional[str]) -> str:
+    return (content_type or "").split(";")[0].strip().lower()
+
+
+def is_text_content_type(content_type: Optional[str]) -> bool:
+    """Whether a Content-Type header describes something worth decoding as text. A missing header is given the benefit
+    of the doubt."""
+    mime = mime_type(content_type)
+    if not mime:
+        return True
+    return mime.startswith("text/") or mime in TEXT_MIME_TYPES or mime.endswith(("+xml", "+json"))
+
+
+def check_content_type(content_type: Optional[str]):
+    if not is_text_content_type(content_type):
+        raise UnsupportedContentType(f"Refusing to download non-text content of type {mime_type(content_type)}")
+
+
+def charset_from_content_type(content_type: Optional[str]) -> Optional[str]:
+    for param in (content_type or "").split(";")[1:]:
+        key, _, value = param.partition("=")
+        if key.strip().lower() == "charset" and value.strip():
+            return value.strip().strip("\"'")
+    return None
+
+
+class TextReader:
+    """
+    Incrementally decodes a response body and decides when to stop reading it. `feed` returns True once `max_chars`
+    characters have been decoded, `max_bytes` bytes have been consumed, or `timeout` seconds have passed, at which
+    point the caller should stop pulling chunks off the socket.
+    """
+
+    def __init__(
+        self,
+        content_type: Optional[str] = None,
+        max_chars: int = 0,
+        max_bytes: int = 0,
+        timeout: Optional[float] = None,
+    ):
+        self.charset = charset_from_content_type(content_type)
+        self.max_chars = max_chars
+        self.max_bytes = max_bytes
+        self.deadline = time.monotonic() + timeout if timeout else None
+
+        self.bytes_read = 0
+        self.truncated = False
+        self._decoder = None
+        self._parts: list[str] = []
+        self._length = 0
+
+    def feed(self, chunk: bytes) -> bool:
+        if not chunk:
+            return False
+
+        if self.max_bytes and self.bytes_read + len(chunk) > self.max_bytes:
+            chunk = chunk[: self.max_bytes - self.bytes_read]
+            self.truncated = True
+
+        if self._decoder is None:
+            self._decoder = self._make_decoder(chunk)
+
+        self.bytes_read += len(chunk)
+        self._append(self._decoder.decode(chunk))
+
+        if self.max_chars and self._length >= self.max_chars:
+            self.truncated = True
+        elif self.deadline and time.monotonic() > self.deadline:
+            self.truncated = True
+
+        return self.truncated
+
+    def text(self) -> str:
+        if self._decoder is not None:
+            self._append(self._decoder.decode(b"", final=True))
+            self._decoder = None
+
+        text = "".join(self._parts)
+        if self.max_chars:
+            return text[: self.max_chars]
+        return text
+
+    def _append(self, text: str):
+        if text:
+            self._parts.append(text)
+            self._length += len(text)
+
+    def _make_decoder(self, first_chunk: bytes) -> codecs.IncrementalDecoder:
+        charset = self.charset
+        if not charset:
+            match = META_CHARSET_RE.search(first_chunk[:META_SNIFF_BYTES])
+            charset = match.group(1).decode("ascii", "ignore") if match else "utf-8"
+
+        try:
+            return codecs.getincrementaldecoder(charset)(errors="replace")
+        except LookupError:
+            return codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+
+def read_text(chunks: Iterable[bytes], reader: TextReader) -> str:
+    for chunk in chunks:
+        if reader.feed(chunk):
+            break
+    return reader.text()
+
+
+async def aread_text(chunks: AsyncIterable[bytes], reader: TextReader) -> str:
+    async for chunk in chunks:
+        if reader.feed(chunk):
+            break
+    return reader.text()
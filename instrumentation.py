@@ -0,0 +1,272 @@
+"""
+Breaks pack calls down into timed phases (fetch, parse, llm, write, ...) and counters (bytes received, cache hits,
+prompt sizes), and hands a CallRecord for each call to the registered sinks. With no sinks registered nothing is
+recorded, and `phase` and `count` return after a single context variable lookup.
+
+    from instrumentation import InMemorySink, add_sink
+
+    sink = add_sink(InMemorySink())
+    ...run some packs...
+    print(sink.summary())
+"""
+import functools
+import inspect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator, Optional, Protocol
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CallRecord:
+    pack: str
+    # Wall clock time the call started at, and how long it took, in seconds
+    started: float
+    duration: float = 0.0
+    # Seconds spent in each phase. Phases running concurrently within a call, such as several page fetches, are
+    # summed, so the phases of a call can add up to more than its duration.
+    phases: dict[str, float] = field(default_factory=dict)
+    counters: dict[str, float] = field(default_factory=dict)
+    error: Optional[str] = None
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def add_phase(self, name: str, seconds: float):
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def add_count(self, name: str, value: float):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+
+class Sink(Protocol):
+    def emit(self, record: CallRecord) -> None:
+        ...
+
+
+_sinks: tuple[Sink, ...] = ()
+_sinks_lock = threading.Lock()
+_current: ContextVar[Optional[CallRecord]] = ContextVar("autopack_call_record", default=None)
+
+
+def add_sink(sink: Sink) -> Sink:
+    """Start sending call records to `sink`. Returns the sink, for chaining."""
+    global _sinks
+    with _sinks_lock:
+        _sinks = _sinks + (sink,)
+    return sink
+
+
+def remove_sink(sink: Sink):
+    global _sinks
+    with _sinks_lock:
+        _sinks = tuple(existing for existing in _sinks if existing is not sink)
+
+
+def clear_sinks():
+    global _sinks
+    with _sinks_lock:
+        _sinks = ()
+
+
+def current_record() -> Optional[CallRecord]:
+    """The record of the pack call running in this context, if instrumentation is enabled."""
+    return _current.get()
+
+
+def _emit(record: CallRecord):
+    for sink in _sinks:
+        try:
+            sink.emit(record)
+        except Exception as e:
+            logger.warning(f"Instrumentation sink {sink!r} failed: {e}")
+
+
+@contextmanager
+def record_call(pack: str) -> Iterator[Optional[CallRecord]]:
+    """Record everything that happens inside the block as one call of `pack`. Nested calls, e.g. a pack that runs
+    another pack, are folded into the outermost one."""
+    if not _sinks or _current.get() is not None:
+        yield _current.get()
+        return
+
+    record = CallRecord(pack=pack, started=time.time())
+    token = _current.set(record)
+    start = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record.error = f"{e.__class__.__name__}: {e}"
+        raise
+    finally:
+        record.duration = time.perf_counter() - start
+        _current.reset(token)
+        _emit(record)
+
+
+class _Phase:
+    __slots__ = ("record", "name", "start")
+
+    def __init__(self, record: CallRecord, name: str):
+        self.record = record
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.record.add_phase(self.name, time.perf_counter() - self.start)
+
+
+class _NoPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NO_PHASE = _NoPhase()
+
+
+def phase(name: str):
+    """Time the block as part of phase `name` of the current call, e.g. `with phase("fetch"): ...`"""
+    record = _current.get()
+    if record is None:
+        return _NO_PHASE
+    return _Phase(record, name)
+
+
+def count(name: str, value: float = 1):
+    """Add `value` to counter `name` of the current call."""
+    record = _current.get()
+    if record is not None:
+        record.add_count(name, value)
+
+
+def instrumented(method: Callable) -> Callable:
+    """Decorates a pack's `_run` or `_arun` so that each call is recorded under the pack's name."""
+    if inspect.iscoroutinefunction(method):
+
+        @functools.wraps(method)
+        async def async_wrapper(self, *args, **kwargs):
+            if not _sinks:
+                return await method(self, *args, **kwargs)
+            with record_call(self.name):
+                return await method(self, *args, **kwargs)
+
+        return async_wrapper
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not _sinks:
+            return method(self, *args, **kwargs)
+        with record_call(self.name):
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+class LoggingSink:
+    """Logs one line per call."""
+
+    def __init__(self, log: logging.Logger = logger, level: int = logging.INFO):
+        self.log = log
+        self.level = level
+
+    def emit(self, record: CallRecord):
+        if not self.log.isEnabledFor(self.level):
+            return
+        phases = " ".join(f"{name}={seconds * 1000:.1f}ms" for name, seconds in record.phases.items())
+        counters = " ".join(f"{name}={value:g}" for name, value in record.counters.items())
+        error = f" error={record.error!r}" if record.error else ""
+        self.log.log(
+            self.level, f"{record.pack} took {record.duration * 1000:.1f}ms {phases} {counters}{error}".rstrip()
+        )
+
+
+@dataclass
+class PackTotals:
+    calls: int = 0
+    errors: int = 0
+    seconds: float = 0.0
+    max_seconds: float = 0.0
+    phases: dict[str, float] = field(default_factory=dict)
+    counters: dict[str, float] = field(default_factory=dict)
+
+
+class InMemorySink:
+    """Aggregates calls per pack, to see which packs and which phases dominate wall clock time."""
+
+    def __init__(self):
+        self.totals: dict[str, PackTotals] = {}
+        self._lock = threading.Lock()
+
+    def emit(self, record: CallRecord):
+        with self._lock:
+            totals = self.totals.setdefault(record.pack, PackTotals())
+            totals.calls += 1
+            totals.errors += bool(record.error)
+            totals.seconds += record.duration
+            totals.max_seconds = max(totals.max_seconds, record.duration)
+            for name, seconds in record.phases.items():
+                totals.phases[name] = totals.phases.get(name, 0.0) + seconds
+            for name, value in record.counters.items():
+                totals.counters[name] = totals.counters.get(name, 0) + value
+
+    def reset(self):
+        with self._lock:
+            self.totals.clear()
+
+    def summary(self) -> str:
+        """One line per pack, the packs that took the most time in total first."""
+        with self._lock:
+            ranked = sorted(self.totals.items(), key=lambda item: item[1].seconds, reverse=True)
+            lines = []
+            for pack, totals in ranked:
+                phases = ", ".join(
+                    f"{name} {seconds:.2f}s"
+                    for name, seconds in sorted(totals.phases.items(), key=lambda item: item[1], reverse=True)
+                )
+                lines.append(
+                    f"{pack}: {totals.calls} calls, {totals.seconds:.2f}s total, "
+                    f"{totals.seconds / totals.calls * 1000:.1f}ms mean" + (f" ({phases})" if phases else "")
+                )
+            return "\n".join(lines)
+
+
+class OpenTelemetrySink:
+    """
+    Exports each call as an OpenTelemetry span, with its phases and counters as attributes. Requires the
+    `opentelemetry-api` package; spans go wherever the application has configured its tracer provider to send them.
+    """
+
+    def __init__(self, tracer: Any = None):
+        if tracer is None:
+            try:
+                from opentelemetry import trace
+            except ImportError:
+                raise ImportError(
+                    "opentelemetry-api is not installed. Please install it with `pip install opentelemetry-api`"
+                )
+            tracer = trace.get_tracer("autopack.official")
+        self.tracer = tracer
+
+    def emit(self, record: CallRecord):
+        start_ns = int(record.started * 1e9)
+        attributes = {"autopack.pack": record.pack}
+        attributes.update({f"autopack.phase.{name}_ms": seconds * 1000 for name, seconds in record.phases.items()})
+        attributes.update({f"autopack.{name}": value for name, value in record.counters.items()})
+        if record.error:
+            attributes["error"] = True
+            attributes["autopack.error"] = record.error
+
+        span = self.tracer.start_span(f"pack {record.pack}", start_time=start_ns, attributes=attributes)
+        span.end(end_time=start_ns + int(record.duration * 1e9))
@@ -0,0 +1,102 @@
+"""
+A small subset of JSONPath, enough to pick the interesting part out of an API response:
+
+    $.items[0].name     a single value
+    items[*].id         every item's id (the leading "$." is optional)
+    $..url              every "url" key, at any depth
+    $['a key'][-1]      quoted keys and negative indexes
+    $.items[2:5]        slices
+"""
+import re
+from typing import Any
+
+_TOKEN_RE = re.compile(
+    r"""
+      \.\.(?P<descend>[^.\[\]\s]+)
+    | \.(?P<name>[^.\[\]\s]+)
+    | \[\s*(?P<index>-?\d+)\s*\]
+    | \[\s*(?P<slice>-?\d*\s*:\s*-?\d*)\s*\]
+    | \[\s*(?P<star>\*)\s*\]
+    | \[\s*(?P<quote>['"])(?P<key>.*?)(?P=quote)\s*\]
+    """,
+    re.VERBOSE,
+)
+
+
+class JsonPathError(ValueError):
+    pass
+
+
+def _parse(original: str) -> list[tuple[str, Any]]:
+    path = original.strip()
+    if path.startswith("$"):
+        path = path[1:]
+    elif path and not path.startswith((".", "[")):
+        path = "." + path
+
+    tokens, position = [], 0
+    while position < len(path):
+        match = _TOKEN_RE.match(path, position)
+        if not match:
+            raise JsonPathError(f"Invalid JSON path {original!r}, can't parse {path[position:]!r}")
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == "name" and value == "*":
+            kind = "star"
+        elif kind == "index":
+            value = int(value)
+        elif kind == "slice":
+            value = slice(*(int(part) if part.strip() else None for part in value.split(":")))
+        tokens.append((kind, value))
+        position = match.end()
+    return tokens
+
+
+def _descendants(node: Any):
+    yield node
+    children = node.values() if isinstance(node, dict) else node if isinstance(node, list) else ()
+    for child in children:
+        yield from _descendants(child)
+
+
+def _step(nodes: list, kind: str, value: Any) -> list:
+    matches = []
+    for node in nodes:
+        if kind in ("name", "key"):
+            if isinstance(node, dict) and value in node:
+                matches.append(node[value])
+        elif kind == "index":
+            if isinstance(node, list) and -len(node) <= value < len(node):
+                matches.append(node[value])
+        elif kind == "slice":
+            if isinstance(node, list):
+                matches.extend(node[value])
+        elif kind == "star":
+            if isinstance(node, dict):
+                matches.extend(node.values())
+            elif isinstance(node, list):
+                matches.extend(node)
+        elif kind == "descend":
+            for descendant in _descendants(node):
+                if value == "*":
+                    matches.extend(_step([descendant], "star", None))
+                elif isinstance(descendant, dict) and value in descendant:
+                    matches.append(descendant[value])
+    return matches
+
+
+def select(document: Any, path: str) -> Any:
+    """
+    The part of `document` that `path` points at. Paths with a wildcard, slice or recursive descent return the list of
+    everything they match; other paths return the single value, and raise JsonPathError if there is none.
+    """
+    tokens = _parse(path)
+    nodes = [document]
+    for kind, value in tokens:
+        nodes = _step(nodes, kind, value)
+
+    if any(kind in ("star", "slice", "descend") for kind, _ in tokens):
+        return nodes
+    if not nodes:
+        raise JsonPathError(f"Nothing in the response matches {path!r}")
+    return nodes[0]
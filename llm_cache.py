@@ -0,0 +1,179 @@
+import functools
+import threading
+from typing import Any, Awaitable, Callable, Optional, Union
+
+from autopack.utils import acall_llm, call_llm
+
+from caching import CachedCalls, CacheStats, SQLiteCache, TTLCache, cache_key
+from instrumentation import count, phase
+
+DEFAULT_TTL = 60 * 60
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# Attributes that LLM wrappers (e.g. langchain chat models) use to say which model they talk to
+MODEL_ATTRIBUTES = ["model_name", "model", "model_id", "deployment_name"]
+
+
+def _function_identity(function: Any) -> str:
+    target = getattr(function, "__func__", function)
+    name = getattr(target, "__qualname__", None) or type(target).__qualname__
+    identity = f"{getattr(target, '__module__', '')}.{name}"
+    # Lambdas and functions defined inside others can share a name, but not where they're defined
+    code = getattr(target, "__code__", None)
+    if code is not None and ("<locals>" in name or "<lambda>" in name):
+        identity = f"{identity}:{code.co_firstlineno}"
+    return identity
+
+
+def _model_attribute(value: Any) -> Optional[str]:
+    for attribute in MODEL_ATTRIBUTES:
+        model = getattr(value, attribute, None)
+        if isinstance(model, str):
+            return model
+    return None
+
+
+def _bound_value(value: Any) -> Optional[str]:
+    """How a value a function closes over, or a partial binds, shows in the function's identity, or None if it doesn't
+    decide which model is called. Strings do, as they're usually a model name; counters and the like don't."""
+    if isinstance(value, str):
+        return repr(value)
+    model = _model_attribute(value)
+    if model is not None:
+        return f"{type(value).__qualname__}:{model}"
+    if callable(value) and not isinstance(value, type):
+        return _function_identity(value)
+    return None
+
+
+def _partial_value(value: Any) -> str:
+    # Arguments a partial binds can't change, so settings like a temperature count too
+    bound = _bound_value(value)
+    if bound is not None:
+        return bound
+    if value is None or isinstance(value, (int, float, bool)):
+        return repr(value)
+    return type(value).__qualname__
+
+
+def model_identity(llm: Any) -> str:
+    """
+    A string identifying which model `llm` calls, so that the same prompt sent to different models is cached
+    separately. Functions are identified by their import path and, for partials and closures, the model names and LLM
+    objects they're bound to. A function that picks its model from configuration at call time can't be told apart, so
+    the cache is only used once it's been enabled with `configure_llm_cache`.
+    """
+    if isinstance(llm, functools.partial):
+        bound = [_partial_value(value) for value in llm.args]
+        bound += [f"{key}={_partial_value(value)}" for key, value in sorted(llm.keywords.items())]
+        return f"{model_identity(llm.func)}({', '.join(bound)})"
+
+    identity = _function_identity(llm)
+    # A bound method's model is usually an attribute of the object it's bound to
+    model = _model_attribute(llm) or _model_attribute(getattr(llm, "__self__", None))
+    if model is not None:
+        return f"{identity}:{model}"
+
+    bound = []
+    for cell in getattr(getattr(llm, "__func__", llm), "__closure__", None) or ():
+        try:
+            value = _bound_value(cell.cell_contents)
+        except ValueError:
+            # A variable the function closes over that hasn't been assigned yet
+            continue
+        if value is not None:
+            bound.append(value)
+    return f"{identity}[{', '.join(bound)}]" if bound else identity
+
+
+def _call_llm(prompt: str, llm: Callable[[str], str]) -> str:
+    count("llm_calls")
+    count("llm_prompt_chars", len(prompt))
+    with phase("llm"):
+        response = call_llm(prompt, llm)
+    count("llm_response_chars", len(response or ""))
+    return response
+
+
+async def _acall_llm(prompt: str, llm: Callable[[str], Awaitable[str]]) -> str:
+    count("llm_calls")
+    count("llm_prompt_chars", len(prompt))
+    with phase("llm"):
+        response = await acall_llm(prompt, llm)
+    count("llm_response_chars", len(response or ""))
+    return response
+
+
+class LLMCache:
+    """
+    Memoizes LLM calls by a hash of the prompt and the model identity. Identical calls already in flight are coalesced
+    into a single LLM request. `cache` is any TTLCache-like object, e.g. a SQLiteCache to share results between
+    processes.
+    """
+
+    def __init__(self, cache: Union[TTLCache, SQLiteCache, None] = None, enabled: bool = True):
+        self.enabled = enabled
+        self.calls = CachedCalls(
+            cache if cache is not None else TTLCache(DEFAULT_MAX_ENTRIES, DEFAULT_MAX_BYTES, DEFAULT_TTL), name="llm"
+        )
+
+    @property
+    def stats(self) -> CacheStats:
+        return self.calls.stats
+
+    def call(self, prompt: str, llm: Callable[[str], str]) -> str:
+        if not self.enabled:
+            return _call_llm(prompt, llm)
+        return self.calls.call(cache_key(model_identity(llm), prompt), lambda: _call_llm(prompt, llm))
+
+    async def acall(self, prompt: str, llm: Callable[[str], Awaitable[str]]) -> str:
+        if not self.enabled:
+            return await _acall_llm(prompt, llm)
+        return await self.calls.acall(cache_key(model_identity(llm), prompt), lambda: _acall_llm(prompt, llm))
+
+    def clear(self):
+        self.calls.cache.clear()
+
+
+_cache: Optional[LLMCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> LLMCache:
+    """The process-wide LLM cache. It sends every call to the LLM until enabled with `configure_llm_cache`."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache(enabled=False)
+        return _cache
+
+
+def configure_llm_cache(
+    path: Optional[str] = None,
+    ttl: float = DEFAULT_TTL,
+    max_entries: int = DEFAULT_MAX_ENTRIES,
+    max_bytes: int = DEFAULT_MAX_BYTES,
+    enabled: bool = True,
+) -> LLMCache:
+    """Replace the process-wide LLM cache, enabling it. Pass `path` to persist it in a SQLite database, or
+    `enabled=False` to send every call to the LLM again."""
+    global _cache
+    if path:
+        cache = SQLiteCache(path, max_entries=max_entries, max_bytes=max_bytes, ttl=ttl)
+    else:
+        cache = TTLCache(max_entries=max_entries, max_bytes=max_bytes, ttl=ttl)
+
+    with _cache_lock:
+        _cache = LLMCache(cache, enabled=enabled)
+        return _cache
+
+
+def cached_call_llm(prompt: str, llm: Callable[[str], str]) -> str:
+    """Drop-in replacement for autopack.utils.call_llm that goes through the process-wide LLM cache."""
+    return get_llm_cache().call(prompt, llm)
+
+
+async def cached_acall_llm(prompt: str, llm: Callable[[str], Awaitable[str]]) -> str:
+    """Drop-in replacement for autopack.utils.acall_llm that goes through the process-wide LLM cache."""
+    return await get_llm_cache().acall(prompt, llm)
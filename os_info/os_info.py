@@ -1,9 +1,13 @@
-import platform
-
 from autopack import Pack
 from pydantic import BaseModel
 
-PACK_DESCRIPTION = "Get the name and version of the operating system you are running in."
+from async_execution import run_blocking
+from instrumentation import instrumented
+from system_info import SystemSnapshot, gigabytes, snapshot
+
+PACK_DESCRIPTION = (
+    "Get the name and version of the operating system you are running in, along with its kernel, CPUs and memory."
+)
 
 
 class OSInfoArgs(BaseModel):
@@ -16,8 +20,23 @@ class OSInfo(Pack):
     args_schema = OSInfoArgs
     categories = ["System Info"]
 
+    @instrumented
     def _run(self) -> str:
-        return f"OS Name {platform.system()}. OS Version: {platform.release()}."
+        return format_system(snapshot(paths=[]))
 
+    @instrumented
     async def _arun(self) -> str:
-        return self._run()
+        # The first call reads os-release and the CPU counts, and cached readings expire, so this stays off the loop
+        return await run_blocking(self._run)
+
+
+def format_system(system: SystemSnapshot) -> str:
+    static = system.static
+    distribution = f" Distribution: {static.distribution}." if static.distribution else ""
+    load = ", ".join(f"{load:.2f}" for load in system.load_average)
+    return (
+        f"OS Name {static.system}. OS Version: {static.release}.{distribution} Kernel: {static.version}. "
+        f"Architecture: {static.machine}. Python: {static.python_version}.\n"
+        f"CPUs: {static.logical_cpus} ({static.physical_cpus} physical), load average {load}. "
+        f"Memory: {gigabytes(system.memory.available)} available of {gigabytes(system.memory.total)}."
+    )
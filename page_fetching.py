@@ -0,0 +1,306 @@
+"""
+Fetches webpages the cheap way when that is enough. Every page is first requested with a plain HTTP GET, which serves a
+static page in milliseconds. Only when the response looks like it needs JavaScript to show its content (hardly any
+text, an empty app root, a noscript warning) or the site turned the request away is the page rendered in the shared
+browser pool instead. Domains that needed the browser are remembered for a while, so later pages from them go straight
+to the browser without a wasted request first.
+"""
+import asyncio
+import html as html_lib
+import logging
+import re
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+import requests
+
+from browser_pool import get_browser_pool
+from caching import TTLCache
+from http_client import get_async_session, get_session
+from http_streaming import (
+    DEFAULT_CHUNK_SIZE,
+    DEFAULT_MAX_BYTES,
+    DEFAULT_TIMEOUT,
+    TextReader,
+    aread_text,
+    check_content_type,
+    mime_type,
+    read_text,
+)
+from instrumentation import count, phase
+from rate_limiting import get_scheduler
+from response_cache import (
+    CachedResponse,
+    arecording,
+    get_response_cache,
+    note_hit,
+    note_revalidated,
+    recording,
+)
+
+logger = logging.getLogger(__name__)
+
+# How long a domain that needed the browser keeps being rendered without trying plain HTTP first, in seconds
+DOMAIN_MEMORY_TTL = 60 * 60
+# The same for domains that were only sent to the browser because they turned the request away, which may have been a
+# passing hiccup rather than a bot wall
+BLOCKED_DOMAIN_MEMORY_TTL = 5 * 60
+# Pages with less visible text than this are only worth rendering if they have scripts that could add more
+MIN_TEXT_CHARS = 200
+# Script-heavy pages whose visible text is less than this share of their markup are rendered
+MIN_TEXT_RATIO = 0.02
+# Bot walls and JavaScript challenges often answer plain clients with one of these
+BLOCKED_STATUSES = {401, 403, 503}
+HTML_MIME_TYPES = {"text/html", "application/xhtml+xml"}
+
+_HIDDEN_RE = re.compile(r"<(script|style|noscript|template)\b.*?</\1\s*>|<!--.*?-->", re.IGNORECASE | re.DOTALL)
+_TAG_RE = re.compile(r"<[^>]*>")
+_SCRIPT_RE = re.compile(r"<script\b.*?</script\s*>", re.IGNORECASE | re.DOTALL)
+_NOSCRIPT_RE = re.compile(r"<noscript\b[^>]*>(.*?)</noscript\s*>", re.IGNORECASE | re.DOTALL)
+_JAVASCRIPT_WARNING_RE = re.compile(
+    r"(enable|turn on|activate)\s+javascript|javascript\s+(is\s+)?(required|disabled|needed)|requires\s+javascript",
+    re.IGNORECASE,
+)
+# The empty mount points of single page apps built with React, Vue, Next.js, Nuxt and the like
+_EMPTY_APP_ROOT_RE = re.compile(
+    r"""<div\b[^>]*\bid\s*=\s*["']?(root|app|__next|__nuxt|svelte)["']?[^>]*>\s*</div>""", re.IGNORECASE
+)
+
+_rendered_domains = TTLCache(max_entries=4096, ttl=DOMAIN_MEMORY_TTL)
+_blocked_domains = TTLCache(max_entries=4096, ttl=BLOCKED_DOMAIN_MEMORY_TTL)
+
+
+@dataclass
+class FetchedPage:
+    url: str
+    html: str
+    content_type: Optional[str] = None
+    # Whether the page was rendered in the browser rather than fetched with plain HTTP
+    rendered: bool = False
+    bytes_read: int = 0
+    truncated: bool = False
+
+
+def visible_text(html: str) -> str:
+    """A rough rendering of the text a reader would see, good enough to judge how much of it there is."""
+    text = _TAG_RE.sub(" ", _HIDDEN_RE.sub(" ", html))
+    return " ".join(html_lib.unescape(text).split())
+
+
+def needs_rendering(html: str, complete: bool = True) -> bool:
+    """
+    Whether a page fetched without running its scripts looks like it needs them to show its content. For a page that
+    was only partly read, `complete` is False and only the markers that say so outright count: how much text the rest
+    of the page holds is unknown.
+    """
+    if _EMPTY_APP_ROOT_RE.search(html):
+        return True
+    if any(_JAVASCRIPT_WARNING_RE.search(noscript) for noscript in _NOSCRIPT_RE.findall(html)):
+        return True
+    if not complete:
+        return False
+
+    scripts = _SCRIPT_RE.findall(html)
+    if not scripts:
+        # Nothing could add content to the page, rendering it wouldn't change anything
+        return False
+
+    text_chars = len(visible_text(html))
+    if text_chars < MIN_TEXT_CHARS:
+        return True
+    script_chars = sum(len(script) for script in scripts)
+    return text_chars / len(html) < MIN_TEXT_RATIO and script_chars > len(html) / 2
+
+
+def domain(url: str) -> str:
+    return (urlsplit(url).hostname or "").lower()
+
+
+def remembers_rendering(url: str) -> bool:
+    """Whether pages from the domain of `url` recently needed the browser."""
+    return bool(_rendered_domains.get(domain(url)) or _blocked_domains.get(domain(url)))
+
+
+def forget_domains():
+    """Forget which domains needed the browser, e.g. in tests."""
+    _rendered_domains.clear()
+    _blocked_domains.clear()
+
+
+def _blocked(status: int, retry_after: Optional[str]) -> bool:
+    # A 503 asking to come back later is an overloaded server, which the browser wouldn't get any further with
+    return status in BLOCKED_STATUSES and not (status == 503 and retry_after)
+
+
+def _should_render(page: FetchedPage, status: int, retry_after: Optional[str]) -> bool:
+    if _blocked(status, retry_after):
+        return True
+    return mime_type(page.content_type) in HTML_MIME_TYPES and needs_rendering(page.html, complete=not page.truncated)
+
+
+def _render(url: str, memory: Optional[TTLCache] = None) -> FetchedPage:
+    """Render `url` in the browser, remembering its domain in `memory` if given."""
+    with get_scheduler().slot(url), phase("browser"):
+        return _rendered(url, get_browser_pool().fetch_html(url), memory)
+
+
+async def _arender(url: str, memory: Optional[TTLCache] = None) -> FetchedPage:
+    async with get_scheduler().aslot(url):
+        with phase("browser"):
+            return _rendered(url, await get_browser_pool().afetch_html(url), memory)
+
+
+def _rendered(url: str, html: str, memory: Optional[TTLCache]) -> FetchedPage:
+    count("bytes_received", len(html))
+    if memory is not None:
+        memory.set(domain(url), True)
+    return FetchedPage(url, html, "text/html", rendered=True)
+
+
+def _cached_page(url: str, cached: CachedResponse, max_bytes: int, timeout: float, max_chars: int) -> FetchedPage:
+    check_content_type(cached.content_type)
+    reader = TextReader(cached.content_type, max_chars=max_chars, max_bytes=max_bytes, timeout=timeout)
+    html = read_text([cached.body], reader)
+    return FetchedPage(url, html, cached.content_type, bytes_read=reader.bytes_read, truncated=reader.truncated)
+
+
+def _http_fetch(url: str, max_bytes: int, timeout: float, max_chars: int) -> tuple[FetchedPage, int, Optional[str]]:
+    """The page, the response status and its Retry-After header."""
+    cache = get_response_cache()
+    cached = cache.lookup(url) if cache is not None else None
+    if cached and cached.is_fresh():
+        note_hit(cached)
+        return _cached_page(url, cached, max_bytes, timeout, max_chars), cached.status, None
+
+    headers = cached.validators() if cached else {}
+    parts = []
+    scheduler = get_scheduler()
+    with scheduler.slot(url):
+        with phase("fetch"), get_session().get(url, headers=headers, stream=True, timeout=timeout) as response:
+            scheduler.note_response(url, response.status_code, response.headers.get("Retry-After"))
+            if cached and response.status_code == 304:
+                cached = cache.revalidated(url, None, cached, response.headers)
+                note_revalidated(cached)
+                return _cached_page(url, cached, max_bytes, timeout, max_chars), cached.status, None
+
+            content_type = response.headers.get("Content-Type")
+            check_content_type(content_type)
+            reader = TextReader(content_type, max_chars=max_chars, max_bytes=max_bytes, timeout=timeout)
+            html = read_text(recording(response.iter_content(DEFAULT_CHUNK_SIZE), parts), reader)
+    count("bytes_received", reader.bytes_read)
+    if cache is not None and not reader.truncated:
+        cache.store(url, None, response.status_code, response.headers, b"".join(parts))
+    page = FetchedPage(url, html, content_type, bytes_read=reader.bytes_read, truncated=reader.truncated)
+    return page, response.status_code, response.headers.get("Retry-After")
+
+
+async def _ahttp_fetch(
+    url: str, max_bytes: int, timeout: float, max_chars: int
+) -> tuple[FetchedPage, int, Optional[str]]:
+    cache = get_response_cache()
+    cached = await cache.alookup(url) if cache is not None else None
+    if cached and cached.is_fresh():
+        note_hit(cached)
+        return _cached_page(url, cached, max_bytes, timeout, max_chars), cached.status, None
+
+    headers = cached.validators() if cached else {}
+    parts = []
+    # The reader enforces the overall deadline, so only individual socket operations are bounded here
+    client_timeout = aiohttp.ClientTimeout(sock_connect=timeout, sock_read=timeout)
+    scheduler = get_scheduler()
+    async with scheduler.aslot(url):
+        with phase("fetch"):
+            async with get_async_session().get(url, headers=headers, timeout=client_timeout) as response:
+                scheduler.note_response(url, response.status, response.headers.get("Retry-After"))
+                if cached and response.status == 304:
+                    cached = await cache.arevalidated(url, None, cached, response.headers)
+                    note_revalidated(cached)
+                    return _cached_page(url, cached, max_bytes, timeout, max_chars), cached.status, None
+
+                content_type = response.headers.get("Content-Type")
+                check_content_type(content_type)
+                reader = TextReader(content_type, max_chars=max_chars, max_bytes=max_bytes, timeout=timeout)
+                html = await aread_text(arecording(response.content.iter_chunked(DEFAULT_CHUNK_SIZE), parts), reader)
+    count("bytes_received", reader.bytes_read)
+    if cache is not None and not reader.truncated:
+        await cache.astore(url, None, response.status, response.headers, b"".join(parts))
+    page = FetchedPage(url, html, content_type, bytes_read=reader.bytes_read, truncated=reader.truncated)
+    return page, response.status, response.headers.get("Retry-After")
+
+
+def fetch_page(
+    url: str,
+    max_bytes: int = DEFAULT_MAX_BYTES,
+    timeout: float = DEFAULT_TIMEOUT,
+    max_chars: int = 0,
+    render: bool = True,
+) -> FetchedPage:
+    """
+    Fetch `url` with plain HTTP, falling back to the browser pool if `render` is True and the page needs it.
+    `max_bytes`, `timeout` and `max_chars` bound the plain HTTP read. A page cut short by them is only sent to the
+    browser if what was read says outright that it needs JavaScript. Raises UnsupportedContentType for content that
+    isn't text.
+    """
+    if render and remembers_rendering(url):
+        return _render(url)
+
+    page = error = None
+    # Domains that turned the request away are only remembered for a little while
+    memory = _blocked_domains
+    try:
+        page, status, retry_after = _http_fetch(url, max_bytes, timeout, max_chars)
+        if not render or not _should_render(page, status, retry_after):
+            return page
+        if not _blocked(status, retry_after):
+            memory = _rendered_domains
+    except (requests.ConnectionError, requests.Timeout) as e:
+        # Some sites drop connections from clients that don't look like a browser
+        if not render:
+            raise
+        error = e
+
+    count("browser_escalations")
+    try:
+        return _render(url, memory)
+    except Exception as e:
+        if page is None:
+            raise error from e
+        logger.warning(f"Rendering {url} failed, using the page fetched without a browser: {e}")
+        return page
+
+
+async def afetch_page(
+    url: str,
+    max_bytes: int = DEFAULT_MAX_BYTES,
+    timeout: float = DEFAULT_TIMEOUT,
+    max_chars: int = 0,
+    render: bool = True,
+) -> FetchedPage:
+    """The async version of `fetch_page`."""
+    if render and remembers_rendering(url):
+        return await _arender(url)
+
+    page = error = None
+    # Domains that turned the request away are only remembered for a little while
+    memory = _blocked_domains
+    try:
+        page, status, retry_after = await _ahttp_fetch(url, max_bytes, timeout, max_chars)
+        if not render or not _should_render(page, status, retry_after):
+            return page
+        if not _blocked(status, retry_after):
+            memory = _rendered_domains
+    except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+        if not render:
+            raise
+        error = e
+
+    count("browser_escalations")
+    try:
+        return await _arender(url, memory)
+    except Exception as e:
+        if page is None:
+            raise error from e
+        logger.warning(f"Rendering {url} failed, using the page fetched without a browser: {e}")
+        return page
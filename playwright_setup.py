@@ -0,0 +1,107 @@
+"""
+One-time installation of the browsers Playwright needs. Run `python -m playwright_setup` to install them ahead of time,
+otherwise the browser pool installs them the first time a browser is launched.
+"""
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+from importlib.metadata import version
+from pathlib import Path
+
+import playwright
+
+logger = logging.getLogger(__name__)
+
+MARKER_PREFIX = ".autopack-installed-"
+
+_install_lock = threading.Lock()
+
+
+def playwright_version() -> str:
+    return version("playwright")
+
+
+def browsers_path() -> Path:
+    """The directory Playwright downloads its browsers into, following the same rules as Playwright itself."""
+    env_path = os.environ.get("PLAYWRIGHT_BROWSERS_PATH")
+    if env_path == "0":
+        return Path(playwright.__file__).parent / "driver" / "package" / ".local-browsers"
+    if env_path:
+        return Path(env_path)
+
+    if sys.platform == "darwin":
+        return Path.home() / "Library" / "Caches" / "ms-playwright"
+    if sys.platform == "win32":
+        return Path(os.environ.get("LOCALAPPDATA", Path.home() / "AppData" / "Local")) / "ms-playwright"
+    return Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "ms-playwright"
+
+
+def marker_file() -> Path:
+    return browsers_path() / f"{MARKER_PREFIX}{playwright_version()}"
+
+
+def expected_browser_dirs(browser: str = "chromium") -> list[Path]:
+    """The directories the installed Playwright version expects for `browser`, e.g. `chromium-1071`."""
+    manifest = Path(playwright.__file__).parent / "driver" / "package" / "browsers.json"
+    with open(manifest) as f:
+        browsers = json.load(f)["browsers"]
+
+    root = browsers_path()
+    return [
+        root / f"{entry['name'].replace('-', '_')}-{entry['revision']}"
+        for entry in browsers
+        if entry["name"] == browser or entry["name"].startswith(f"{browser}-")
+    ]
+
+
+def browsers_installed(browser: str = "chromium") -> bool:
+    """Cheap check for an existing install: a marker file for this Playwright version, or the browser directories."""
+    if marker_file().exists():
+        return True
+
+    try:
+        dirs = expected_browser_dirs(browser)
+    except (OSError, KeyError, ValueError):
+        return False
+
+    if dirs and all(path.is_dir() for path in dirs):
+        _write_marker()
+        return True
+    return False
+
+
+def install_browsers(browser: str = "chromium", force: bool = False) -> bool:
+    """Install `browser` for Playwright unless it is already present. Returns True if the browser is available."""
+    with _install_lock:
+        if not force and browsers_installed(browser):
+            return True
+
+        logger.info(f"Installing Playwright {browser}")
+        process = subprocess.run(
+            [sys.executable, "-m", "playwright", "install", browser],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        if process.returncode:
+            logger.error(f"Could not install Playwright {browser}: {process.stderr.strip()}")
+            return False
+
+        _write_marker()
+        return True
+
+
+def _write_marker():
+    try:
+        path = marker_file()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.touch()
+    except OSError as e:
+        logger.warning(f"Could not write Playwright install marker: {e}")
+
+
+if __name__ == "__main__":
+    sys.exit(0 if install_browsers(force="--force" in sys.argv) else 1)
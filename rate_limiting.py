@@ -0,0 +1,367 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, replace
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Iterator, Optional, Union
+from urllib.parse import urlsplit
+
+from instrumentation import count, phase
+
+# Requests in flight across all hosts, and the limits for any host without limits of its own. Generous enough not to
+# slow a single agent down, while keeping many agents in parallel from flooding one server.
+DEFAULT_MAX_CONCURRENCY = 64
+DEFAULT_HOST_RATE = 10
+DEFAULT_HOST_BURST = 10
+DEFAULT_HOST_CONCURRENCY = 8
+# Statuses servers use to say they're getting too many requests
+THROTTLED_STATUSES = {429, 503}
+# Seconds of the first backoff from a host that doesn't send Retry-After, doubling each time in a row, and the longest
+# any backoff lasts
+BACKOFF_BASE = 1.0
+MAX_BACKOFF = 60.0
+
+
+class RateLimiter:
+    """
+    A token bucket allowing `rate` calls per second on average, and bursts of up to `burst` calls. Shared between
+    threads and event loops: callers reserve a slot under a lock, then wait for it without holding anything, so
+    waiting callers are served in the order they arrived. A `rate` of 0 disables limiting.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        if rate < 0 or burst < 1:
+            raise ValueError("rate can't be negative and burst must be at least 1")
+
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token, returning how many seconds to wait until it can be used."""
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Tokens go negative while callers are queued, which pushes each later caller further back
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+
+    async def aacquire(self):
+        wait = self.reserve()
+        if wait:
+            await asyncio.sleep(wait)
+
+
+def host_of(url: str) -> str:
+    """The host part of `url`, which requests are scheduled by. A bare host name is returned as it is."""
+    return (urlsplit(url).hostname or url).lower() if "//" in url else url.lower()
+
+
+def retry_after_seconds(value: Optional[Union[str, float]]) -> Optional[float]:
+    """The delay a Retry-After header asks for, given either as seconds or as an HTTP date."""
+    if value is None or value == "":
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass(frozen=True)
+class HostLimits:
+    # Requests per second to the host on average, 0 for no limit, and how many can be sent in a burst
+    rate: float = 0
+    burst: int = 1
+    # Requests to the host in flight at once, 0 for no limit
+    max_concurrency: int = 0
+
+
+@dataclass
+class HostStats:
+    active: int = 0
+    queued: int = 0
+    # The most requests that have been queued for the host at once
+    peak_queued: int = 0
+    # Seconds until the host is sent requests again, after it asked for a backoff
+    throttled_for: float = 0.0
+    backoffs: int = 0
+
+
+class _Host:
+    def __init__(self, limits: HostLimits):
+        self.limits = limits
+        self.bucket = RateLimiter(limits.rate, burst=limits.burst)
+        self.stats = HostStats()
+        self.blocked_until = 0.0
+        # Backoffs in a row, which each double the delay when the host doesn't say how long to wait
+        self.strikes = 0
+
+
+class _Waiter:
+    """A caller waiting for a free slot: a thread blocked on an Event, or a coroutine awaiting a Future."""
+
+    def __init__(self, host: str, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.host = host
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+        self.granted = False
+
+    def wake(self):
+        if self.loop:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+        else:
+            self.event.set()
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+DEFAULT_HOST_LIMITS = HostLimits(
+    rate=DEFAULT_HOST_RATE, burst=DEFAULT_HOST_BURST, max_concurrency=DEFAULT_HOST_CONCURRENCY
+)
+
+
+class RequestScheduler:
+    """
+    Spaces out outbound requests per host, so that many agents working in parallel queue up behind each other rather
+    than setting off a server's rate limits. Every host gets a token bucket and a cap on requests in flight, and no more
+    than `max_concurrency` requests are in flight across all hosts. Hosts that answer 429 or 503 are left alone for as
+    long as their Retry-After asks, or with exponential backoff if they don't say.
+
+    The scheduler is shared between threads and event loops: `slot` blocks the calling thread, `aslot` only suspends
+    the calling coroutine, and both wait in the same first come, first served queue.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        default_limits: HostLimits = DEFAULT_HOST_LIMITS,
+        host_limits: Optional[dict[str, HostLimits]] = None,
+    ):
+        self.max_concurrency = max_concurrency
+        self.default_limits = default_limits
+        self._host_limits = {host.lower(): limits for host, limits in (host_limits or {}).items()}
+
+        self._lock = threading.Lock()
+        self._hosts: dict[str, _Host] = {}
+        self._active = 0
+        self._waiting: deque[_Waiter] = deque()
+
+    def set_limits(self, host: str, limits: HostLimits, overwrite: bool = True):
+        """Use `limits` for `host` (a host name or URL) instead of the defaults. With `overwrite` False, limits the host
+        already has are kept, so a pack can declare a service's limits without undoing a user's configuration."""
+        host = host_of(host)
+        with self._lock:
+            if host in self._host_limits and (not overwrite or self._host_limits[host] == limits):
+                return
+            self._host_limits[host] = limits
+            state = self._hosts.get(host)
+            if state is not None:
+                state.limits = limits
+                state.bucket = RateLimiter(limits.rate, burst=limits.burst)
+
+    def limits(self, host: str) -> HostLimits:
+        """The limits requests to `host` (a host name or URL) are held to."""
+        host = host_of(host)
+        with self._lock:
+            return self._host_limits.get(host, self.default_limits)
+
+    @contextmanager
+    def slot(self, url: str) -> Iterator[None]:
+        """
+        Wait until a request to the host of `url` may be sent, and hold its slot until the block exits. The host's rate
+        limit and backoff are waited out before taking a slot, so requests held back by one host don't keep those to
+        other hosts waiting.
+        """
+        host = host_of(url)
+        delay = self._delay(host, reserve=True)
+        while True:
+            if delay:
+                with phase("queue"):
+                    time.sleep(delay)
+            waiter = self._join(host)
+            if waiter:
+                with phase("queue"):
+                    waiter.event.wait()
+            # The host may have asked for a backoff while this request was queued
+            delay = self._delay(host)
+            if not delay:
+                break
+            self._release(host)
+
+        try:
+            yield
+        finally:
+            self._release(host)
+
+    @asynccontextmanager
+    async def aslot(self, url: str) -> AsyncIterator[None]:
+        host = host_of(url)
+        delay = self._delay(host, reserve=True)
+        while True:
+            if delay:
+                with phase("queue"):
+                    await asyncio.sleep(delay)
+            waiter = self._join(host, asyncio.get_running_loop())
+            if waiter:
+                try:
+                    with phase("queue"):
+                        await waiter.future
+                except asyncio.CancelledError:
+                    self._leave(waiter)
+                    raise
+            delay = self._delay(host)
+            if not delay:
+                break
+            self._release(host)
+
+        try:
+            yield
+        finally:
+            self._release(host)
+
+    def note_response(self, url: str, status: int, retry_after: Optional[Union[str, float]] = None):
+        """Tell the scheduler how the host of `url` answered, so it can back off from hosts that are overloaded."""
+        if status in THROTTLED_STATUSES:
+            self.backoff(url, retry_after)
+            return
+        with self._lock:
+            state = self._hosts.get(host_of(url))
+            if state is not None:
+                state.strikes = 0
+
+    def backoff(self, url: str, retry_after: Optional[Union[str, float]] = None):
+        """Hold back requests to the host of `url` for `retry_after` (seconds or an HTTP date), or exponentially
+        longer each time in a row that it's called without one."""
+        seconds = retry_after_seconds(retry_after)
+        count("host_backoffs")
+        with self._lock:
+            state = self._state(host_of(url))
+            state.strikes += 1
+            state.stats.backoffs += 1
+            if seconds is None:
+                seconds = BACKOFF_BASE * 2 ** (state.strikes - 1)
+            state.blocked_until = max(state.blocked_until, time.monotonic() + min(seconds, MAX_BACKOFF))
+
+    def stats(self) -> dict[str, HostStats]:
+        """A snapshot of every host's queue."""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                host: replace(state.stats, throttled_for=max(state.blocked_until - now, 0.0))
+                for host, state in self._hosts.items()
+            }
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiting)
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    def _state(self, host: str) -> _Host:
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _Host(self._host_limits.get(host, self.default_limits))
+        return state
+
+    def _fits(self, state: _Host) -> bool:
+        if self.max_concurrency and self._active >= self.max_concurrency:
+            return False
+        return not state.limits.max_concurrency or state.stats.active < state.limits.max_concurrency
+
+    def _start(self, state: _Host):
+        self._active += 1
+        state.stats.active += 1
+
+    def _join(self, host: str, loop: Optional[asyncio.AbstractEventLoop] = None) -> Optional[_Waiter]:
+        """Take a slot for `host` if one is free, or join the queue and return the waiter to wait on."""
+        with self._lock:
+            state = self._state(host)
+            # Callers already queued for the same host go first
+            if self._fits(state) and not state.stats.queued:
+                self._start(state)
+                return None
+
+            waiter = _Waiter(host, loop)
+            self._waiting.append(waiter)
+            state.stats.queued += 1
+            state.stats.peak_queued = max(state.stats.peak_queued, state.stats.queued)
+        count("requests_queued")
+        return waiter
+
+    def _leave(self, waiter: _Waiter):
+        """Give up waiting, e.g. because the waiting coroutine was cancelled."""
+        with self._lock:
+            if not waiter.granted:
+                self._waiting.remove(waiter)
+                self._state(waiter.host).stats.queued -= 1
+                return
+        # The slot was granted just as the caller gave up, pass it on
+        self._release(waiter.host)
+
+    def _release(self, host: str):
+        with self._lock:
+            state = self._hosts[host]
+            self._active -= 1
+            state.stats.active -= 1
+            granted = []
+            for waiter in list(self._waiting):
+                if self.max_concurrency and self._active >= self.max_concurrency:
+                    break
+                waiter_state = self._hosts[waiter.host]
+                if self._fits(waiter_state):
+                    self._waiting.remove(waiter)
+                    waiter_state.stats.queued -= 1
+                    waiter.granted = True
+                    self._start(waiter_state)
+                    granted.append(waiter)
+        for waiter in granted:
+            waiter.wake()
+
+    def _delay(self, host: str, reserve: bool = False) -> float:
+        """Seconds to wait for any backoff the host asked for, and for its rate limit if `reserve` takes a token."""
+        with self._lock:
+            state = self._state(host)
+            blocked_for = state.blocked_until - time.monotonic()
+            bucket = state.bucket
+        return max(bucket.reserve() if reserve else 0.0, blocked_for, 0.0)
+
+
+_scheduler = RequestScheduler()
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> RequestScheduler:
+    """The process-wide scheduler that the web packs send their requests through."""
+    return _scheduler
+
+
+def configure_scheduler(**kwargs) -> RequestScheduler:
+    """Replace the process-wide scheduler with one built from `kwargs`, e.g.
+    `configure_scheduler(max_concurrency=16, host_limits={"example.com": HostLimits(rate=1)})`. Requests already
+    holding a slot finish on the old one."""
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = RequestScheduler(**kwargs)
+        return _scheduler
@@ -0,0 +1,338 @@
+"""
+An opt-in, persistent cache of HTTP GET responses for the web packs, following the caching rules servers send along:
+responses are reused without touching the network while Cache-Control or Expires says they're fresh, and once they're
+stale they're revalidated with a conditional request, so an unchanged page costs a 304 rather than its whole body.
+
+Bodies are stored zlib compressed in a SQLite database in WAL mode, which several worker processes can share, and the
+least recently used responses are evicted once the database grows past `max_bytes`. Enable it with
+`configure_response_cache(path)`.
+"""
+import json
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator, Mapping, Optional
+
+from async_execution import run_blocking
+from caching import CacheStats, cache_key
+from instrumentation import count
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_ENTRIES = 100_000
+# Responses with a Last-Modified date but no explicit lifetime are considered fresh for this share of their age, as
+# RFC 9111 suggests, up to HEURISTIC_MAX_LIFETIME seconds
+HEURISTIC_FRACTION = 0.1
+HEURISTIC_MAX_LIFETIME = 24 * 60 * 60
+CACHEABLE_STATUSES = {200, 203}
+# Stored responses are keyed by URL and the request headers the caller passed, which the session's own headers don't
+# change, so only responses that vary on nothing else are stored
+VARY_HEADERS_ALLOWED = {"accept-encoding"}
+# Seconds between updates of a response's last access time. Recording every hit would turn each read into a write
+# that all worker processes queue up behind, and least recently used only needs to be roughly right.
+ACCESS_UPDATE_INTERVAL = 60
+# Headers kept with a stored response: what the packs read, and what freshness and revalidation need. Age is left out,
+# as it's only meaningful at the moment the response arrives.
+STORED_HEADERS = ("content-type", "cache-control", "expires", "date", "etag", "last-modified")
+
+_DIRECTIVE_RE = re.compile(r"\s*([\w-]+)\s*(?:=\s*(\"[^\"]*\"|[^,]*))?\s*(?:,|$)")
+
+
+@dataclass
+class CachedResponse:
+    status: int
+    headers: dict[str, str]
+    body: bytes
+    # Wall clock time the response stops being fresh, so that every process agrees on it
+    fresh_until: float
+
+    @property
+    def content_type(self) -> Optional[str]:
+        return self.headers.get("content-type")
+
+    def is_fresh(self) -> bool:
+        return time.time() < self.fresh_until
+
+    def validators(self) -> dict[str, str]:
+        """The headers that turn a request for this response into a conditional one."""
+        validators = {}
+        if "etag" in self.headers:
+            validators["If-None-Match"] = self.headers["etag"]
+        if "last-modified" in self.headers:
+            validators["If-Modified-Since"] = self.headers["last-modified"]
+        return validators
+
+
+def cache_control(headers: Mapping[str, str]) -> dict[str, Optional[str]]:
+    directives = {}
+    for match in _DIRECTIVE_RE.finditer(headers.get("cache-control", "")):
+        value = match.group(2)
+        directives[match.group(1).lower()] = value.strip().strip('"') if value else None
+    return directives
+
+
+def _timestamp(value: Optional[str]) -> Optional[float]:
+    try:
+        return parsedate_to_datetime(value).timestamp() if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def freshness_lifetime(headers: Mapping[str, str]) -> Optional[float]:
+    """
+    Seconds a response with `headers` (lowercase names) stays fresh from now, 0 if it must be revalidated before every
+    use, or None if it mustn't be stored at all.
+    """
+    directives = cache_control(headers)
+    if "no-store" in directives:
+        return None
+    if "no-cache" in directives:
+        return 0
+
+    try:
+        age = float(headers.get("age", 0))
+    except ValueError:
+        age = 0
+    if directives.get("max-age") is not None:
+        try:
+            return max(float(directives["max-age"]) - age, 0)
+        except ValueError:
+            # A malformed max-age means the response is stale
+            return 0
+
+    date = _timestamp(headers.get("date")) or time.time()
+    if "expires" in headers:
+        # An invalid date, commonly "0" or "-1", also means already expired
+        expires = _timestamp(headers["expires"])
+        return max(expires - date - age, 0) if expires else 0
+
+    last_modified = _timestamp(headers.get("last-modified"))
+    if last_modified and last_modified < date:
+        return max(min((date - last_modified) * HEURISTIC_FRACTION, HEURISTIC_MAX_LIFETIME) - age, 0)
+    return 0
+
+
+def varies_on_other_headers(headers: Mapping[str, str]) -> bool:
+    """Whether a response with `headers` (lowercase names) depends on request headers the cache doesn't key on."""
+    names = {name.strip().lower() for name in headers.get("vary", "").split(",") if name.strip()}
+    return bool(names - VARY_HEADERS_ALLOWED)
+
+
+def _lowercase(headers: Optional[Mapping[str, str]]) -> dict[str, str]:
+    return {name.lower(): value for name, value in (headers or {}).items()}
+
+
+class ResponseCache:
+    """
+    A persistent cache of GET responses, keyed by URL and request headers. `lookup` returns the stored response, which
+    the caller serves directly if it's fresh or revalidates with its `validators` otherwise; `store` and `revalidated`
+    record what the server sent back.
+    """
+
+    def __init__(self, path: str, max_bytes: int = DEFAULT_MAX_BYTES, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.stats = CacheStats()
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, url TEXT NOT NULL, status INTEGER NOT NULL, "
+            "headers TEXT NOT NULL, body BLOB NOT NULL, size INTEGER NOT NULL, fresh_until REAL NOT NULL, "
+            "accessed_at REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+
+    @staticmethod
+    def _key(url: str, request_headers: Optional[Mapping[str, str]]) -> str:
+        return cache_key("GET", url, _lowercase(request_headers))
+
+    def lookup(self, url: str, request_headers: Optional[Mapping[str, str]] = None) -> Optional[CachedResponse]:
+        key = self._key(url, request_headers)
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT status, headers, body, fresh_until, accessed_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.stats.misses += 1
+                return None
+            now = time.time()
+            if now - row[4] >= ACCESS_UPDATE_INTERVAL:
+                self._connection.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self.stats.hits += 1
+
+        status, headers, body, fresh_until, _ = row
+        return CachedResponse(status, json.loads(headers), zlib.decompress(body), fresh_until)
+
+    def store(
+        self,
+        url: str,
+        request_headers: Optional[Mapping[str, str]],
+        status: int,
+        headers: Mapping[str, str],
+        body: bytes,
+    ) -> Optional[CachedResponse]:
+        """Store a complete response if the server allows it, returning what was stored."""
+        headers = _lowercase(headers)
+        lifetime = freshness_lifetime(headers)
+        if status not in CACHEABLE_STATUSES or lifetime is None or varies_on_other_headers(headers):
+            return None
+
+        response = CachedResponse(
+            status, {name: headers[name] for name in STORED_HEADERS if name in headers}, body, time.time() + lifetime
+        )
+        if not lifetime and not response.validators():
+            # It could never be used without downloading it again
+            return None
+
+        self._write(url, request_headers, response)
+        return response
+
+    def revalidated(
+        self,
+        url: str,
+        request_headers: Optional[Mapping[str, str]],
+        cached: CachedResponse,
+        headers: Mapping[str, str],
+    ) -> CachedResponse:
+        """Record that the server answered a conditional request for `cached` with 304 Not Modified and `headers`."""
+        updated = {
+            **cached.headers,
+            **{name: value for name, value in _lowercase(headers).items() if name in STORED_HEADERS},
+        }
+        lifetime = freshness_lifetime(updated)
+        response = CachedResponse(cached.status, updated, cached.body, time.time() + (lifetime or 0))
+        if lifetime is None:
+            self.delete(url, request_headers)
+        else:
+            self._write(url, request_headers, response)
+        return response
+
+    async def alookup(self, url: str, request_headers: Optional[Mapping[str, str]] = None) -> Optional[CachedResponse]:
+        """`lookup` for async code. The database can be locked by another process, so it's never read on the loop."""
+        return await run_blocking(self.lookup, url, request_headers)
+
+    async def astore(
+        self,
+        url: str,
+        request_headers: Optional[Mapping[str, str]],
+        status: int,
+        headers: Mapping[str, str],
+        body: bytes,
+    ) -> Optional[CachedResponse]:
+        return await run_blocking(self.store, url, request_headers, status, headers, body)
+
+    async def arevalidated(
+        self,
+        url: str,
+        request_headers: Optional[Mapping[str, str]],
+        cached: CachedResponse,
+        headers: Mapping[str, str],
+    ) -> CachedResponse:
+        return await run_blocking(self.revalidated, url, request_headers, cached, headers)
+
+    def delete(self, url: str, request_headers: Optional[Mapping[str, str]] = None):
+        with self._lock:
+            self._connection.execute("DELETE FROM responses WHERE key = ?", (self._key(url, request_headers),))
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute("DELETE FROM responses")
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def _write(self, url: str, request_headers: Optional[Mapping[str, str]], response: CachedResponse):
+        body = zlib.compress(response.body)
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, url, status, headers, body, size, fresh_until, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    self._key(url, request_headers),
+                    url,
+                    response.status,
+                    json.dumps(response.headers),
+                    body,
+                    len(body),
+                    response.fresh_until,
+                    now,
+                ),
+            )
+            self._evict()
+
+    def _evict(self):
+        # Single statements, so that processes evicting at the same time can't leave the limits exceeded
+        evicted = 0
+        if self.max_entries:
+            evicted += self._connection.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            ).rowcount
+        if self.max_bytes:
+            evicted += self._connection.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM "
+                "(SELECT key, SUM(size) OVER (ORDER BY accessed_at DESC, key) AS total FROM responses) "
+                "WHERE total > ?)",
+                (self.max_bytes,),
+            ).rowcount
+        self.stats.evictions += evicted
+
+
+def recording(chunks: Iterable[bytes], parts: list[bytes]) -> Iterator[bytes]:
+    """Pass `chunks` through, keeping a copy of each in `parts` so the body can be stored once it's been read."""
+    for chunk in chunks:
+        parts.append(chunk)
+        yield chunk
+
+
+async def arecording(chunks: AsyncIterable[bytes], parts: list[bytes]) -> AsyncIterator[bytes]:
+    async for chunk in chunks:
+        parts.append(chunk)
+        yield chunk
+
+
+def note_hit(cached: CachedResponse):
+    count("http_cache_hits")
+    count("http_cache_bytes_saved", len(cached.body))
+
+
+def note_revalidated(cached: CachedResponse):
+    count("http_cache_revalidations")
+    count("http_cache_bytes_saved", len(cached.body))
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """The process-wide response cache, or None if it hasn't been enabled."""
+    return _cache
+
+
+def configure_response_cache(
+    path: Optional[str], max_bytes: int = DEFAULT_MAX_BYTES, max_entries: int = DEFAULT_MAX_ENTRIES
+) -> Optional[ResponseCache]:
+    """Store responses in the SQLite database at `path`, shared by every process that opens it, or stop caching them if
+    `path` is None."""
+    global _cache
+    cache = ResponseCache(path, max_bytes=max_bytes, max_entries=max_entries) if path else None
+    with _cache_lock:
+        previous, _cache = _cache, cache
+
+    if previous is not None:
+        previous.close()
+    return cache
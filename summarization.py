@@ -1,7 +1,14 @@
+import asyncio
+from typing import Awaitable, Callable, Optional
+
+from async_execution import run_blocking
+from llm_cache import cached_acall_llm, cached_call_llm
+from text_extraction import extract_text, looks_like_html
+
 SUMMARIZATION_TEMPLATE = """Make the following text more concise, ensuring the final output is no more than {filter_threshold} characters long.
 
 Simplify the language used. Replace long phrases with shorter synonyms, remove unnecessary adverbs and adjectives, or rephrase sentences to make them more concise.
- 
+
 Remove redundancies, especially those written informally or conversationally, using repetitive information or phrases.
 
 Flatten text that includes nested hierarchical information that isn't crucial for understanding.
@@ -12,14 +19,116 @@ Retain key details such as file names, IDs, people, places, and important events
 
 {long_text}"""
 
+# Documents shorter than this are returned untouched
+DEFAULT_TRIGGER_LENGTH = 1000
+# The most text sent to the LLM in a single summarization prompt
+DEFAULT_CHUNK_SIZE = 8000
+DEFAULT_MAX_CONCURRENCY = 4
+# Each chunk summary gets at least this many characters, no matter how many chunks share the threshold
+MIN_CHUNK_SUMMARY_LENGTH = 200
+# Give up on reducing further after this many rounds and truncate, in case the LLM doesn't shorten the text
+MAX_REDUCE_ROUNDS = 4
 
-def _filter_long_documents(self, document: str) -> str:
-    # TODO: Configurable limit or like configurable turn it off?
-    if len(document) > 1000:
-        summary_prompt = SUMMARIZATION_TEMPLATE.format(
-            long_text=document[:8000], filter_threshold=self.filter_threshold
-        )
-        summarization = call_llm(summary_prompt, llm=self.llm)
+# Preferred places to split a document, best first
+SPLIT_SEPARATORS = ["\n\n", "\n", ". ", " "]
+
+
+def split_document(document: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> list[str]:
+    """Split a document into chunks of at most `chunk_size` characters, breaking at paragraph, line, sentence or word
+    boundaries when one falls in the last fifth of a chunk."""
+    chunks = []
+    start = 0
+    while len(document) - start > chunk_size:
+        end = start + chunk_size
+        window_start = end - chunk_size // 5
+        for separator in SPLIT_SEPARATORS:
+            split_at = document.rfind(separator, window_start, end)
+            if split_at != -1:
+                end = split_at + len(separator)
+                break
+
+        chunks.append(document[start:end])
+        start = end
+
+    chunks.append(document[start:])
+    return chunks
+
+
+def _summary_prompt(text: str, filter_threshold: int) -> str:
+    return SUMMARIZATION_TEMPLATE.format(long_text=text, filter_threshold=filter_threshold)
+
+
+def _chunk_threshold(filter_threshold: int, chunk_count: int) -> int:
+    return max(filter_threshold // chunk_count, MIN_CHUNK_SUMMARY_LENGTH)
+
+
+def summarize(
+    document: str,
+    llm: Callable[[str], str],
+    filter_threshold: int,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> str:
+    """Summarize every chunk of `document`, then summarize the joined summaries until they fit in `filter_threshold`
+    characters."""
+    text = document
+    for _ in range(MAX_REDUCE_ROUNDS):
+        chunks = split_document(text, chunk_size)
+        threshold = _chunk_threshold(filter_threshold, len(chunks))
+        summaries = [cached_call_llm(_summary_prompt(chunk, threshold), llm) for chunk in chunks]
+        text = "\n".join(summaries)
+        if len(text) <= filter_threshold or len(chunks) == 1:
+            break
+
+    return text[:filter_threshold]
+
+
+async def asummarize(
+    document: str,
+    llm: Optional[Callable[[str], str]],
+    allm: Optional[Callable[[str], Awaitable[str]]],
+    filter_threshold: int,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+) -> str:
+    """The async version of `summarize`. Chunks are summarized concurrently, at most `max_concurrency` at a time."""
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def summarize_chunk(chunk: str, threshold: int) -> str:
+        prompt = _summary_prompt(chunk, threshold)
+        async with semaphore:
+            if allm:
+                return await cached_acall_llm(prompt, allm)
+            # Don't block the event loop on a synchronous LLM
+            return await run_blocking(cached_call_llm, prompt, llm)
+
+    text = document
+    for _ in range(MAX_REDUCE_ROUNDS):
+        chunks = split_document(text, chunk_size)
+        threshold = _chunk_threshold(filter_threshold, len(chunks))
+        summaries = await asyncio.gather(*(summarize_chunk(chunk, threshold) for chunk in chunks))
+        text = "\n".join(summaries)
+        if len(text) <= filter_threshold or len(chunks) == 1:
+            break
+
+    return text[:filter_threshold]
+
+
+def _strip_markup(document: str) -> str:
+    # Markup costs tokens and says nothing, so only the readable text of an HTML document is summarized
+    if looks_like_html(document):
+        return extract_text(document, max_tokens=None) or document
+    return document
+
+
+def _filter_long_documents(
+    self,
+    document: str,
+    trigger_length: int = DEFAULT_TRIGGER_LENGTH,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> str:
+    if len(document) > trigger_length:
+        document = _strip_markup(document)
+        summarization = summarize(document, self.llm, self.filter_threshold or chunk_size, chunk_size)
         return f"The response was summarized as: {summarization}"
 
     return document
@@ -30,5 +139,15 @@ async def afilter_long_documents(
     document: str,
     llm: Callable[[str], str],
     allm: Callable[[str], Awaitable[str]],
+    trigger_length: int = DEFAULT_TRIGGER_LENGTH,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
 ) -> str:
-    pass
+    if len(document) > trigger_length:
+        document = await run_blocking(_strip_markup, document)
+        summarization = await asummarize(
+            document, llm, allm, self.filter_threshold or chunk_size, chunk_size, max_concurrency
+        )
+        return f"The response was summarized as: {summarization}"
+
+    return document
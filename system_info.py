@@ -0,0 +1,167 @@
+"""
+One place to collect what the system info packs report. Facts that can't change while the process runs (OS, kernel,
+CPU count, total memory) are collected once, the mount table is re-read every minute, and readings that do change
+(disk and memory usage, load) are cached for a few seconds, so agents polling these packs in a loop don't turn every
+call into a round of syscalls.
+"""
+import functools
+import os
+import platform
+from dataclasses import dataclass
+from typing import Optional
+
+import psutil
+
+from caching import CachedCalls, TTLCache
+
+# Seconds that usage readings are reused for
+DYNAMIC_TTL = 5.0
+MOUNTS_TTL = 60.0
+
+_readings = CachedCalls(TTLCache(max_entries=256, ttl=DYNAMIC_TTL), name="system_info")
+_mounts = CachedCalls(TTLCache(max_entries=1, ttl=MOUNTS_TTL), name="system_info")
+
+
+@dataclass(frozen=True)
+class StaticInfo:
+    system: str
+    release: str
+    version: str
+    machine: str
+    # The distribution's name, e.g. "Debian GNU/Linux 12 (bookworm)", where the OS reports one
+    distribution: str
+    python_version: str
+    logical_cpus: int
+    physical_cpus: int
+    total_memory: int
+
+
+@dataclass(frozen=True)
+class DiskInfo:
+    mountpoint: str
+    device: str
+    fstype: str
+    total: int
+    used: int
+    free: int
+    percent: float
+
+
+@dataclass(frozen=True)
+class MemoryInfo:
+    total: int
+    available: int
+    percent: float
+
+
+@dataclass(frozen=True)
+class SystemSnapshot:
+    static: StaticInfo
+    memory: MemoryInfo
+    # 1, 5 and 15 minute load averages
+    load_average: tuple[float, float, float]
+    disks: tuple[DiskInfo, ...]
+
+
+def _distribution() -> str:
+    try:
+        return platform.freedesktop_os_release().get("PRETTY_NAME", "")
+    except (AttributeError, OSError):
+        # Not Linux, or no os-release file
+        return ""
+
+
+@functools.lru_cache(maxsize=None)
+def static_info() -> StaticInfo:
+    """Facts that stay the same for the life of the process, collected on first use."""
+    uname = platform.uname()
+    return StaticInfo(
+        system=uname.system,
+        release=uname.release,
+        version=uname.version,
+        machine=uname.machine,
+        distribution=_distribution(),
+        python_version=platform.python_version(),
+        logical_cpus=psutil.cpu_count() or 1,
+        physical_cpus=psutil.cpu_count(logical=False) or psutil.cpu_count() or 1,
+        total_memory=psutil.virtual_memory().total,
+    )
+
+
+def partitions() -> tuple:
+    """The mounted disk partitions, with each device listed once. Virtual filesystems and read-only squashfs images,
+    such as snaps, which are always full, are left out."""
+
+    def read():
+        seen, unique = set(), []
+        for partition in psutil.disk_partitions(all=False):
+            if partition.device in seen or partition.fstype == "squashfs":
+                continue
+            seen.add(partition.device)
+            unique.append(partition)
+        return tuple(unique)
+
+    return _mounts.call("partitions", read)
+
+
+def mount_point(path: str) -> str:
+    """The mount point of the filesystem holding `path`."""
+    path = os.path.realpath(path)
+    while not os.path.ismount(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return path
+
+
+def disk_info(path: str) -> DiskInfo:
+    """Usage of the filesystem holding `path`."""
+
+    def read() -> DiskInfo:
+        mountpoint = mount_point(path)
+        partition = next((partition for partition in partitions() if partition.mountpoint == mountpoint), None)
+        usage = psutil.disk_usage(mountpoint)
+        return DiskInfo(
+            mountpoint=mountpoint,
+            device=partition.device if partition else "",
+            fstype=partition.fstype if partition else "",
+            total=usage.total,
+            used=usage.used,
+            free=usage.free,
+            percent=usage.percent,
+        )
+
+    return _readings.call(f"disk:{path}", read)
+
+
+def memory_info() -> MemoryInfo:
+    def read() -> MemoryInfo:
+        memory = psutil.virtual_memory()
+        return MemoryInfo(total=memory.total, available=memory.available, percent=memory.percent)
+
+    return _readings.call("memory", read)
+
+
+def load_average() -> tuple[float, float, float]:
+    return _readings.call("load", psutil.getloadavg)
+
+
+def snapshot(paths: Optional[list[str]] = None) -> SystemSnapshot:
+    """Everything at once: the usage of the filesystems holding `paths`, or of every partition if none are given."""
+    if paths is None:
+        disks = [disk_info(partition.mountpoint) for partition in partitions()]
+    else:
+        disks = [disk_info(path) for path in paths]
+    unique_disks = tuple({disk.mountpoint: disk for disk in disks}.values())
+    return SystemSnapshot(static_info(), memory_info(), load_average(), unique_disks)
+
+
+def clear_cache():
+    """Forget cached readings, e.g. in tests. Static facts are kept."""
+    _readings.cache.clear()
+    _mounts.cache.clear()
+
+
+def gigabytes(size: int) -> str:
+    return f"{size / 1024 ** 3:.1f} GB"
@@ -0,0 +1,250 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import psutil
+import pytest
+import wikipedia
+
+from async_execution import configure_executor, run_blocking
+from disk_usage import DiskUsage
+from extract_information_from_webpage.extract_information_from_webpage import ExtractInformationFromWebpage
+from filesystem.delete_file import DeleteFile
+from filesystem.list_files import ListFiles
+from filesystem.read_file import ReadFile
+from filesystem.write_file import WriteFile
+from get_webpage_html_content.get_webpage_html_content import GetWebpageHtmlContent
+from google_search.google_search import GoogleSearch
+from http_request.http_request import HttpRequest
+from os_info.os_info import OSInfo
+from page_fetching import FetchedPage, forget_domains
+from wikipedia_summarize.wikipedia import WikipediaPack
+from wolframalpha_query import WolframAlphaQuery
+from write_python_code.write_python_file import WritePythonCode
+
+# Each blocking call below is slowed down to BLOCKING_SECONDS, so a pack that runs it on the event loop stalls it for
+# far longer than MAX_STALL_SECONDS
+BLOCKING_SECONDS = 0.5
+MAX_STALL_SECONDS = 0.2
+
+WOLFRAM_RESPONSE = b"""<?xml version="1.0" encoding="UTF-8"?>
+<queryresult success="true" error="false" numpods="2">
+  <pod title="Input interpretation" id="Input"><subpod title=""><plaintext>population</plaintext></subpod></pod>
+  <pod title="Result" id="Result" primary="true"><subpod title=""><plaintext>331.9 million</plaintext></subpod></pod>
+</queryresult>
+"""
+SERPER_RESPONSE = b'{"organic": [{"title": "Example", "link": "https://example.com", "snippet": "An example"}]}'
+PAGE = b"<html><body><p>A page that takes a long time to download</p></body></html>"
+
+
+def slow(func):
+    def wrapper(*args, **kwargs):
+        time.sleep(BLOCKING_SECONDS)
+        return func(*args, **kwargs)
+
+    return wrapper
+
+
+@pytest.fixture(scope="module")
+def slow_server():
+    """A local stand-in for the services packs call over the network, taking BLOCKING_SECONDS to answer each request.
+    Packs that await their requests keep the loop running meanwhile, and packs that block on them stall it."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.startswith("/v2/query"):
+                self.answer(WOLFRAM_RESPONSE, "text/xml; charset=utf-8")
+            elif self.path == "/page":
+                self.answer(PAGE, "text/html; charset=utf-8")
+            else:
+                self.answer(b"Hello", "text/plain; charset=utf-8")
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            self.answer(SERPER_RESPONSE, "application/json")
+
+        def answer(self, body: bytes, content_type: str):
+            time.sleep(BLOCKING_SECONDS)
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            try:
+                self.wfile.write(body)
+            except ConnectionError:
+                pass
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+async def max_loop_stall(coro) -> tuple[float, object]:
+    """Run `coro` alongside a heartbeat, and return the longest the heartbeat went without running."""
+    loop = asyncio.get_running_loop()
+    task = asyncio.ensure_future(coro)
+    stall = 0.0
+    last = loop.time()
+    while not task.done():
+        await asyncio.sleep(0.01)
+        now = loop.time()
+        stall = max(stall, now - last)
+        last = now
+    return stall, task.result()
+
+
+def disk_usage(monkeypatch, server):
+    monkeypatch.setattr(psutil, "disk_usage", slow(psutil.disk_usage))
+    return DiskUsage(), {}
+
+
+def wolfram_alpha(monkeypatch, server):
+    monkeypatch.setenv("WOLFRAM_ALPHA_APPID", "1234")
+    return WolframAlphaQuery(base_url=f"{server}/v2/query"), {"query": "population of united states"}
+
+
+def write_python_code(monkeypatch, server):
+    module = sys.modules[WritePythonCode.__module__]
+    monkeypatch.setattr(module, "check_syntax", slow(module.check_syntax))
+    return WritePythonCode(), {"file_name": "hello.py", "code": "print('hello')"}
+
+
+def extract_information(monkeypatch, server):
+    async def afetch_page(url):
+        return FetchedPage(url, "<html><body><p>Some content that takes a long time to parse</p></body></html>")
+
+    async def allm(prompt):
+        return "summary"
+
+    module = sys.modules[ExtractInformationFromWebpage.__module__]
+    monkeypatch.setattr(module, "afetch_page", afetch_page)
+    monkeypatch.setattr(module, "extract_text", slow(module.extract_text))
+    return ExtractInformationFromWebpage(allm=allm), {"url": "https://example.com"}
+
+
+def delete_file(monkeypatch, server):
+    with open(os.path.join("workspace", "to_delete.txt"), "w") as f:
+        f.write("some string")
+    return DeleteFile(), {"filename": "to_delete.txt"}
+
+
+def read_file(monkeypatch, server):
+    with open(os.path.join("workspace", "to_read.txt"), "w") as f:
+        f.write("some string")
+    module = sys.modules[ReadFile.__module__]
+    monkeypatch.setattr(module, "read_slice", slow(module.read_slice))
+    return ReadFile(), {"filename": "to_read.txt", "tail": 1}
+
+
+def write_file(monkeypatch, server):
+    module = sys.modules[WriteFile.__module__]
+    monkeypatch.setattr(module, "write_file", slow(module.write_file))
+    return WriteFile(), {"filename": "to_write.txt", "text_content": "some string"}
+
+
+def os_info(monkeypatch, server):
+    module = sys.modules[OSInfo.__module__]
+    monkeypatch.setattr(module, "snapshot", slow(module.snapshot))
+    return OSInfo(), {}
+
+
+def list_files(monkeypatch, server):
+    module = sys.modules[ListFiles.__module__]
+    monkeypatch.setattr(module, "list_page", slow(module.list_page))
+    return ListFiles(), {}
+
+
+def http_request(monkeypatch, server):
+    return HttpRequest(), {"url": f"{server}/hello"}
+
+
+def get_webpage_html_content(monkeypatch, server):
+    forget_domains()
+    return GetWebpageHtmlContent(), {"url": f"{server}/page"}
+
+
+def google_search(monkeypatch, server):
+    monkeypatch.setenv("SERPER_API_KEY", "1234")
+    return GoogleSearch(base_url=server), {"query": "event loops"}
+
+
+def wikipedia_summarize(monkeypatch, server):
+    async def allm(prompt):
+        return "summary"
+
+    monkeypatch.setattr(wikipedia, "search", slow(lambda query, results: ["Event loop"]))
+    monkeypatch.setattr(
+        wikipedia, "page", slow(lambda title, auto_suggest: SimpleNamespace(title=title, summary="A loop"))
+    )
+    return WikipediaPack(allm=allm), {"query": "event loop"}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "make_pack",
+    [
+        disk_usage,
+        wolfram_alpha,
+        write_python_code,
+        extract_information,
+        delete_file,
+        read_file,
+        write_file,
+        os_info,
+        list_files,
+        http_request,
+        get_webpage_html_content,
+        google_search,
+        wikipedia_summarize,
+    ],
+)
+async def test_arun_does_not_block_event_loop(make_pack, monkeypatch, slow_server):
+    pack, kwargs = make_pack(monkeypatch, slow_server)
+    stall, result = await max_loop_stall(pack._arun(**kwargs))
+
+    assert isinstance(result, str) and not result.startswith("Error")
+    assert stall < MAX_STALL_SECONDS
+
+
+@pytest.mark.asyncio
+async def test_run_blocking_uses_shared_pool():
+    thread_name = await run_blocking(lambda: threading.current_thread().name)
+    assert thread_name.startswith("autopack-blocking")
+
+
+@pytest.mark.asyncio
+async def test_configure_executor_bounds_concurrency():
+    running = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def work():
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.05)
+        with lock:
+            running -= 1
+
+    configure_executor(max_workers=2)
+    try:
+        await asyncio.gather(*(run_blocking(work) for _ in range(6)))
+    finally:
+        configure_executor()
+
+    assert peak == 2
+
+
+def test_configure_executor_invalid():
+    with pytest.raises(ValueError):
+        configure_executor(max_workers=0)
@@ -0,0 +1,112 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from browser_pool import FAST_PROFILE, FULL_PROFILE, BrowserPool
+
+HTML = "<html><body><h1>Pooled page</h1></body></html>"
+
+
+async def render(page):
+    await page.set_content(HTML)
+    return await page.content(), page.context.browser
+
+
+def test_browser_pool_invalid_size():
+    with pytest.raises(ValueError):
+        BrowserPool(browsers=0)
+
+
+def test_browser_pool_reuses_browser():
+    pool = BrowserPool(browsers=1, contexts_per_browser=2)
+    try:
+        first_html, first_browser = pool.run(render)
+        second_html, second_browser = pool.run(render)
+    finally:
+        pool.close()
+
+    assert "Pooled page" in first_html
+    assert "Pooled page" in second_html
+    assert first_browser is second_browser
+
+
+@pytest.mark.asyncio
+async def test_browser_pool_shared_between_sync_and_async():
+    pool = BrowserPool(browsers=1, contexts_per_browser=2)
+    try:
+        _, sync_browser = pool.run(render)
+        html, async_browser = await pool.arun(render)
+    finally:
+        pool.close()
+
+    assert "Pooled page" in html
+    assert sync_browser is async_browser
+
+
+def test_browser_pool_recycles_pages():
+    pool = BrowserPool(browsers=1, contexts_per_browser=1, max_page_uses=2)
+
+    async def current_page(page):
+        return page
+
+    try:
+        pages = [pool.run(current_page) for _ in range(3)]
+    finally:
+        pool.close()
+
+    assert pages[0] is pages[1]
+    assert pages[1] is not pages[2]
+
+
+def test_fast_profile_blocks():
+    assert FAST_PROFILE.blocks("image", "https://example.com/photo.jpg")
+    assert FAST_PROFILE.blocks("script", "https://www.google-analytics.com/analytics.js")
+    assert FAST_PROFILE.blocks("xhr", "https://stats.g.doubleclick.net/collect")
+    assert not FAST_PROFILE.blocks("script", "https://example.com/app.js")
+    assert not FAST_PROFILE.blocks("script", "https://notdoubleclick.net/app.js")
+    assert not FULL_PROFILE.blocks("image", "https://example.com/photo.jpg")
+
+
+@pytest.fixture
+def local_site():
+    requested = []
+    page = b'<html><body><img src="/photo.jpg"><script src="/app.js"></script></body></html>'
+    script = b"document.body.insertAdjacentHTML('beforeend', '<p>Added by JavaScript</p>');"
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requested.append(self.path)
+            body, content_type = {
+                "/photo.jpg": (b"\xff" * 1024, "image/jpeg"),
+                "/app.js": (script, "application/javascript"),
+            }.get(self.path, (page, "text/html"))
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/", requested
+    server.shutdown()
+    server.server_close()
+
+
+def test_browser_pool_fast_profile_skips_resources(local_site):
+    url, requested = local_site
+    pool = BrowserPool(browsers=1, contexts_per_browser=1)
+    try:
+        html = pool.fetch_html(url, FAST_PROFILE)
+        assert "Added by JavaScript" in html
+        assert "/photo.jpg" not in requested
+
+        pool.fetch_html(url, FULL_PROFILE)
+        assert "/photo.jpg" in requested
+    finally:
+        pool.close()
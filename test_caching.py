@@ -0,0 +1,136 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from caching import CachedCalls, SQLiteCache, TTLCache, cache_key
+
+
+def test_cache_key_stable():
+    assert cache_key("a", {"x": 1, "y": 2}) == cache_key("a", {"y": 2, "x": 1})
+    assert cache_key("a", "b") != cache_key("ab")
+
+
+def test_ttl_cache_lru_eviction():
+    cache = TTLCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.stats.evictions == 1
+
+
+def test_ttl_cache_size_eviction():
+    cache = TTLCache(max_entries=0, max_bytes=10)
+    cache.set("a", "12345")
+    cache.set("b", "12345")
+    cache.set("c", "1")
+    assert cache.get("a") is None
+    assert cache.get("c") == "1"
+
+
+def test_ttl_cache_expiry():
+    cache = TTLCache(ttl=0.05)
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    time.sleep(0.1)
+    assert cache.get("a") is None
+    assert cache.stats.hits == 1
+    assert cache.stats.misses == 1
+
+
+def test_sqlite_cache(tmpdir):
+    path = str(tmpdir.join("cache.sqlite"))
+    cache = SQLiteCache(path, max_entries=2)
+    cache.set("a", {"answer": 42})
+    cache.set("b", "two")
+    cache.get("a")
+    cache.set("c", "three")
+
+    reopened = SQLiteCache(path)
+    assert reopened.get("a") == {"answer": 42}
+    assert reopened.get("b") is None
+    assert len(reopened) == 2
+
+
+def test_cached_calls_coalesces_threads():
+    calls = CachedCalls()
+    started = threading.Event()
+    count = 0
+
+    def slow():
+        nonlocal count
+        count += 1
+        started.set()
+        time.sleep(0.1)
+        return "result"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(calls.call("key", slow))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["result"] * 5
+    assert count == 1
+    assert calls.stats.coalesced + calls.stats.hits == 4
+
+
+@pytest.mark.asyncio
+async def test_cached_calls_coalesces_coroutines():
+    calls = CachedCalls()
+    count = 0
+
+    async def slow():
+        nonlocal count
+        count += 1
+        await asyncio.sleep(0.05)
+        return "result"
+
+    results = await asyncio.gather(*(calls.acall("key", slow) for _ in range(5)))
+    assert results == ["result"] * 5
+    assert count == 1
+    assert calls.stats.coalesced == 4
+    assert await calls.acall("key", slow) == "result"
+    assert calls.stats.hits == 1
+
+
+@pytest.mark.asyncio
+async def test_cached_calls_does_not_cache_errors():
+    calls = CachedCalls()
+
+    async def failing():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        await calls.acall("key", failing)
+    assert calls.cache.get("key") is None
+
+
+@pytest.mark.asyncio
+async def test_cached_calls_reads_sqlite_off_the_loop(tmpdir):
+    calls = CachedCalls(SQLiteCache(str(tmpdir.join("cache.sqlite"))))
+    threads = []
+
+    def recording(method):
+        def wrapper(*args):
+            threads.append(threading.current_thread().name)
+            return method(*args)
+
+        return wrapper
+
+    calls.cache.get = recording(calls.cache.get)
+    calls.cache.set = recording(calls.cache.set)
+
+    async def answer():
+        return {"answer": 42}
+
+    assert await calls.acall("key", answer) == {"answer": 42}
+    assert await calls.acall("key", answer) == {"answer": 42}
+    assert len(threads) == 3
+    assert all(name.startswith("autopack-blocking") for name in threads)
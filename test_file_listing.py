@@ -0,0 +1,83 @@
+import os
+
+from file_listing import DirectoryIndex, IgnoreRules, list_page
+
+
+def make_tree(root, *paths: str):
+    for path in paths:
+        full_path = os.path.join(root, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "w+") as f:
+            f.write("x")
+
+
+def age(*paths: str):
+    # Changes made within the filesystem's timestamp granularity can't be detected, so fresh directories aren't indexed
+    for path in paths:
+        os.utime(path, (1_000_000, 1_000_000))
+
+
+def test_ignore_rules():
+    rules = IgnoreRules.parse(["# comment", "*.log", "!keep.log", "build/", "/docs/generated", "**/tmp"])
+
+    assert rules.ignored("app.log", is_dir=False)
+    assert rules.ignored("nested/app.log", is_dir=False)
+    assert not rules.ignored("keep.log", is_dir=False)
+    assert rules.ignored("nested/build", is_dir=True)
+    assert not rules.ignored("build", is_dir=False)
+    assert rules.ignored("docs/generated", is_dir=True)
+    assert not rules.ignored("other/docs/generated", is_dir=True)
+    assert rules.ignored("a/b/tmp", is_dir=True)
+
+
+def test_nested_gitignore_applies_to_its_subtree(tmpdir):
+    root = str(tmpdir.mkdir("tree"))
+    make_tree(root, "a/skip.txt", "a/keep.txt", "b/skip.txt")
+    with open(os.path.join(root, "a", ".gitignore"), "w+") as f:
+        f.write("skip.txt\n")
+
+    entries, _ = list_page(root, index=DirectoryIndex())
+    paths = [entry.path for entry in entries]
+    assert "a/keep.txt" in paths
+    assert "a/skip.txt" not in paths
+    assert "b/skip.txt" in paths
+
+
+def test_index_is_reused_until_the_directory_changes(tmpdir, monkeypatch):
+    root = str(tmpdir.mkdir("tree"))
+    make_tree(root, "src/a.py", "src/b.py")
+    age(root, os.path.join(root, "src"))
+    index = DirectoryIndex()
+
+    scanned = []
+    scandir = os.scandir
+    monkeypatch.setattr(os, "scandir", lambda path: scanned.append(path) or scandir(path))
+
+    assert [path for path, _ in index.walk(root)] == ["src", "src/a.py", "src/b.py"]
+    assert len(scanned) == 2
+    assert [path for path, _ in index.walk(root)] == ["src", "src/a.py", "src/b.py"]
+    assert len(scanned) == 2
+
+    make_tree(root, "src/c.py")
+    assert [path for path, _ in index.walk(root)] == ["src", "src/a.py", "src/b.py", "src/c.py"]
+    assert scanned[2:] == [os.path.join(root, "src")]
+
+
+def test_cursor_skips_subtrees_before_it(tmpdir, monkeypatch):
+    root = str(tmpdir.mkdir("tree"))
+    make_tree(root, "a/1", "a/2", "b/1", "c/1")
+    index = DirectoryIndex()
+
+    scanned = []
+    scandir = os.scandir
+    monkeypatch.setattr(os, "scandir", lambda path: scanned.append(path) or scandir(path))
+
+    entries, cursor = list_page(root, limit=4, index=index)
+    assert [entry.path for entry in entries] == ["a", "a/1", "a/2", "b"]
+    assert cursor == "b"
+
+    scanned.clear()
+    entries, cursor = list_page(root, limit=4, cursor=cursor, index=index)
+    assert [entry.path for entry in entries] == ["b/1", "c", "c/1"]
+    assert cursor == ""
+    assert os.path.join(root, "a") not in scanned
@@ -0,0 +1,44 @@
+import pytest
+
+from file_reading import BinaryFileError, is_binary, line_count, line_range, read_slice, tail_start
+
+
+def test_line_ranges():
+    data = b"a\nb\nc\n"
+    assert line_range(data, 2, 2) == (2, 4)
+    assert line_range(data, 2) == (2, 6)
+    assert line_range(data, 10, 12) == (6, 6)
+    assert tail_start(data, 2) == 2
+    assert tail_start(b"a\nb\nc", 1) == 4
+    assert tail_start(data, 10) == 0
+    assert [line_count(data), line_count(b"a\nb"), line_count(b"")] == [3, 2, 0]
+
+
+def test_is_binary():
+    assert not is_binary("plain text, with ümlauts".encode())
+    # Cut in the middle of a character
+    assert not is_binary("ü".encode()[:1])
+    assert not is_binary("latin-1 text with ümlauts".encode("latin-1"))
+    assert is_binary(b"\x00\x01\x02")
+
+
+def test_read_slice_keeps_characters_whole(tmpdir):
+    path = tmpdir.join("text.txt")
+    path.write_binary("aé€b".encode())
+
+    # é is bytes 1-2 and € bytes 3-5, so these ranges start and end inside them
+    assert read_slice(path, offset=2, length=2).text == "€"
+    assert read_slice(path, max_bytes=4).text == "aé"
+    assert read_slice(path, max_bytes=4).truncated
+
+
+def test_read_slice_empty_and_binary_files(tmpdir):
+    path = tmpdir.join("empty.txt")
+    path.write_binary(b"")
+    assert read_slice(path).text == ""
+    assert read_slice(path, tail=5).text == ""
+
+    path = tmpdir.join("data.bin")
+    path.write_binary(b"\x00" * 100)
+    with pytest.raises(BinaryFileError):
+        read_slice(path)
@@ -0,0 +1,78 @@
+import os
+
+import pytest
+
+from filesystem_utils import WorkspacePaths, atomic_write, restrict_path, workspace_paths
+
+
+@pytest.fixture
+def workspace(tmpdir):
+    root = tmpdir.mkdir("root")
+    root.mkdir("inside").join("file.txt").write("inside")
+    tmpdir.join("secret.txt").write("secret")
+    os.symlink(tmpdir.join("secret.txt"), root.join("escape.txt"))
+    os.symlink(tmpdir, root.join("escape_dir"))
+    os.symlink(root.join("inside"), root.join("link_inside"))
+    return WorkspacePaths(str(root))
+
+
+def test_resolve(workspace):
+    assert workspace.resolve("inside/file.txt") == os.path.join(workspace.root, "inside", "file.txt")
+    assert workspace.resolve("new/file.txt") == os.path.join(workspace.root, "new", "file.txt")
+    assert workspace.resolve("link_inside/file.txt") == os.path.join(workspace.root, "inside", "file.txt")
+    assert workspace.resolve("..file.txt") == os.path.join(workspace.root, "..file.txt")
+
+    assert workspace.resolve("../secret.txt") is None
+    assert workspace.resolve("escape.txt") is None
+    assert workspace.resolve("escape_dir/secret.txt") is None
+    assert workspace.resolve("/etc/passwd") is None
+
+
+def test_resolutions_are_memoized_until_invalidated(workspace):
+    assert workspace.resolve("later") == os.path.join(workspace.root, "later")
+    os.symlink("/etc", os.path.join(workspace.root, "later"))
+    assert workspace.resolve("later") == os.path.join(workspace.root, "later")
+    assert workspace.resolve("later", fresh=True) is None
+    assert workspace.resolve("later") is None
+
+    workspace.invalidate()
+    assert workspace.resolve("later") is None
+
+
+def test_workspace_paths_follow_the_workspace_dir(tmpdir):
+    first, second = str(tmpdir.mkdir("first")), str(tmpdir.mkdir("second"))
+    link = str(tmpdir.join("current"))
+    os.symlink(first, link)
+    assert workspace_paths(link).root == first
+    assert workspace_paths(first) is workspace_paths(link)
+
+    os.unlink(link)
+    os.symlink(second, link)
+    assert workspace_paths(link).root == second
+
+
+def test_open(workspace):
+    for path in ["inside/file.txt", "link_inside/file.txt"]:
+        with os.fdopen(workspace.open(path)) as f:
+            assert f.read() == "inside"
+
+    for path in ["../secret.txt", "escape.txt", "escape_dir/secret.txt"]:
+        with pytest.raises(PermissionError):
+            workspace.open(path)
+    with pytest.raises(FileNotFoundError):
+        workspace.open("inside/missing.txt")
+
+
+def test_restrict_path(tmpdir):
+    workspace_dir = str(tmpdir.mkdir("workspace_dir"))
+    assert restrict_path(os.path.join(workspace_dir, "a.txt"), workspace_dir).endswith("workspace_dir/a.txt")
+    assert restrict_path(os.path.join(workspace_dir, "..", "a.txt"), workspace_dir) is None
+
+
+def test_atomic_write_chunks(tmpdir):
+    path = str(tmpdir.join("file.txt"))
+    atomic_write(path, "text")
+    atomic_write(path, iter([b"ch", b"unks"]))
+    with open(path) as f:
+        assert f.read() == "chunks"
+    assert os.listdir(tmpdir).count("file.txt") == 1
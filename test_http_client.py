@@ -0,0 +1,59 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from http_client import aclose_http_clients, close_http_clients, get_async_session, get_session
+
+
+@pytest.fixture
+def keepalive_server():
+    client_ports = set()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            client_ports.add(self.client_address[1])
+            body = b"ok"
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}", client_ports
+    server.shutdown()
+    server.server_close()
+    close_http_clients()
+
+
+def test_sync_session_reuses_connections(keepalive_server):
+    url, client_ports = keepalive_server
+    assert get_session() is get_session()
+
+    for _ in range(5):
+        assert get_session().get(url).text == "ok"
+
+    assert len(client_ports) == 1
+
+
+@pytest.mark.asyncio
+async def test_async_session_reuses_connections(keepalive_server):
+    url, client_ports = keepalive_server
+    assert get_async_session() is get_async_session()
+
+    for _ in range(5):
+        async with get_async_session().get(url) as response:
+            assert await response.text() == "ok"
+
+    assert len(client_ports) == 1
+    await aclose_http_clients()
+    assert get_async_session() is not None
+    await aclose_http_clients()
@@ -0,0 +1,60 @@
+import pytest
+
+from http_streaming import TextReader, UnsupportedContentType, aread_text, check_content_type, read_text
+
+
+def test_read_text_stops_at_max_chars():
+    consumed = []
+
+    def chunks():
+        for _ in range(100):
+            consumed.append(1)
+            yield b"a" * 100
+
+    assert read_text(chunks(), TextReader(max_chars=250)) == "a" * 250
+    assert len(consumed) == 3
+
+
+def test_read_text_max_bytes():
+    reader = TextReader(max_bytes=150)
+    assert read_text([b"a" * 100, b"b" * 100], reader) == "a" * 100 + "b" * 50
+    assert reader.truncated
+
+
+def test_read_text_body_of_exactly_max_bytes():
+    reader = TextReader(max_bytes=200)
+    assert read_text([b"a" * 100, b"b" * 100], reader) == "a" * 100 + "b" * 100
+    assert not reader.truncated
+
+    reader = TextReader(max_bytes=200)
+    assert read_text([b"a" * 100, b"b" * 100, b"c"], reader) == "a" * 100 + "b" * 100
+    assert reader.truncated
+
+
+def test_read_text_multibyte_split_across_chunks():
+    data = "héllo wörld".encode("utf-8")
+    chunks = [data[i : i + 1] for i in range(len(data))]
+    assert read_text(chunks, TextReader("text/html; charset=utf-8")) == "héllo wörld"
+
+
+def test_read_text_meta_charset():
+    data = '<html><head><meta charset="iso-8859-1"></head><body>café</body></html>'.encode("iso-8859-1")
+    assert "café" in read_text([data], TextReader("text/html"))
+
+
+def test_check_content_type():
+    check_content_type("text/html; charset=utf-8")
+    check_content_type("application/json")
+    check_content_type("application/rss+xml")
+    check_content_type(None)
+    with pytest.raises(UnsupportedContentType):
+        check_content_type("application/pdf")
+
+
+@pytest.mark.asyncio
+async def test_aread_text():
+    async def chunks():
+        for _ in range(10):
+            yield b"abc"
+
+    assert await aread_text(chunks(), TextReader(max_chars=4)) == "abca"
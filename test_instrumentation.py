@@ -0,0 +1,144 @@
+import logging
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+
+from instrumentation import (
+    CallRecord,
+    InMemorySink,
+    LoggingSink,
+    OpenTelemetrySink,
+    add_sink,
+    clear_sinks,
+    count,
+    current_record,
+    phase,
+    record_call,
+)
+from llm_cache import configure_llm_cache
+from wikipedia_summarize import WikipediaPack
+from write_python_code.write_python_file import WritePythonCode
+
+
+@pytest.fixture
+def sink():
+    sink = add_sink(InMemorySink())
+    yield sink
+    clear_sinks()
+
+
+def mock_page(title: str, auto_suggest: bool = True):
+    return SimpleNamespace(title=title, summary="Page content")
+
+
+def test_disabled_records_nothing():
+    with record_call("pack") as record:
+        with phase("fetch"):
+            count("bytes_received", 10)
+        assert record is None
+        assert current_record() is None
+
+
+def test_records_phases_and_counters(sink):
+    pack = WritePythonCode(workspace_path="workspace")
+    pack.run(file_name="module.py", code="x = 1")
+    pack.run(file_name="broken.py", code="x = = 1")
+
+    totals = sink.totals["write_python_code"]
+    assert totals.calls == 2
+    assert set(totals.phases) == {"compile", "write"}
+    assert totals.counters["bytes_written"] == 5
+    assert "write_python_code: 2 calls" in sink.summary()
+
+
+@pytest.mark.asyncio
+async def test_records_work_in_threads_and_llm_calls(sink):
+    async def mock_llm(text_in: str):
+        return "answer"
+
+    pack = WikipediaPack(allm=mock_llm)
+    configure_llm_cache()
+    try:
+        with patch("wikipedia.search", return_value=["Instrumented A", "Instrumented B"]), patch(
+            "wikipedia.page", side_effect=mock_page
+        ):
+            await pack.arun(query="instrumented pages", question="asdf")
+            await pack.arun(query="instrumented pages", question="asdf")
+    finally:
+        configure_llm_cache(enabled=False)
+
+    totals = sink.totals["wikipedia"]
+    assert totals.calls == 2
+    assert {"search", "fetch", "llm"} <= set(totals.phases)
+    assert totals.counters["llm_calls"] == 1
+    assert totals.counters["llm_cache_hits"] == 1
+    assert totals.counters["wikipedia_page_cache_misses"] == 2
+    assert totals.counters["wikipedia_page_cache_hits"] == 2
+    assert totals.counters["llm_prompt_chars"] > 0
+
+
+def test_nested_calls_fold_into_outer_call(sink):
+    with record_call("outer"):
+        with record_call("inner"):
+            count("items")
+
+    assert list(sink.totals) == ["outer"]
+    assert sink.totals["outer"].counters == {"items": 1}
+
+
+def test_errors_are_recorded(sink):
+    with pytest.raises(ValueError):
+        with record_call("failing"):
+            raise ValueError("boom")
+
+    assert sink.totals["failing"].errors == 1
+
+
+def test_failing_sink_does_not_break_calls(sink):
+    class BrokenSink:
+        def emit(self, record):
+            raise RuntimeError("sink is down")
+
+    add_sink(BrokenSink())
+    with record_call("pack"):
+        pass
+
+    assert sink.totals["pack"].calls == 1
+
+
+def test_logging_sink(caplog):
+    add_sink(LoggingSink())
+    try:
+        with caplog.at_level(logging.INFO, logger="instrumentation"):
+            with record_call("pack"):
+                with phase("fetch"):
+                    count("bytes_received", 1234)
+    finally:
+        clear_sinks()
+
+    assert "pack took" in caplog.text
+    assert "fetch=" in caplog.text
+    assert "bytes_received=1234" in caplog.text
+
+
+def test_open_telemetry_sink():
+    spans = []
+
+    class Span:
+        def __init__(self, name, start_time, attributes):
+            spans.append(self)
+            self.name, self.start_time, self.attributes = name, start_time, attributes
+
+        def end(self, end_time):
+            self.end_time = end_time
+
+    tracer = SimpleNamespace(start_span=Span)
+    record = CallRecord(pack="pack", started=100.0, duration=0.5, phases={"fetch": 0.25}, counters={"llm_calls": 2})
+    OpenTelemetrySink(tracer).emit(record)
+
+    span = spans[0]
+    assert span.name == "pack pack"
+    assert span.end_time - span.start_time == 500_000_000
+    assert span.attributes["autopack.phase.fetch_ms"] == 250
+    assert span.attributes["autopack.llm_calls"] == 2
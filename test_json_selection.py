@@ -0,0 +1,36 @@
+import pytest
+
+from json_selection import JsonPathError, select
+
+DOCUMENT = {
+    "items": [
+        {"id": 1, "name": "first", "links": {"url": "https://a.example"}},
+        {"id": 2, "name": "second", "links": {"url": "https://b.example"}},
+        {"id": 3, "name": "third"},
+    ],
+    "a key": {"nested": True},
+    "url": "https://root.example",
+}
+
+
+def test_select_single_values():
+    assert select(DOCUMENT, "$") is DOCUMENT
+    assert select(DOCUMENT, "$.items[0].name") == "first"
+    assert select(DOCUMENT, "items[-1].id") == 3
+    assert select(DOCUMENT, "$['a key'].nested") is True
+    assert select(DOCUMENT, '$["a key"]["nested"]') is True
+
+
+def test_select_lists():
+    assert select(DOCUMENT, "$.items[*].id") == [1, 2, 3]
+    assert select(DOCUMENT, "$.items[1:].name") == ["second", "third"]
+    assert select(DOCUMENT, "$..url") == ["https://root.example", "https://a.example", "https://b.example"]
+    assert select(DOCUMENT, "$.items[*].links.url") == ["https://a.example", "https://b.example"]
+    assert select(DOCUMENT, "$.missing[*]") == []
+
+
+def test_select_errors():
+    with pytest.raises(JsonPathError, match="Nothing in the response matches"):
+        select(DOCUMENT, "$.items[5]")
+    with pytest.raises(JsonPathError, match="Invalid JSON path"):
+        select(DOCUMENT, "$.items[")
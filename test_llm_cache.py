@@ -0,0 +1,98 @@
+import functools
+
+import pytest
+
+from llm_cache import LLMCache, configure_llm_cache, get_llm_cache, model_identity
+
+
+def test_llm_cache_hits_same_prompt():
+    calls = []
+
+    def llm(prompt: str) -> str:
+        calls.append(prompt)
+        return prompt.upper()
+
+    cache = LLMCache()
+    assert cache.call("hello", llm) == "HELLO"
+    assert cache.call("hello", llm) == "HELLO"
+    assert cache.call("other", llm) == "OTHER"
+    assert calls == ["hello", "other"]
+    assert cache.stats.hits == 1
+
+
+def test_llm_cache_separates_models():
+    def llm_a(prompt: str) -> str:
+        return "a"
+
+    def llm_b(prompt: str) -> str:
+        return "b"
+
+    cache = LLMCache()
+    assert cache.call("hello", llm_a) == "a"
+    assert cache.call("hello", llm_b) == "b"
+    assert model_identity(llm_a) != model_identity(llm_b)
+
+
+def ask(prompt: str, model: str = "small", temperature: float = 0) -> str:
+    return f"{model} at {temperature}: {prompt}"
+
+
+def llm_for(model: str):
+    def llm(prompt: str) -> str:
+        return ask(prompt, model)
+
+    return llm
+
+
+def test_model_identity_of_partials_and_closures():
+    assert model_identity(functools.partial(ask, model="small")) != model_identity(
+        functools.partial(ask, model="large")
+    )
+    assert model_identity(functools.partial(ask, temperature=0)) != model_identity(
+        functools.partial(ask, temperature=1)
+    )
+    assert model_identity(functools.partial(ask, model="small")) == model_identity(
+        functools.partial(ask, model="small")
+    )
+    assert model_identity(llm_for("small")) != model_identity(llm_for("large"))
+    assert model_identity(llm_for("small")) == model_identity(llm_for("small"))
+
+    cache = LLMCache()
+    assert cache.call("hello", llm_for("small")) == "small at 0: hello"
+    assert cache.call("hello", llm_for("large")) == "large at 0: hello"
+
+
+def test_llm_cache_is_opt_in():
+    assert not get_llm_cache().enabled
+    assert configure_llm_cache().enabled
+    configure_llm_cache(enabled=False)
+
+
+def test_llm_cache_disabled():
+    count = 0
+
+    def llm(prompt: str) -> str:
+        nonlocal count
+        count += 1
+        return prompt
+
+    cache = LLMCache(enabled=False)
+    cache.call("hello", llm)
+    cache.call("hello", llm)
+    assert count == 2
+
+
+@pytest.mark.asyncio
+async def test_llm_cache_persists_to_sqlite(tmpdir):
+    count = 0
+
+    async def allm(prompt: str) -> str:
+        nonlocal count
+        count += 1
+        return prompt.upper()
+
+    path = str(tmpdir.join("llm.sqlite"))
+    assert await configure_llm_cache(path=path).acall("hello", allm) == "HELLO"
+    assert await configure_llm_cache(path=path).acall("hello", allm) == "HELLO"
+    assert count == 1
+    configure_llm_cache(enabled=False)
@@ -0,0 +1,135 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import page_fetching
+from page_fetching import afetch_page, fetch_page, forget_domains, needs_rendering, remembers_rendering
+
+ARTICLE = "<html><body><h1>Static</h1>" + "<p>A paragraph of server rendered text.</p>" * 20 + "</body></html>"
+APP_SHELL = '<html><body><div id="root"></div><script src="/bundle.js"></script></body></html>'
+RENDERED = "<html><body><h1>Rendered</h1><p>Content added by JavaScript</p></body></html>"
+
+
+def test_needs_rendering():
+    assert not needs_rendering(ARTICLE)
+    assert needs_rendering(APP_SHELL)
+    assert needs_rendering("<html><body><noscript>Please enable JavaScript to continue.</noscript></body></html>")
+    # Little text, but nothing that could add more
+    assert not needs_rendering("<html><body><p>Short</p></body></html>")
+    assert needs_rendering("<html><body><p>Loading...</p><script>load()</script></body></html>")
+
+    script = "<script>" + "var x = 1;" * 10_000 + "</script>"
+    assert needs_rendering(f"<html><body>{'<p>Some text here</p>' * 20}{script}</body></html>")
+    assert not needs_rendering(f"<html><body>{'<p>Some text here</p>' * 20}<script>track()</script></body></html>")
+
+    # Only part of the page was read, so only an outright marker counts
+    assert not needs_rendering("<html><head><script>load()</script></head><body><p>The start", complete=False)
+    assert needs_rendering(APP_SHELL[:60], complete=False)
+
+
+@pytest.fixture
+def local_server():
+    requests_seen = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests_seen.append(self.path)
+            status = {"/blocked": 403, "/overloaded": 503}.get(self.path, 200)
+            body = APP_SHELL if self.path.startswith("/app") else ARTICLE
+            self.send_response(status)
+            if self.path == "/overloaded":
+                self.send_header("Retry-After", "0")
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body.encode())
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.requests_seen = requests_seen
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.base_url = f"http://127.0.0.1:{server.server_port}"
+    forget_domains()
+    yield server
+    forget_domains()
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def fake_browser(monkeypatch):
+    rendered = []
+
+    def fetch_html(self, url):
+        rendered.append(url)
+        return RENDERED
+
+    async def afetch_html(self, url):
+        return fetch_html(self, url)
+
+    monkeypatch.setattr("browser_pool.BrowserPool.fetch_html", fetch_html)
+    monkeypatch.setattr("browser_pool.BrowserPool.afetch_html", afetch_html)
+    return rendered
+
+
+def test_fetch_page_static_over_http(local_server, fake_browser):
+    page = fetch_page(f"{local_server.base_url}/article")
+    assert not page.rendered
+    assert page.html == ARTICLE
+    assert fake_browser == []
+
+
+def test_fetch_page_escalates_and_remembers_domain(local_server, fake_browser):
+    page = fetch_page(f"{local_server.base_url}/app")
+    assert page.rendered
+    assert page.html == RENDERED
+    assert remembers_rendering(local_server.base_url)
+
+    # The next page from the same domain goes straight to the browser
+    fetch_page(f"{local_server.base_url}/app/other")
+    assert local_server.requests_seen == ["/app"]
+    assert fake_browser == [f"{local_server.base_url}/app", f"{local_server.base_url}/app/other"]
+
+
+def test_fetch_page_escalates_blocked(local_server, fake_browser):
+    assert fetch_page(f"{local_server.base_url}/blocked").rendered
+    # Remembered, but only for a short while
+    assert remembers_rendering(local_server.base_url)
+    assert page_fetching._rendered_domains.get("127.0.0.1") is None
+
+
+def test_fetch_page_does_not_escalate_overloaded(local_server, fake_browser):
+    page = fetch_page(f"{local_server.base_url}/overloaded")
+    assert not page.rendered
+    assert fake_browser == []
+    assert not remembers_rendering(local_server.base_url)
+
+
+def test_fetch_page_without_rendering(local_server, fake_browser):
+    page = fetch_page(f"{local_server.base_url}/app", render=False)
+    assert page.html == APP_SHELL
+    assert fake_browser == []
+
+
+def test_fetch_page_falls_back_when_browser_fails(local_server, monkeypatch):
+    def fetch_html(self, url):
+        raise RuntimeError("Executable doesn't exist")
+
+    monkeypatch.setattr("browser_pool.BrowserPool.fetch_html", fetch_html)
+    page = fetch_page(f"{local_server.base_url}/app")
+    assert not page.rendered
+    assert page.html == APP_SHELL
+    assert not remembers_rendering(local_server.base_url)
+
+
+@pytest.mark.asyncio
+async def test_afetch_page(local_server, fake_browser):
+    assert not (await afetch_page(f"{local_server.base_url}/article")).rendered
+    page = await afetch_page(f"{local_server.base_url}/app")
+    assert page.rendered
+    assert page.html == RENDERED
+    assert fake_browser == [f"{local_server.base_url}/app"]
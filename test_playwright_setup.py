@@ -0,0 +1,42 @@
+from unittest.mock import patch
+
+import pytest
+
+import playwright_setup
+
+
+@pytest.fixture
+def browsers_dir(tmpdir, monkeypatch):
+    monkeypatch.setenv("PLAYWRIGHT_BROWSERS_PATH", str(tmpdir.join("browsers")))
+    return playwright_setup.browsers_path()
+
+
+def test_browsers_not_installed(browsers_dir):
+    assert not playwright_setup.browsers_installed()
+    assert not playwright_setup.marker_file().exists()
+
+
+def test_browsers_installed_writes_marker(browsers_dir):
+    for path in playwright_setup.expected_browser_dirs():
+        path.mkdir(parents=True)
+
+    assert playwright_setup.browsers_installed()
+    assert playwright_setup.marker_file().exists()
+
+
+def test_install_skipped_when_marker_present(browsers_dir):
+    browsers_dir.mkdir(parents=True)
+    playwright_setup.marker_file().touch()
+
+    with patch("subprocess.run") as mock_run:
+        assert playwright_setup.install_browsers()
+        mock_run.assert_not_called()
+
+
+def test_install_runs_once(browsers_dir):
+    with patch("subprocess.run") as mock_run:
+        mock_run.return_value.returncode = 0
+        assert playwright_setup.install_browsers()
+        assert playwright_setup.install_browsers()
+
+    assert mock_run.call_count == 1
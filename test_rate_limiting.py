@@ -0,0 +1,226 @@
+import asyncio
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+
+import pytest
+
+import rate_limiting
+from rate_limiting import HostLimits, RateLimiter, RequestScheduler, host_of, retry_after_seconds
+
+
+def test_burst_is_not_delayed():
+    limiter = RateLimiter(1, burst=3)
+    start = time.monotonic()
+    for _ in range(3):
+        limiter.acquire()
+    assert time.monotonic() - start < 0.1
+
+
+def test_calls_beyond_the_burst_wait():
+    limiter = RateLimiter(20, burst=1)
+    start = time.monotonic()
+    for _ in range(5):
+        limiter.acquire()
+    # The first call uses the burst, the other four wait 1/20s each
+    assert time.monotonic() - start >= 0.19
+
+
+@pytest.mark.asyncio
+async def test_async_callers_are_spaced_out():
+    limiter = RateLimiter(20, burst=1)
+    start = time.monotonic()
+    await asyncio.gather(*(limiter.aacquire() for _ in range(5)))
+    assert time.monotonic() - start >= 0.19
+
+
+def test_zero_rate_disables_limiting():
+    limiter = RateLimiter(0)
+    start = time.monotonic()
+    for _ in range(100):
+        limiter.acquire()
+    assert time.monotonic() - start < 0.1
+
+
+def test_invalid_arguments():
+    with pytest.raises(ValueError):
+        RateLimiter(-1)
+    with pytest.raises(ValueError):
+        RateLimiter(1, burst=0)
+
+
+def _peak_concurrency(scheduler: RequestScheduler, urls: list[str]) -> tuple[dict[str, int], int]:
+    """Request every URL at once from threads, returning the most requests in flight per host and overall."""
+    lock = threading.Lock()
+    active, peak = Counter(), Counter()
+
+    def request(url: str):
+        host = host_of(url)
+        with scheduler.slot(url):
+            with lock:
+                active[host] += 1
+                peak[host] = max(peak[host], active[host])
+                peak["*"] = max(peak["*"], sum(active.values()))
+            time.sleep(0.05)
+            with lock:
+                active[host] -= 1
+
+    with ThreadPoolExecutor(max_workers=len(urls)) as executor:
+        list(executor.map(request, urls))
+    overall = peak.pop("*")
+    return dict(peak), overall
+
+
+def test_host_of():
+    assert host_of("https://Example.com:8080/path?q=1") == "example.com"
+    assert host_of("example.com") == "example.com"
+
+
+def test_retry_after_seconds():
+    assert retry_after_seconds("120") == 120
+    assert retry_after_seconds(formatdate(time.time() + 30, usegmt=True)) == pytest.approx(30, abs=1)
+    assert retry_after_seconds(formatdate(time.time() - 30, usegmt=True)) == 0
+    assert retry_after_seconds("soon") is None
+    assert retry_after_seconds(None) is None
+
+
+def test_scheduler_caps_concurrency_per_host():
+    scheduler = RequestScheduler(default_limits=HostLimits(max_concurrency=2))
+    urls = [f"http://a.example/{i}" for i in range(6)] + [f"http://b.example/{i}" for i in range(6)]
+    assert _peak_concurrency(scheduler, urls) == ({"a.example": 2, "b.example": 2}, 4)
+    assert scheduler.active == 0
+    assert scheduler.stats()["a.example"].peak_queued >= 3
+
+
+def test_scheduler_caps_concurrency_overall():
+    scheduler = RequestScheduler(max_concurrency=3, default_limits=HostLimits())
+    peak, overall = _peak_concurrency(scheduler, [f"http://host{i}.example/" for i in range(9)])
+    assert len(peak) == 9
+    assert overall == 3
+    assert scheduler.active == 0
+
+
+def test_scheduler_spaces_out_requests_per_host():
+    scheduler = RequestScheduler(default_limits=HostLimits(rate=20, burst=1))
+    start = time.monotonic()
+    for _ in range(5):
+        with scheduler.slot("http://a.example/"):
+            pass
+    # Another host has its own bucket
+    with scheduler.slot("http://b.example/"):
+        pass
+    assert 0.19 <= time.monotonic() - start < 0.5
+
+
+def test_scheduler_backs_off_as_asked():
+    scheduler = RequestScheduler(default_limits=HostLimits())
+    scheduler.note_response("http://a.example/", 429, "0.2")
+    assert scheduler.stats()["a.example"].throttled_for == pytest.approx(0.2, abs=0.05)
+
+    start = time.monotonic()
+    with scheduler.slot("http://b.example/"):
+        pass
+    assert time.monotonic() - start < 0.1
+    with scheduler.slot("http://a.example/"):
+        pass
+    assert time.monotonic() - start >= 0.19
+
+
+def test_scheduler_set_limits():
+    scheduler = RequestScheduler()
+    assert scheduler.limits("http://a.example/") == scheduler.default_limits
+
+    scheduler.set_limits("a.example", HostLimits(rate=1))
+    scheduler.set_limits("http://a.example/", HostLimits(rate=2), overwrite=False)
+    assert scheduler.limits("http://a.example/path") == HostLimits(rate=1)
+    scheduler.set_limits("http://a.example/", HostLimits(rate=2))
+    assert scheduler.limits("a.example") == HostLimits(rate=2)
+
+
+def test_scheduler_throttled_host_holds_no_slot():
+    scheduler = RequestScheduler(max_concurrency=1, default_limits=HostLimits())
+    scheduler.backoff("http://a.example/", 0.3)
+    finished = {}
+
+    def request(url: str):
+        with scheduler.slot(url):
+            finished[host_of(url)] = time.monotonic()
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        executor.submit(request, "http://a.example/")
+        time.sleep(0.02)
+        executor.submit(request, "http://b.example/")
+
+    assert finished["b.example"] - start < 0.1
+    assert finished["a.example"] - start >= 0.29
+
+
+def test_scheduler_backoff_grows_without_retry_after(monkeypatch):
+    monkeypatch.setattr("rate_limiting.BACKOFF_BASE", 10)
+    scheduler = RequestScheduler()
+    scheduler.note_response("http://a.example/", 503)
+    scheduler.note_response("http://a.example/", 503)
+    assert scheduler.stats()["a.example"].throttled_for == pytest.approx(20, abs=0.5)
+    assert scheduler.stats()["a.example"].backoffs == 2
+
+    # A successful response starts the next backoff from the beginning again
+    scheduler.note_response("http://a.example/", 200)
+    scheduler.note_response("http://a.example/", 503, "1000")
+    assert scheduler.stats()["a.example"].throttled_for == pytest.approx(rate_limiting.MAX_BACKOFF, abs=0.5)
+
+
+@pytest.mark.asyncio
+async def test_scheduler_async_and_threads_share_caps():
+    scheduler = RequestScheduler(default_limits=HostLimits(max_concurrency=2))
+    active, peak = 0, 0
+    lock = threading.Lock()
+
+    def enter():
+        nonlocal active, peak
+        with lock:
+            active += 1
+            peak = max(peak, active)
+
+    def leave():
+        nonlocal active
+        with lock:
+            active -= 1
+
+    async def arequest():
+        async with scheduler.aslot("http://a.example/"):
+            enter()
+            await asyncio.sleep(0.05)
+            leave()
+
+    def request():
+        with scheduler.slot("http://a.example/"):
+            enter()
+            time.sleep(0.05)
+            leave()
+
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        threads = [loop.run_in_executor(executor, request) for _ in range(4)]
+        await asyncio.gather(*(arequest() for _ in range(4)), *threads)
+    assert peak == 2
+    assert scheduler.active == 0
+
+
+@pytest.mark.asyncio
+async def test_scheduler_cancelled_waiter_leaves_queue():
+    scheduler = RequestScheduler(default_limits=HostLimits(max_concurrency=1))
+    async with scheduler.aslot("http://a.example/"):
+        waiting = asyncio.ensure_future(scheduler.aslot("http://a.example/").__aenter__())
+        await asyncio.sleep(0.01)
+        assert scheduler.queued == 1
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert scheduler.queued == 0
+
+    async with scheduler.aslot("http://a.example/"):
+        assert scheduler.active == 1
+    assert scheduler.active == 0
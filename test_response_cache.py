@@ -0,0 +1,182 @@
+import multiprocessing
+import os
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from page_fetching import afetch_page, fetch_page
+from response_cache import ResponseCache, configure_response_cache, freshness_lifetime
+
+PAGE = "<html><body>" + "<p>A cached paragraph.</p>" * 100 + "</body></html>"
+
+
+def test_freshness_lifetime():
+    now = time.time()
+    assert freshness_lifetime({"cache-control": "public, max-age=60"}) == 60
+    assert freshness_lifetime({"cache-control": "max-age=60", "age": "15"}) == 45
+    assert freshness_lifetime({"cache-control": "no-store, max-age=60"}) is None
+    assert freshness_lifetime({"cache-control": "no-cache"}) == 0
+    assert freshness_lifetime({"date": formatdate(now), "expires": formatdate(now + 120)}) == pytest.approx(120, abs=1)
+    assert freshness_lifetime({"expires": "0"}) == 0
+    # Heuristic freshness: a tenth of the time since the last modification
+    assert freshness_lifetime({"date": formatdate(now), "last-modified": formatdate(now - 1000)}) == pytest.approx(
+        100, abs=1
+    )
+    assert freshness_lifetime({}) == 0
+
+
+def test_response_cache_roundtrip(tmpdir):
+    cache = ResponseCache(str(tmpdir / "responses.db"))
+    stored = cache.store(
+        "https://example.com/", None, 200, {"Content-Type": "text/html", "Cache-Control": "max-age=60"}, PAGE.encode()
+    )
+    assert stored.is_fresh()
+
+    cached = cache.lookup("https://example.com/")
+    assert cached.body == PAGE.encode()
+    assert cached.content_type == "text/html"
+    assert cached.is_fresh()
+    # Different request headers are a different response
+    assert cache.lookup("https://example.com/", {"Accept": "application/json"}) is None
+
+
+def test_response_cache_only_stores_what_it_may(tmpdir):
+    cache = ResponseCache(str(tmpdir / "responses.db"))
+    assert cache.store("https://example.com/a", None, 200, {"Cache-Control": "no-store"}, b"a") is None
+    assert cache.store("https://example.com/b", None, 404, {"Cache-Control": "max-age=60"}, b"b") is None
+    # Neither fresh nor revalidatable
+    assert cache.store("https://example.com/c", None, 200, {}, b"c") is None
+    # Depends on request headers that aren't part of the key
+    assert (
+        cache.store("https://example.com/e", None, 200, {"Cache-Control": "max-age=60", "Vary": "Cookie"}, b"e") is None
+    )
+    assert cache.store("https://example.com/f", None, 200, {"Cache-Control": "max-age=60", "Vary": "*"}, b"f") is None
+    # Stale, but can be revalidated
+    assert cache.store("https://example.com/d", None, 200, {"ETag": '"v1"'}, b"d").validators() == {
+        "If-None-Match": '"v1"'
+    }
+    assert cache.store("https://example.com/g", None, 200, {"ETag": '"v1"', "Vary": "Accept-Encoding"}, b"g")
+    assert len(cache) == 2
+
+
+def test_response_cache_hits_update_access_time_rarely(tmpdir):
+    cache = ResponseCache(str(tmpdir / "responses.db"))
+    cache.store("https://example.com/", None, 200, {"Cache-Control": "max-age=60"}, b"body")
+    updates = []
+    cache._connection.set_trace_callback(lambda statement: statement.startswith("UPDATE") and updates.append(statement))
+
+    for _ in range(10):
+        assert cache.lookup("https://example.com/").body == b"body"
+    assert updates == []
+
+
+def test_response_cache_evicts_least_recently_used(tmpdir, monkeypatch):
+    monkeypatch.setattr("response_cache.ACCESS_UPDATE_INTERVAL", 0)
+    # Random bytes don't compress, so each body takes its full size
+    body = os.urandom(10_000)
+    cache = ResponseCache(str(tmpdir / "responses.db"), max_bytes=35_000)
+    for i in range(3):
+        cache.store(f"https://example.com/{i}", None, 200, {"Cache-Control": "max-age=60"}, body)
+        time.sleep(0.01)
+    cache.lookup("https://example.com/0")
+    cache.store("https://example.com/3", None, 200, {"Cache-Control": "max-age=60"}, body)
+
+    assert cache.lookup("https://example.com/1") is None
+    assert [cache.lookup(f"https://example.com/{i}") is not None for i in (0, 2, 3)] == [True, True, True]
+    assert cache.stats.evictions == 1
+
+
+def _store_many(path: str, worker: int):
+    cache = ResponseCache(path)
+    for i in range(50):
+        cache.store(f"https://example.com/{worker}/{i}", None, 200, {"Cache-Control": "max-age=60"}, b"x" * 1000)
+    cache.close()
+
+
+def test_response_cache_shared_between_processes(tmpdir):
+    path = str(tmpdir / "responses.db")
+    ResponseCache(path).close()
+    processes = [multiprocessing.Process(target=_store_many, args=(path, worker)) for worker in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=60)
+
+    assert [process.exitcode for process in processes] == [0, 0, 0, 0]
+    assert len(ResponseCache(path)) == 200
+
+
+@pytest.fixture
+def local_server():
+    requests_seen = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests_seen.append((self.path, self.headers.get("If-None-Match")))
+            if self.headers.get("If-None-Match") == '"v1"':
+                self.send_response(304)
+                self.send_header("Cache-Control", "max-age=60")
+                self.end_headers()
+                return
+
+            body = PAGE.encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Cache-Control", "max-age=60" if self.path == "/fresh" else "no-cache")
+            self.send_header("ETag", '"v1"')
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.requests_seen = requests_seen
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.base_url = f"http://127.0.0.1:{server.server_port}"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def response_cache(tmpdir):
+    cache = configure_response_cache(str(tmpdir / "responses.db"))
+    yield cache
+    configure_response_cache(None)
+
+
+def test_fetch_page_fresh_hit_skips_network(local_server, response_cache):
+    first = fetch_page(f"{local_server.base_url}/fresh")
+    second = fetch_page(f"{local_server.base_url}/fresh")
+    assert first.html == second.html == PAGE
+    assert local_server.requests_seen == [("/fresh", None)]
+
+
+def test_fetch_page_revalidates_stale(local_server, response_cache):
+    assert fetch_page(f"{local_server.base_url}/stale").html == PAGE
+    assert fetch_page(f"{local_server.base_url}/stale").html == PAGE
+    assert local_server.requests_seen == [("/stale", None), ("/stale", '"v1"')]
+
+    # The 304 made it fresh for another minute
+    assert fetch_page(f"{local_server.base_url}/stale").html == PAGE
+    assert len(local_server.requests_seen) == 2
+
+
+@pytest.mark.asyncio
+async def test_afetch_page_uses_cache(local_server, response_cache):
+    assert (await afetch_page(f"{local_server.base_url}/stale")).html == PAGE
+    assert (await afetch_page(f"{local_server.base_url}/stale")).html == PAGE
+    assert (await afetch_page(f"{local_server.base_url}/stale")).html == PAGE
+    assert local_server.requests_seen == [("/stale", None), ("/stale", '"v1"')]
+
+
+def test_cache_disabled_by_default(local_server):
+    fetch_page(f"{local_server.base_url}/fresh")
+    fetch_page(f"{local_server.base_url}/fresh")
+    assert len(local_server.requests_seen) == 2
@@ -0,0 +1,66 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from summarization import _filter_long_documents, afilter_long_documents, split_document
+
+
+def shortening_llm(prompt: str) -> str:
+    # Stand-in for an LLM that summarizes each chunk down to its "key details", the chunk markers
+    text = prompt.rsplit(":\n\n", 1)[-1]
+    return " ".join(word for word in text.split() if word.startswith("chunk"))
+
+
+def test_split_document_keeps_everything():
+    document = "\n\n".join(f"Paragraph {i} " + "word " * 20 for i in range(100))
+    chunks = split_document(document, chunk_size=1000)
+    assert "".join(chunks) == document
+    assert all(len(chunk) <= 1000 for chunk in chunks)
+    assert all(chunk.endswith("\n\n") for chunk in chunks[:-1])
+
+
+def test_filter_long_documents_short():
+    pack = SimpleNamespace(llm=shortening_llm, filter_threshold=500)
+    assert _filter_long_documents(pack, "short") == "short"
+
+
+def test_filter_long_documents_covers_tail():
+    document = " ".join(f"chunk{i}" + " filler" * 200 for i in range(20))
+    pack = SimpleNamespace(llm=shortening_llm, filter_threshold=5000)
+    result = _filter_long_documents(pack, document, chunk_size=1000)
+    assert result.startswith("The response was summarized as:")
+    assert "chunk0" in result
+    assert "chunk19" in result
+
+
+@pytest.mark.asyncio
+async def test_afilter_long_documents_bounded_concurrency():
+    running = 0
+    peak = 0
+
+    async def allm(prompt: str) -> str:
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return shortening_llm(prompt)
+
+    document = " ".join(f"chunk{i}" + " filler" * 200 for i in range(20))
+    pack = SimpleNamespace(filter_threshold=5000)
+    result = await afilter_long_documents(pack, document, None, allm, chunk_size=1000, max_concurrency=3)
+    assert "chunk0" in result
+    assert "chunk19" in result
+    assert peak == 3
+
+
+@pytest.mark.asyncio
+async def test_afilter_long_documents_reduces_to_threshold():
+    async def allm(prompt: str) -> str:
+        return prompt.rsplit(":\n\n", 1)[-1][:300]
+
+    document = "word " * 10_000
+    pack = SimpleNamespace(filter_threshold=400)
+    result = await afilter_long_documents(pack, document, None, allm, chunk_size=1000)
+    assert len(result) <= len("The response was summarized as: ") + 400
@@ -0,0 +1,43 @@
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import psutil
+
+import system_info
+from disk_usage import DiskUsage
+from os_info.os_info import OSInfo
+
+
+def test_readings_are_cached():
+    system_info.clear_cache()
+    # Collected once per process
+    system_info.static_info()
+    with patch("psutil.disk_usage", wraps=psutil.disk_usage) as disk_usage, patch(
+        "psutil.virtual_memory", wraps=psutil.virtual_memory
+    ) as virtual_memory:
+        for _ in range(5):
+            OSInfo().run()
+            DiskUsage().run()
+
+    assert disk_usage.call_count == 1
+    assert virtual_memory.call_count == 1
+
+
+def test_disk_usage_percent():
+    system_info.clear_cache()
+    usage = SimpleNamespace(total=100 * 1024**3, used=50 * 1024**3, free=50 * 1024**3, percent=50.0)
+    with patch("psutil.disk_usage", return_value=usage):
+        response = DiskUsage().run()
+
+    assert response.endswith(": Total: 100.0 GB. Used: 50.0 GB. Available: 50.0 GB. Percent Used: 50.0%")
+    assert "(workspace)" in response
+    system_info.clear_cache()
+
+
+def test_snapshot_of_all_partitions():
+    snapshot = system_info.snapshot()
+
+    assert snapshot.disks
+    assert len({disk.mountpoint for disk in snapshot.disks}) == len(snapshot.disks)
+    assert snapshot.static.logical_cpus >= 1
+    assert 0 < snapshot.memory.available <= snapshot.memory.total
@@ -0,0 +1,79 @@
+from pathlib import Path
+
+import pytest
+
+import text_extraction
+from text_extraction import estimate_tokens, extract_text, looks_like_html
+
+FIXTURES_DIR = Path(__file__).parent / "benchmarks" / "fixtures"
+
+PARSERS = ["html.parser"]
+if text_extraction.PARSER == "lxml":
+    PARSERS.append("lxml")
+
+
+@pytest.fixture(params=PARSERS)
+def parser(request, monkeypatch):
+    monkeypatch.setattr(text_extraction, "PARSER", request.param)
+    return request.param
+
+
+def fixture(name: str) -> str:
+    return (FIXTURES_DIR / f"{name}.html").read_text(encoding="iso-8859-1")
+
+
+def test_extract_text_strips_boilerplate(parser):
+    text = extract_text(fixture("news_article"))
+    assert text.startswith("City council approves riverside housing plan")
+    assert "Concerns over flooding" in text
+    assert "independent review before construction begins" in text
+    for noise in ["gtag", "Skip to content", "Accept all", "Advertisement", "Share on Twitter", "Privacy policy"]:
+        assert noise not in text
+
+
+def test_extract_text_keeps_code_and_tables(parser):
+    text = extract_text(fixture("docs_page"))
+    assert 'session = Session(retry=Retry(attempts=3, backoff=0.5))\nresponse = session.get("' in text
+    assert "max_backoff | 60.0 | The longest the client will ever wait between two attempts." in text
+    assert "Quickstart" not in text
+
+
+def test_extract_text_token_budget(parser):
+    paragraphs = "".join(f"<p>Paragraph {i:04} has some words in it.</p>" for i in range(1000))
+    html = f"<html><body><h1>Title</h1>{paragraphs}<p>The longest paragraph, which {'is very ' * 10}long.</p></body></html>"
+    lines = extract_text(html, max_tokens=100).split("\n")
+
+    assert estimate_tokens("\n".join(lines)) <= 100
+    assert lines[0] == "Title"
+    assert lines[1] == "Paragraph 0000 has some words in it."
+    assert lines[-1].startswith("The longest paragraph")
+
+
+def test_extract_text_truncates_one_huge_block(parser):
+    sentences = " ".join(f"Sentence {i} of the only block on the page." for i in range(1500))
+    text = extract_text(f"<html><body><div>{sentences}</div></body></html>", max_tokens=100)
+
+    assert text.startswith("Sentence 0 of the only block on the page.")
+    assert 0 < estimate_tokens(text) <= 100
+
+
+def test_extract_text_keeps_main_content_in_boilerplate_wrapper(parser):
+    article = "<article><header><h1>The headline</h1></header><p>The story itself, in a few words.</p></article>"
+    html = f'<html><body><div class="layout has-sidebar">{article}<div class="sidebar">Links to elsewhere here</div>'
+    text = extract_text(html + "</div></body></html>")
+
+    assert text == "The headline\nThe story itself, in a few words."
+
+
+def test_extract_text_breaks_lines(parser):
+    html = "<html><body><div>The first line of text<br>the second line of text<hr>the third line</div></body></html>"
+    assert extract_text(html) == "The first line of text the second line of text the third line"
+
+
+def test_extract_text_empty_page(parser):
+    assert extract_text("<html><head><title>x</title></head><body><script>var a;</script></body></html>") == ""
+
+
+def test_looks_like_html():
+    assert looks_like_html(fixture("docs_page"))
+    assert not looks_like_html("Just a <b>little</b> markup in plain text")
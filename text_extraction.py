@@ -0,0 +1,413 @@
+import itertools
+import re
+from dataclasses import dataclass, field, replace
+from functools import lru_cache
+from typing import Any, Iterator, Optional
+
+from bs4 import BeautifulSoup, Comment, Declaration, Doctype, NavigableString, ProcessingInstruction
+
+try:
+    import lxml.html
+
+    PARSER = "lxml"
+except ImportError:
+    PARSER = "html.parser"
+
+# Roughly 8000 characters of English text, the budget the packs used to slice to
+DEFAULT_MAX_TOKENS = 2000
+CHARS_PER_TOKEN = 4
+
+# Never part of the readable text of a page
+STRIP_TAGS = {
+    "script",
+    "style",
+    "noscript",
+    "template",
+    "svg",
+    "canvas",
+    "iframe",
+    "object",
+    "embed",
+    "nav",
+    "footer",
+    "aside",
+    "form",
+    "button",
+    "select",
+    "input",
+    "textarea",
+    "dialog",
+}
+BOILERPLATE_ROLES = ["navigation", "banner", "contentinfo", "complementary", "search", "menu", "menubar", "dialog"]
+# Elements with one of these as a whole class or id (lowercase, with _ read as -) are dropped. Parts of a name don't
+# count, so a wrapper marked "has-sidebar" isn't mistaken for the sidebar itself.
+BOILERPLATE_NAMES = {
+    "nav",
+    "navbar",
+    "navigation",
+    "menu",
+    "top-menu",
+    "main-menu",
+    "primary-nav",
+    "site-nav",
+    "breadcrumb",
+    "breadcrumbs",
+    "footer",
+    "site-footer",
+    "page-footer",
+    "header",
+    "site-header",
+    "sidebar",
+    "cookie-banner",
+    "cookie-notice",
+    "cookie-consent",
+    "consent",
+    "banner",
+    "advert",
+    "advertisement",
+    "ad",
+    "ads",
+    "ad-slot",
+    "ad-container",
+    "ads-left",
+    "ads-right",
+    "promo",
+    "share",
+    "share-tools",
+    "share-buttons",
+    "social",
+    "social-links",
+    "newsletter",
+    "newsletter-signup",
+    "subscribe",
+    "popup",
+    "modal",
+    "related",
+    "related-articles",
+    "related-posts",
+    "comments",
+    "skip-link",
+}
+BLOCK_TAGS = {
+    "p",
+    "h1",
+    "h2",
+    "h3",
+    "h4",
+    "h5",
+    "h6",
+    "li",
+    "dt",
+    "dd",
+    "pre",
+    "blockquote",
+    "caption",
+    "figcaption",
+    "div",
+    "section",
+    "article",
+    "main",
+    "body",
+    "table",
+    "ul",
+    "ol",
+    "dl",
+    "tr",
+}
+HEADING_TAGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+# Void elements that break a line of text, and the text they stand for
+BREAK_TAGS = {"br", "hr"}
+LINE_BREAK = "\n"
+# Table rows are kept together as one block, with their cells separated by CELL_SEPARATOR
+CELL_TAGS = {"td", "th"}
+CELL_SEPARATOR = " | "
+IGNORED_STRINGS = (Comment, Declaration, Doctype, ProcessingInstruction)
+# Blocks with fewer words than this are only kept if they're headings, to drop stray "Home" and "Share" links
+MIN_BLOCK_WORDS = 3
+
+WHITESPACE_RE = re.compile(r"\s+")
+
+
+@dataclass
+class Block:
+    text: str
+    tag: str
+    position: int
+    link_chars: int = 0
+    last_cell: Any = field(default=None, repr=False)
+
+    @property
+    def score(self) -> float:
+        """Favours long runs of prose over link lists. Headings are scored like a short paragraph so they survive."""
+        if self.tag in HEADING_TAGS:
+            return 200.0
+        link_density = min(self.link_chars / len(self.text), 1.0) if self.text else 1.0
+        return len(self.text) * (1.0 - link_density)
+
+
+@lru_cache(maxsize=1)
+def _token_encoding():
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+def estimate_tokens(text: str) -> int:
+    """Count tokens with tiktoken when it is installed, otherwise estimate from the length."""
+    encoding = _token_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def looks_like_html(text: str) -> bool:
+    start = text[:1024].lstrip().lower()
+    return start.startswith(("<!doctype html", "<html")) or "<body" in start
+
+
+class _SoupTree:
+    """Walks a page parsed by BeautifulSoup, which is always available."""
+
+    def __init__(self, html: str):
+        soup = BeautifulSoup(html, "html.parser")
+        self.root = soup.body or soup
+
+    def strings(self) -> Iterator[tuple[str, Any]]:
+        """Every piece of text on the page, with the element it belongs to. Line breaks are yielded as LINE_BREAK."""
+        for node in self.root.descendants:
+            if isinstance(node, NavigableString):
+                if not isinstance(node, IGNORED_STRINGS):
+                    yield node, node.parent
+            elif node.name in BREAK_TAGS:
+                yield LINE_BREAK, node
+
+    def main_content(self):
+        """The element holding the page's main content, if it marks one."""
+        articles = self.root.find_all("article", limit=2)
+        return (
+            self.root.find("main")
+            or self.root.find(attrs={"role": "main"})
+            or (articles[0] if len(articles) == 1 else None)
+        )
+
+    @staticmethod
+    def name(element) -> str:
+        return element.name
+
+    @staticmethod
+    def parent(element):
+        return element.parent
+
+    @staticmethod
+    def attribute(element, key: str) -> Optional[str]:
+        return element.get(key)
+
+    @staticmethod
+    def names(element) -> list[str]:
+        names = list(element.get("class") or [])
+        if element.get("id"):
+            names.append(element["id"])
+        return names
+
+
+class _LxmlTree:
+    """Walks a page parsed by lxml, which is several times faster than building a BeautifulSoup tree."""
+
+    def __init__(self, html: str):
+        try:
+            document = lxml.html.document_fromstring(html)
+        except ValueError:
+            # lxml refuses str input that carries an XML encoding declaration
+            document = lxml.html.document_fromstring(html.encode("utf-8"))
+        body = document.find("body")
+        self.root = body if body is not None else document
+
+    def strings(self) -> Iterator[tuple[str, Any]]:
+        for element in self.root.iter():
+            # Comments and processing instructions have a function as their tag, but their tail is page text
+            if isinstance(element.tag, str) and element.tag.lower() in BREAK_TAGS:
+                yield LINE_BREAK, element
+            elif isinstance(element.tag, str) and element.text:
+                yield element.text, element
+            if element.tail and element is not self.root:
+                yield element.tail, element.getparent()
+
+    def main_content(self):
+        for element in self.root.iter("main"):
+            return element
+        for element in self.root.iterfind(".//*[@role='main']"):
+            return element
+        articles = list(itertools.islice(self.root.iter("article"), 2))
+        return articles[0] if len(articles) == 1 else None
+
+    @staticmethod
+    def name(element) -> str:
+        return element.tag.lower() if isinstance(element.tag, str) else ""
+
+    @staticmethod
+    def parent(element):
+        return element.getparent()
+
+    @staticmethod
+    def attribute(element, key: str) -> Optional[str]:
+        return element.get(key)
+
+    @staticmethod
+    def names(element) -> list[str]:
+        names = (element.get("class") or "").split()
+        if element.get("id"):
+            names.append(element.get("id"))
+        return names
+
+
+def _parse(html: str):
+    return _LxmlTree(html) if PARSER == "lxml" else _SoupTree(html)
+
+
+class _BoilerplateFilter:
+    """Decides whether an element is, or is inside, boilerplate. Decisions are memoized, so checking every piece of text
+    on a page only looks at each element once."""
+
+    def __init__(self, tree):
+        self.tree = tree
+        # id -> (element, excluded). The element is kept so its id can't be reused by another element.
+        self.excluded: dict[int, tuple[Any, bool]] = {id(tree.root): (tree.root, False)}
+        # The main content, and every element around it, is kept whatever its class says
+        element = tree.main_content()
+        while element is not None:
+            self.excluded[id(element)] = (element, False)
+            element = tree.parent(element)
+
+    def __call__(self, element) -> bool:
+        unknown = []
+        while element is not None and id(element) not in self.excluded:
+            if self._is_boilerplate(element):
+                self.excluded[id(element)] = (element, True)
+                break
+            unknown.append(element)
+            element = self.tree.parent(element)
+
+        result = element is not None and self.excluded[id(element)][1]
+        for element in unknown:
+            self.excluded[id(element)] = (element, result)
+        return result
+
+    def _is_boilerplate(self, element) -> bool:
+        tree = self.tree
+        if tree.name(element) in STRIP_TAGS:
+            return True
+        if tree.attribute(element, "role") in BOILERPLATE_ROLES or tree.attribute(element, "aria-hidden") == "true":
+            return True
+        return any(name.lower().replace("_", "-") in BOILERPLATE_NAMES for name in tree.names(element))
+
+
+def extract_blocks(html: str) -> list[Block]:
+    """Split the readable part of a page into blocks of whitespace-collapsed text, in document order."""
+    tree = _parse(html)
+    is_boilerplate = _BoilerplateFilter(tree)
+
+    blocks: dict[int, tuple[Any, Block]] = {}
+    for text, element in tree.strings():
+        if (text is not LINE_BREAK and not text.strip()) or is_boilerplate(element):
+            continue
+
+        in_link = False
+        cell = None
+        block_element = element
+        while block_element is not None:
+            name = tree.name(block_element)
+            if name == "a":
+                in_link = True
+            elif name in CELL_TAGS and cell is None:
+                cell = block_element
+            if name in BLOCK_TAGS or block_element is tree.root:
+                break
+            block_element = tree.parent(block_element)
+
+        if block_element is None:
+            block_element = tree.root
+
+        entry = blocks.get(id(block_element))
+        if entry is None:
+            entry = blocks[id(block_element)] = (block_element, Block("", tree.name(block_element), len(blocks)))
+        block = entry[1]
+
+        if cell is not None and cell is not block.last_cell:
+            if block.text:
+                block.text += CELL_SEPARATOR
+            block.last_cell = cell
+
+        block.text += text
+        if in_link:
+            block.link_chars += len(text.strip())
+
+    result = []
+    seen = set()
+    for _, block in blocks.values():
+        block.last_cell = None
+        if block.tag == "pre":
+            block.text = "\n".join(line.rstrip() for line in block.text.strip("\n").splitlines())
+        else:
+            block.text = WHITESPACE_RE.sub(" ", block.text).strip()
+
+        if not block.text or block.text in seen:
+            continue
+        if block.tag not in HEADING_TAGS and len(block.text.split()) < MIN_BLOCK_WORDS:
+            continue
+
+        seen.add(block.text)
+        result.append(block)
+
+    return result
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """The start of `text` that fits in `max_tokens`, cut at a word boundary where there is one."""
+    encoding = _token_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text)
+        if len(tokens) <= max_tokens:
+            return text
+        cut = encoding.decode(tokens[:max_tokens])
+    else:
+        if len(text) <= max_tokens * CHARS_PER_TOKEN:
+            return text
+        cut = text[: max_tokens * CHARS_PER_TOKEN]
+    return cut.rsplit(None, 1)[0] if " " in cut.strip() else cut
+
+
+def select_blocks(blocks: list[Block], max_tokens: int) -> list[Block]:
+    """
+    The highest scoring blocks that fit in `max_tokens`, returned in document order. The best block is always kept,
+    cut short if it alone is over the budget, so a page whose text sits in one big block doesn't come back empty.
+    """
+    selected = []
+    remaining = max_tokens
+    for block in sorted(blocks, key=lambda block: block.score, reverse=True):
+        tokens = estimate_tokens(block.text) + 1
+        if tokens <= remaining:
+            selected.append(block)
+            remaining -= tokens
+        elif not selected:
+            text = truncate_to_tokens(block.text, max(remaining - 1, 1))
+            selected.append(replace(block, text=text))
+            remaining -= estimate_tokens(text) + 1
+        if remaining <= 0:
+            break
+
+    return sorted(selected, key=lambda block: block.position)
+
+
+def extract_text(html: str, max_tokens: Optional[int] = DEFAULT_MAX_TOKENS) -> str:
+    """
+    The readable text of an HTML document: scripts, styles, navigation and other boilerplate are removed, whitespace
+    is collapsed, and if the rest doesn't fit in `max_tokens` the most content-like blocks are kept. Returns an empty
+    string if the page has no readable text.
+    """
+    blocks = extract_blocks(html)
+    if max_tokens:
+        blocks = select_blocks(blocks, max_tokens)
+    return "\n".join(block.text for block in blocks)
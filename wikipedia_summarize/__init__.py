@@ -1,3 +1,3 @@
 from .wikipedia import WikipediaPack
 
-_all__ = ["WikipediaPack"]
+__all__ = ["WikipediaPack"]
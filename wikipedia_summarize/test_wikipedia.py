@@ -1,21 +1,22 @@
+from types import SimpleNamespace
 from unittest.mock import patch
 
 import pytest
-from langchain.schema import Document
+from wikipedia import DisambiguationError, PageError
 
 from wikipedia_summarize import WikipediaPack
 
 
+def mock_page(title: str, auto_suggest: bool = True):
+    return SimpleNamespace(title=title, summary="Page content")
+
+
 def test_sync_llm():
     def mock_llm(text_in: str):
         return text_in.strip().split("\n")[-1]
 
     pack = WikipediaPack(llm=mock_llm)
-    with patch("langchain.WikipediaAPIWrapper.load") as mock_load:
-        # Set the return value of the mock object
-        page = Document(page_content="Page content", metadata={"title": "A page"})
-        mock_load.return_value = [page]
-
+    with patch("wikipedia.search", return_value=["A page"]), patch("wikipedia.page", side_effect=mock_page):
         assert pack.run(query="some text", question="asdf") == "Page content"
 
 
@@ -25,9 +26,59 @@ async def test_async_llm():
         return text_in.strip().split("\n")[-1]
 
     pack = WikipediaPack(allm=mock_llm)
-    with patch("langchain.WikipediaAPIWrapper.load") as mock_load:
-        # Set the return value of the mock object
-        page = Document(page_content="Page content", metadata={"title": "A page"})
-        mock_load.return_value = [page]
-
+    with patch("wikipedia.search", return_value=["A page"]), patch("wikipedia.page", side_effect=mock_page):
         assert await pack.arun(query="some text", question="asdf") == "Page content"
+
+
+@pytest.mark.asyncio
+async def test_page_errors_do_not_fail_the_call():
+    async def mock_llm(text_in: str):
+        return text_in
+
+    def page(title: str, auto_suggest: bool = True):
+        if title == "Missing":
+            raise PageError(title)
+        if title == "Mercury":
+            raise DisambiguationError(title, ["Mercury (planet)", "Mercury (element)"])
+        return mock_page(title)
+
+    pack = WikipediaPack(allm=mock_llm)
+    with patch("wikipedia.search", return_value=["Missing", "Mercury", "Venus"]), patch(
+        "wikipedia.page", side_effect=page
+    ):
+        result = await pack.arun(query="planets", question="asdf")
+
+    assert "-- Page: Venus" in result
+    assert "Mercury (planet)" in result
+    assert "Missing" not in result
+
+
+def test_repeat_queries_are_cached():
+    def mock_llm(text_in: str):
+        return text_in
+
+    pack = WikipediaPack(llm=mock_llm)
+    with patch("wikipedia.search", return_value=["Cached page"]) as mock_search, patch(
+        "wikipedia.page", side_effect=mock_page
+    ) as mock_fetch:
+        pack.run(query="cached query", question="first")
+        pack.run(query="  Cached   QUERY ", question="second")
+
+    assert mock_search.call_count == 1
+    assert mock_fetch.call_count == 1
+
+
+def test_cache_is_per_language():
+    def mock_llm(text_in: str):
+        return text_in
+
+    pack = WikipediaPack(llm=mock_llm)
+    with patch("wikipedia.search", return_value=["Language page"]) as mock_search, patch(
+        "wikipedia.page", side_effect=mock_page
+    ) as mock_fetch:
+        pack.run(query="language query")
+        with patch("wikipedia.wikipedia.API_URL", "http://fr.wikipedia.org/w/api.php"):
+            pack.run(query="language query")
+
+    assert mock_search.call_count == 2
+    assert mock_fetch.call_count == 2
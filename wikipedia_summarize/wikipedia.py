@@ -1,9 +1,20 @@
 import asyncio
+import contextvars
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional, Union
+
 import wikipedia
 from autopack import Pack
-from autopack.utils import call_llm, acall_llm
 from pydantic import BaseModel, Field
-from wikipedia import WikipediaPage
+from wikipedia import DisambiguationError, PageError
+
+from caching import CachedCalls, TTLCache, cache_key
+from instrumentation import instrumented, phase
+from llm_cache import cached_acall_llm, cached_call_llm
+from rate_limiting import get_scheduler
+
+logger = logging.getLogger(__name__)
 
 PACK_DESCRIPTION = (
     "Searches Wikipedia based on a query and then analyzes the results. If a question is given, the analysis is based "
@@ -20,6 +31,15 @@ Pages:
 {pages}
 """
 
+SEARCH_RESULTS = 5
+MAX_CONCURRENT_FETCHES = 5
+CACHE_TTL = 60 * 60
+
+# Searches and page fetches go through the blocking `wikipedia` library, so they share one bounded pool of threads
+_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_FETCHES, thread_name_prefix="wikipedia")
+_search_cache = CachedCalls(TTLCache(max_entries=256, ttl=CACHE_TTL), name="wikipedia_search")
+_summary_cache = CachedCalls(TTLCache(max_entries=1024, ttl=CACHE_TTL), name="wikipedia_page")
+
 
 class WikipediaArgs(BaseModel):
     query: str = Field(
@@ -32,26 +52,72 @@ class WikipediaArgs(BaseModel):
     )
 
 
-def fetch_page(page_title: str) -> WikipediaPage:
-    return wikipedia.page(page_title)
+def _submit(func, *args) -> Future:
+    # The caller's context goes with the work, so the instrumentation attributes it to the calling pack
+    return _executor.submit(contextvars.copy_context().run, func, *args)
 
 
-async def get_page(page_title: str) -> WikipediaPage:
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, fetch_page, page_title)
+def _api_url() -> str:
+    # Read at every call, as `wikipedia.set_lang` points the library at another language's API
+    return wikipedia.wikipedia.API_URL
 
 
-async def get_pages(query: str) -> str:
-    page_titles = wikipedia.search(query, results=5)
-    pages = await asyncio.gather(*(get_page(title) for title in page_titles))
+def _api_slot():
+    return get_scheduler().slot(_api_url())
+
+
+def search_titles(query: str) -> list[str]:
+    def search() -> list[str]:
+        with _api_slot(), phase("search"):
+            return wikipedia.search(query, results=SEARCH_RESULTS)
+
+    key = cache_key(_api_url(), " ".join(query.lower().split()))
+    return _search_cache.call(key, search)
+
+
+def fetch_page_summary(page_title: str) -> Optional[str]:
+    """The formatted summary of a page, or None if it doesn't exist. Disambiguation pages list their options instead."""
 
+    def fetch() -> Optional[str]:
+        try:
+            with _api_slot(), phase("fetch"):
+                # The title came from a search, so skip the extra request auto-suggest would make
+                page = wikipedia.page(page_title, auto_suggest=False)
+                return f"-- Page: {page.title}\n{page.summary}"
+        except DisambiguationError as e:
+            return f"-- Page: {page_title}\n{page_title} may refer to: {', '.join(e.options[:10])}"
+        except PageError:
+            return None
+
+    return _summary_cache.call(cache_key(_api_url(), page_title), fetch)
+
+
+def _format_pages(summaries: list[Union[Optional[str], BaseException]]) -> str:
     result = []
-    for page in pages:
-        result.append(f"-- Page: {page.title}\n{page.summary}")
+    for summary in summaries:
+        if isinstance(summary, BaseException):
+            logger.warning(f"Could not fetch Wikipedia page: {summary}")
+        elif summary:
+            result.append(summary)
 
     return "\n".join(result)
 
 
+def fetch_pages(query: str) -> str:
+    futures = [_submit(fetch_page_summary, title) for title in search_titles(query)]
+    return _format_pages([future.exception() or future.result() for future in futures])
+
+
+async def get_page(page_title: str) -> Optional[str]:
+    return await asyncio.wrap_future(_submit(fetch_page_summary, page_title))
+
+
+async def get_pages(query: str) -> str:
+    page_titles = await asyncio.wrap_future(_submit(search_titles, query))
+    summaries = await asyncio.gather(*(get_page(title) for title in page_titles), return_exceptions=True)
+    return _format_pages(summaries)
+
+
 class WikipediaPack(Pack):
     name = "wikipedia"
     description = PACK_DESCRIPTION
@@ -59,18 +125,20 @@ class WikipediaPack(Pack):
     dependencies = ["wikipedia"]
     categories = ["Information"]
 
+    @instrumented
     def _run(
         self,
         query: str,
         question: str = "Provide me with a general summary of the pages below.",
-    ) -> list[str]:
+    ) -> str:
         try:
-            prompt = PROMPT_TEMPLATE.format(question=question, pages=get_pages(query))
-            response = call_llm(prompt, self.llm)
+            prompt = PROMPT_TEMPLATE.format(question=question, pages=fetch_pages(query))
+            response = cached_call_llm(prompt, self.llm)
             return response
         except Exception as e:
             return f"Error: {e}"
 
+    @instrumented
     async def _arun(
         self,
         query: str,
@@ -79,7 +147,7 @@ class WikipediaPack(Pack):
         try:
             pages = await get_pages(query)
             prompt = PROMPT_TEMPLATE.format(question=question, pages=pages)
-            response = await acall_llm(prompt, self.allm)
+            response = await cached_acall_llm(prompt, self.allm)
             return response
         except Exception as e:
             return f"Error: {e}"
@@ -1,8 +1,26 @@
+import asyncio
 import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest.mock import patch
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
 
 from wolframalpha_query import WolframAlphaQuery
 
+RESPONSE = """<?xml version="1.0" encoding="UTF-8"?>
+<queryresult success="true" error="false" numpods="2">
+  <pod title="Input interpretation" id="Input" position="100" numsubpods="1">
+    <subpod title=""><plaintext>{query}</plaintext></subpod>
+  </pod>
+  <pod title="Result" id="Result" position="200" numsubpods="1" primary="true">
+    <subpod title=""><plaintext>331.9 million people</plaintext></subpod>
+  </pod>
+</queryresult>
+"""
+
 
 def test_wolframalpha_no_appid():
     pack = WolframAlphaQuery()
@@ -16,3 +34,68 @@ def test_wolframalpha_with_appid():
     with patch("langchain.WolframAlphaAPIWrapper.run") as mock_load:
         mock_load.return_value = "331.9 million"
         assert "331.9 million" in pack.run(query="population of united states")
+
+
+@pytest.fixture
+def wolfram_server(monkeypatch):
+    queries = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            query = parse_qs(urlsplit(self.path).query)["input"][0]
+            queries.append(query)
+            if query == "slow query":
+                time.sleep(1)
+            body = RESPONSE.format(query=query).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/xml; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            try:
+                self.wfile.write(body)
+            except ConnectionError:
+                pass
+
+        def log_message(self, *args):
+            pass
+
+    monkeypatch.setenv("WOLFRAM_ALPHA_APPID", "1234")
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/v2/query", queries
+    server.shutdown()
+    server.server_close()
+
+
+def test_wolframalpha_answers_are_cached(wolfram_server, monkeypatch):
+    base_url, queries = wolfram_server
+    pack = WolframAlphaQuery(base_url=base_url)
+
+    assert pack.run(query="population of  france") == (
+        "Assumption: population of france \nAnswer: 331.9 million people"
+    )
+    pack.run(query=" population of france ")
+    assert queries == ["population of france"]
+
+    monkeypatch.setenv("WOLFRAM_ALPHA_APPID", "5678")
+    pack.run(query="population of france")
+    assert queries == ["population of france", "population of france"]
+
+
+@pytest.mark.asyncio
+async def test_wolframalpha_async_coalesces_queries(wolfram_server):
+    base_url, queries = wolfram_server
+    pack = WolframAlphaQuery(base_url=base_url)
+
+    answers = await asyncio.gather(*(pack.arun(query="integrate x^2") for _ in range(5)))
+    assert set(answers) == {"Assumption: integrate x^2 \nAnswer: 331.9 million people"}
+    assert queries == ["integrate x^2"]
+
+
+@pytest.mark.asyncio
+async def test_wolframalpha_timeout(wolfram_server):
+    base_url, _ = wolfram_server
+    pack = WolframAlphaQuery(base_url=base_url, timeout=0.2)
+
+    assert pack.run(query="slow query") == "Error: Wolfram Alpha didn't answer within 0.2 seconds"
+    assert await pack.arun(query="slow query") == "Error: Wolfram Alpha didn't answer within 0.2 seconds"
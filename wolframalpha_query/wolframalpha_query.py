@@ -1,8 +1,19 @@
+import asyncio
 import os
+import threading
+from typing import Any
 
+import aiohttp
+import requests
+import wolframalpha
+import xmltodict
 from autopack import Pack
 from langchain import WolframAlphaAPIWrapper
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, root_validator
+
+from caching import CachedCalls, TTLCache, cache_key
+from http_client import get_async_session, get_session
+from instrumentation import instrumented, phase
 
 PACK_DESCRIPTION = (
     "Query Wolfram Alpha, a computational knowledge engine, to obtain answers to a wide range of factual and "
@@ -10,6 +21,15 @@ PACK_DESCRIPTION = (
     "responses. Useful for when you need to answer questions about Math, Science, Technology, and Everyday Life."
 )
 
+DEFAULT_WOLFRAM_ALPHA_URL = wolframalpha.Client.url
+DEFAULT_TIMEOUT = 30.0
+# Math and fact queries repeat a lot, and their answers rarely change within the hour
+CACHE_TTL = 60 * 60
+
+_answers_cache = CachedCalls(TTLCache(max_entries=1024, ttl=CACHE_TTL), name="wolfram_alpha")
+_clients: dict[tuple[str, str, float], "WolframAlphaClient"] = {}
+_clients_lock = threading.Lock()
+
 
 class WolframAlphaArgs(BaseModel):
     query: str = Field(
@@ -18,6 +38,81 @@ class WolframAlphaArgs(BaseModel):
     )
 
 
+class PooledClient(wolframalpha.Client):
+    """The wolframalpha client, sending its queries over the shared, connection pooling sessions instead of opening a
+    new connection (and, for sync queries, a new event loop) for each one."""
+
+    def _params(self, input: str, params, kwargs: dict) -> list[tuple[str, str]]:
+        return [*params, ("appid", self.app_id), ("input", input), *kwargs.items()]
+
+    @staticmethod
+    def _parse(content: bytes):
+        doc = xmltodict.parse(content, postprocessor=wolframalpha.Document.make)
+        if "error" in doc:
+            error = doc["error"]
+            raise ValueError(f"Error {error['@status']}: {error['@message']}")
+        return doc["queryresult"]
+
+    def query(self, input: str, params=(), **kwargs):
+        response = get_session().get(self.url, params=self._params(input, params, kwargs), timeout=self.timeout)
+        response.raise_for_status()
+        return self._parse(response.content)
+
+    async def aquery(self, input: str, params=(), **kwargs):
+        async with get_async_session().get(
+            self.url,
+            params=self._params(input, params, kwargs),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            raise_for_status=True,
+        ) as response:
+            return self._parse(await response.read())
+
+
+class WolframAlphaClient(WolframAlphaAPIWrapper):
+    """langchain's Wolfram|Alpha wrapper, querying `base_url` through a PooledClient, with an async `arun`."""
+
+    base_url: str = DEFAULT_WOLFRAM_ALPHA_URL
+    timeout: float = DEFAULT_TIMEOUT
+
+    @root_validator()
+    def use_pooled_client(cls, values: dict) -> dict:
+        values["wolfram_client"] = PooledClient(
+            values["wolfram_alpha_appid"], url=values["base_url"], timeout=values["timeout"]
+        )
+        return values
+
+    async def arun(self, query: str) -> str:
+        return format_answer(await self.wolfram_client.aquery(query))
+
+
+def format_answer(result: Any) -> str:
+    """Formats a query result the same way langchain's WolframAlphaAPIWrapper.run does."""
+    try:
+        assumption = next(result.pods).text
+        answer = next(result.results).text
+    except StopIteration:
+        return "Wolfram Alpha wasn't able to answer it"
+
+    if not answer:
+        return "No good Wolfram Alpha Result was found"
+    return f"Assumption: {assumption} \nAnswer: {answer}"
+
+
+def get_client(base_url: str = DEFAULT_WOLFRAM_ALPHA_URL, timeout: float = DEFAULT_TIMEOUT) -> WolframAlphaClient:
+    """The client for `base_url` and the current WOLFRAM_ALPHA_APPID, created once and then reused."""
+    key = (os.environ.get("WOLFRAM_ALPHA_APPID", ""), base_url, timeout)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = WolframAlphaClient(base_url=base_url, timeout=timeout)
+        return client
+
+
+def normalize_query(query: str) -> str:
+    # Only whitespace: case matters to Wolfram|Alpha, e.g. for units and constants
+    return " ".join(query.split())
+
+
 class WolframAlphaQuery(Pack):
     name = "wolfram_alpha_query"
     description = PACK_DESCRIPTION
@@ -25,11 +120,48 @@ class WolframAlphaQuery(Pack):
     dependencies = ["wolframalpha_query"]
     categories = ["Information"]
 
-    def _run(self, query: str) -> list[str]:
+    base_url: str = Field(
+        default_factory=lambda: os.environ.get("WOLFRAM_ALPHA_API_URL", DEFAULT_WOLFRAM_ALPHA_URL),
+        description="The Wolfram|Alpha query API to send queries to, e.g. a local fake in tests",
+    )
+    timeout: float = Field(default=DEFAULT_TIMEOUT, description="Seconds to wait for Wolfram|Alpha to answer a query")
+
+    def _cache_key(self, query: str) -> str:
+        # Per app id, as answers depend on what it's allowed to ask, and an invalid one mustn't get cached answers.
+        # cache_key hashes it along with the rest, so it isn't kept in the clear
+        return cache_key(os.environ.get("WOLFRAM_ALPHA_APPID", ""), self.base_url, normalize_query(query))
+
+    def _timeout_message(self) -> str:
+        return f"Error: Wolfram Alpha didn't answer within {self.timeout:g} seconds"
+
+    @instrumented
+    def _run(self, query: str) -> str:
+        if not os.environ.get("WOLFRAM_ALPHA_APPID"):
+            return f"WolframAlpha is not supported as the WOLFRAM_ALPHA_APPID environment variable is not set"
+
+        def fetch() -> str:
+            with phase("fetch"):
+                return get_client(self.base_url, self.timeout).run(normalize_query(query))
+
+        try:
+            return _answers_cache.call(self._cache_key(query), fetch)
+        except requests.Timeout:
+            return self._timeout_message()
+        except Exception as e:
+            return f"Error: {e}"
+
+    @instrumented
+    async def _arun(self, query: str) -> str:
         if not os.environ.get("WOLFRAM_ALPHA_APPID"):
             return f"WolframAlpha is not supported as the WOLFRAM_ALPHA_APPID environment variable is not set"
 
-        return WolframAlphaAPIWrapper().run(query)
+        async def fetch() -> str:
+            with phase("fetch"):
+                return await get_client(self.base_url, self.timeout).arun(normalize_query(query))
 
-    async def _arun(self, query: str) -> list[str]:
-        return self._run(query)
+        try:
+            return await _answers_cache.acall(self._cache_key(query), fetch)
+        except asyncio.TimeoutError:
+            return self._timeout_message()
+        except Exception as e:
+            return f"Error: {e}"
@@ -1,4 +1,9 @@
 import os
+from unittest.mock import patch
+
+import pytest
+from autopack.filesystem_emulation.ram_file_manager import RAMFileManager
+from autopack.pack_config import PackConfig
 
 from write_python_code.write_python_file import WritePythonCode
 
@@ -24,3 +29,80 @@ def test_write_python_file_compile_error():
     assert "invalid syntax" in result
 
     assert not os.path.exists(os.path.join("workspace", file_name))
+
+
+def test_write_python_file_error_location():
+    pack = WritePythonCode(workspace_path="workspace")
+    result = pack.run(file_name="indent.py", code="def f():\n    x = 1\n      y = 2\n")
+
+    assert "indent.py, line 3" in result
+    assert "IndentationError" in result
+    assert not os.path.exists(os.path.join("workspace", "indent.py"))
+
+
+def test_write_python_file_does_not_spawn_interpreter():
+    pack = WritePythonCode(workspace_path="workspace")
+    with patch("subprocess.run") as mock_run, patch("subprocess.Popen") as mock_popen:
+        result = pack.run(file_name="hello_world.py", code="print('Hello world!')")
+        mock_run.assert_not_called()
+        mock_popen.assert_not_called()
+
+    assert result == "Compiled successfully and saved to hello_world.py."
+
+
+def test_write_python_file_overwrite_leaves_no_temporary_files():
+    pack = WritePythonCode(workspace_path="workspace")
+    pack.run(file_name="module.py", code="x = 1")
+    pack.run(file_name="module.py", code="x = 2")
+
+    assert os.listdir("workspace") == ["module.py"]
+    with open(os.path.join("workspace", "module.py"), "r") as f:
+        assert f.read() == "x = 2"
+
+
+def test_write_python_file_outside_workspace():
+    pack = WritePythonCode(workspace_path="workspace")
+    result = pack.run(file_name="../escape.py", code="x = 1")
+
+    assert result.startswith("Error:")
+    assert not os.path.exists("escape.py")
+
+
+def test_write_python_files_batch():
+    pack = WritePythonCode(workspace_path="workspace")
+    result = pack.run(files={"a.py": "import b", "pkg/b.py": "x = 1"})
+
+    assert result == "Compiled successfully and saved to a.py, pkg/b.py."
+    with open(os.path.join("workspace", "pkg", "b.py"), "r") as f:
+        assert f.read() == "x = 1"
+
+
+def test_write_python_files_batch_all_or_nothing():
+    pack = WritePythonCode(workspace_path="workspace")
+    result = pack.run(files={"good.py": "x = 1", "bad.py": "x = = 1", "worse.py": "return 1"})
+
+    assert "bad.py, line 1" in result
+    assert "worse.py, line 1" in result
+    assert "None of the files were saved" in result
+    assert os.listdir("workspace") == []
+
+
+@pytest.mark.asyncio
+async def test_awrite_python_file():
+    pack = WritePythonCode(workspace_path="workspace")
+    assert await pack.arun(file_name="hello.py", code="print('hi')") == "Compiled successfully and saved to hello.py."
+    assert "invalid syntax" in await pack.arun(file_name="error.py", code="asdf!")
+    assert os.listdir("workspace") == ["hello.py"]
+
+
+@pytest.mark.asyncio
+async def test_write_python_file_through_filesystem_manager():
+    config = PackConfig()
+    config.init_filesystem_manager(RAMFileManager)
+    pack = WritePythonCode(config=config)
+
+    assert pack.run(file_name="a.py", code="a = 1") == "Compiled successfully and saved to a.py."
+    assert await pack.arun(file_name="b.py", code="b = 2") == "Compiled successfully and saved to b.py."
+    assert "invalid syntax" in await pack.arun(file_name="c.py", code="asdf!")
+    assert config.filesystem_manager.files == {"a.py": "a = 1", "b.py": "b = 2"}
+    assert not os.path.exists(os.path.join("workspace", "a.py"))
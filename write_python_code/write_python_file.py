@@ -1,10 +1,13 @@
-import os
-import subprocess
+from dataclasses import dataclass
+from typing import Optional
 
 from autopack import Pack
+from autopack.filesystem_emulation.workspace_file_manager import WorkspaceFileManager
 from pydantic import BaseModel, Field
 
-from filesystem_utils import restrict_path
+from async_execution import run_blocking
+from filesystem_utils import atomic_write, workspace_paths
+from instrumentation import count, instrumented, phase
 
 # IMPORTANT NOTE: This does NOT actually restrict the execution environment, it just nudges the AI to avoid doing
 # those things.
@@ -16,15 +19,60 @@ PACK_DESCRIPTION = (
 )
 
 
+@dataclass
+class SyntaxIssue:
+    file_name: str
+    message: str
+    error_type: str = "SyntaxError"
+    line: Optional[int] = None
+    column: Optional[int] = None
+    text: Optional[str] = None
+
+    def __str__(self) -> str:
+        location = self.file_name
+        if self.line:
+            location += f", line {self.line}"
+            if self.column:
+                location += f", column {self.column}"
+
+        description = f"{location}: {self.error_type}: {self.message}"
+        if self.text:
+            description += f"\n    {self.text.lstrip()}"
+            if self.column:
+                indent = len(self.text) - len(self.text.lstrip())
+                description += "\n    " + " " * (self.column - 1 - indent) + "^"
+        return description
+
+
+def check_syntax(code: str, file_name: str = "<string>") -> Optional[SyntaxIssue]:
+    """Compile `code` without running it, returning the first syntax error found or None if it compiles."""
+    try:
+        compile(code, file_name, "exec", dont_inherit=True)
+    except SyntaxError as e:
+        text = (e.text or "").rstrip() or None
+        # Offsets are 1-based, and a few errors point just past the end of the line
+        column = min(e.offset, len(text) + 1) if e.offset and text else e.offset
+        return SyntaxIssue(file_name, e.msg, e.__class__.__name__, e.lineno, column, text)
+    except ValueError as e:
+        # Raised instead of a SyntaxError for null bytes by older Pythons
+        return SyntaxIssue(file_name, str(e), e.__class__.__name__)
+    return None
+
+
 class WritePythonCodeArgs(BaseModel):
     file_name: str = Field(
-        ...,
+        default="",
         description="The name of the file to be created or overwritten",
     )
     code: str = Field(
-        ...,
+        default="",
         description="The Python code as a string.",
     )
+    files: dict[str, str] = Field(
+        default_factory=dict,
+        description="To write several files in one call, a mapping of file name to Python code, instead of file_name "
+        "and code. No file is saved unless all of them compile.",
+    )
 
 
 class WritePythonCode(Pack):
@@ -35,42 +83,95 @@ class WritePythonCode(Pack):
     reversible = False
 
     def check_file(self, file_name, code: str = "") -> str:
-        file_path = os.path.join(self.config.workspace_path, file_name)
+        return self.write_files({file_name: code})
+
+    def _workspace(self) -> Optional[str]:
+        """The workspace directory, or None if the files aren't in a workspace on the local disk, in which case they
+        are saved through the filesystem manager."""
+        if isinstance(self.filesystem_manager, WorkspaceFileManager):
+            return str(self.filesystem_manager.workspace_dir)
+        return None
+
+    @staticmethod
+    def _compile_errors(files: dict[str, str]) -> Optional[str]:
+        """The syntax errors of every file that doesn't compile, or None if they all do."""
+        with phase("compile"):
+            issues = [issue for file_name, code in files.items() if (issue := check_syntax(code, file_name))]
+        if not issues:
+            return None
+        errors = "\n".join(str(issue) for issue in issues)
+        if len(files) > 1:
+            return f"Compile error: {errors}\nNone of the files were saved."
+        return f"Compile error: {errors}."
+
+    def write_files(self, files: dict[str, str]) -> str:
+        """Check the syntax of every file, and only if they all compile save each of them. Files in the workspace are
+        each written once, atomically, so a reader never sees a partially written file."""
+        workspace = self._workspace()
+        if workspace is None:
+            errors = self._compile_errors(files)
+            if errors:
+                return errors
+            with phase("write"):
+                for file_name, code in files.items():
+                    self.filesystem_manager.write_file(file_name, code)
+            return saved_message(files)
+
+        resolver = workspace_paths(workspace)
+        paths = {}
+        for file_name in files:
+            paths[file_name] = resolver.resolve(file_name, fresh=True)
+            if not paths[file_name]:
+                return f"Error: File not found '{file_name}'"
+
+        errors = self._compile_errors(files)
+        if errors:
+            return errors
 
         try:
-            abs_path = restrict_path(file_path, self.config.workspace_path)
-            if not abs_path:
-                return "Error: File not found"
-
-            with open(file_path, "w+") as f:
-                f.write(code)
-
-            cmd = ["python", "-m", "py_compile", abs_path]
-            process = subprocess.run(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                universal_newlines=True,
-                cwd=self.config.workspace_path,
-            )
-            output = "\n".join([process.stdout.strip(), process.stderr.strip()]).strip()
-
-            if process.returncode:
-                os.unlink(file_path)
-                return f"Compile error: {output}."
-
-            return f"Compiled successfully and saved to {file_name}."
-
-        except Exception as e:
-            os.unlink(file_path)
+            with phase("write"):
+                for file_name, code in files.items():
+                    atomic_write(paths[file_name], code)
+                    count("bytes_written", len(code.encode("utf-8")))
+        except OSError as e:
             return f"Error: {e.__class__.__name__} {e}"
 
-    def _run(self, file_name: str, code: str = "") -> str:
-        result = self.check_file(file_name, code)
-        self.filesystem_manager.write_file(file_name, code)
-        return result
-
-    async def _arun(self, file_name: str, code: str = "") -> str:
-        result = self.check_file(file_name, code)
-        await self.filesystem_manager.awrite_file(file_name, code)
-        return result
+        return saved_message(files)
+
+    async def awrite_files(self, files: dict[str, str]) -> str:
+        # Compiling a large file is CPU bound
+        if self._workspace() is not None:
+            return await run_blocking(self.write_files, files)
+
+        errors = await run_blocking(self._compile_errors, files)
+        if errors:
+            return errors
+        with phase("write"):
+            for file_name, code in files.items():
+                await self.filesystem_manager.awrite_file(file_name, code)
+        return saved_message(files)
+
+    @staticmethod
+    def _files(file_name: str, code: str, files: Optional[dict[str, str]]) -> dict[str, str]:
+        files = dict(files or {})
+        if file_name:
+            files[file_name] = code
+        return files
+
+    @instrumented
+    def _run(self, file_name: str = "", code: str = "", files: Optional[dict[str, str]] = None) -> str:
+        files = self._files(file_name, code, files)
+        if not files:
+            return "Error: No file_name or files given"
+        return self.write_files(files)
+
+    @instrumented
+    async def _arun(self, file_name: str = "", code: str = "", files: Optional[dict[str, str]] = None) -> str:
+        files = self._files(file_name, code, files)
+        if not files:
+            return "Error: No file_name or files given"
+        return await self.awrite_files(files)
+
+
+def saved_message(files: dict[str, str]) -> str:
+    return f"Compiled successfully and saved to {', '.join(files)}."